@@ -0,0 +1,32 @@
+"""crash_hash_chain
+
+Revision ID: 3f2a9c1d7e44
+Revises: 17b395f7e51a
+Create Date: 2026-10-18 10:12:31.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f2a9c1d7e44'
+down_revision: Union[str, Sequence[str], None] = '17b395f7e51a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('crash_game_results', sa.Column('round_hash', sa.String(length=64), nullable=True))
+    op.add_column('crash_game_results', sa.Column('chain_index', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_crash_game_results_chain_index'), 'crash_game_results', ['chain_index'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_crash_game_results_chain_index'), table_name='crash_game_results')
+    op.drop_column('crash_game_results', 'chain_index')
+    op.drop_column('crash_game_results', 'round_hash')
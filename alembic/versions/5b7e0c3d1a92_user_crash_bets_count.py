@@ -0,0 +1,33 @@
+"""user_crash_bets_count
+
+Revision ID: 5b7e0c3d1a92
+Revises: 8d41b6a2c9f0
+Create Date: 2026-10-18 12:21:07.553914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e0c3d1a92'
+down_revision: Union[str, Sequence[str], None] = '8d41b6a2c9f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('crash_bets_count', sa.Integer(), server_default='0', nullable=False))
+    # Продолжаем нумерацию с последнего номера ставки каждого пользователя
+    op.execute(
+        "UPDATE users SET crash_bets_count = COALESCE("
+        "(SELECT MAX(bet_number) FROM crash_bet_history WHERE crash_bet_history.user_id = users.id), 0)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'crash_bets_count')
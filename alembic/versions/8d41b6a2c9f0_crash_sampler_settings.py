@@ -0,0 +1,30 @@
+"""crash_sampler_settings
+
+Revision ID: 8d41b6a2c9f0
+Revises: 3f2a9c1d7e44
+Create Date: 2026-10-18 11:04:52.118530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41b6a2c9f0'
+down_revision: Union[str, Sequence[str], None] = '3f2a9c1d7e44'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('game_settings', sa.Column('crash_distribution', sa.String(), nullable=True, server_default='inverse'))
+    op.add_column('crash_game_results', sa.Column('sampler', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('crash_game_results', 'sampler')
+    op.drop_column('game_settings', 'crash_distribution')
@@ -0,0 +1,28 @@
+"""crash_payout_limit
+
+Revision ID: 9b14d6e2a0c7
+Revises: e7a3c5d91f28
+Create Date: 2026-10-18 18:05:37.214906
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b14d6e2a0c7'
+down_revision: Union[str, Sequence[str], None] = 'e7a3c5d91f28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('crash_game_results', sa.Column('payout_limit', sa.Numeric(10, 2), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('crash_game_results', 'payout_limit')
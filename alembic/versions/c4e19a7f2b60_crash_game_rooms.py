@@ -0,0 +1,30 @@
+"""crash_game_rooms
+
+Revision ID: c4e19a7f2b60
+Revises: 5b7e0c3d1a92
+Create Date: 2026-10-18 13:02:41.118230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e19a7f2b60'
+down_revision: Union[str, Sequence[str], None] = '5b7e0c3d1a92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('crash_game_results', sa.Column('room', sa.String(), nullable=True))
+    op.create_index(op.f('ix_crash_game_results_room'), 'crash_game_results', ['room'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_crash_game_results_room'), table_name='crash_game_results')
+    op.drop_column('crash_game_results', 'room')
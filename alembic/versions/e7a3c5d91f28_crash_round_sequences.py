@@ -0,0 +1,39 @@
+"""crash_round_sequences
+
+Revision ID: e7a3c5d91f28
+Revises: c4e19a7f2b60
+Create Date: 2026-10-18 16:40:12.503817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a3c5d91f28'
+down_revision: Union[str, Sequence[str], None] = 'c4e19a7f2b60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE SEQUENCE IF NOT EXISTS crash_game_id_seq START WITH 1")
+    op.execute("CREATE SEQUENCE IF NOT EXISTS crash_chain_index_seq MINVALUE 0 START WITH 0")
+    # Продолжаем после уже сохраненных раундов
+    op.execute(
+        "SELECT setval('crash_game_id_seq', "
+        "COALESCE((SELECT MAX(game_id) FROM crash_game_results) + 1, 1), false)"
+    )
+    op.execute(
+        "SELECT setval('crash_chain_index_seq', "
+        "COALESCE((SELECT MAX(chain_index) FROM crash_game_results) + 1, 0), false)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP SEQUENCE IF EXISTS crash_chain_index_seq")
+    op.execute("DROP SEQUENCE IF EXISTS crash_game_id_seq")
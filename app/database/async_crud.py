@@ -0,0 +1,316 @@
+from collections import Counter
+from sqlalchemy import select, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.models import User, CrashBetHistory, CrashGameResult, crash_game_id_seq, crash_chain_index_seq
+from app.database.crud import (
+    crash_bet_results_statements,
+    balance_delta_statement,
+    balance_set_statement,
+    balance_deltas_statements,
+    next_bet_number_statement,
+    bet_counters_statements,
+    balance_column
+)
+from typing import Optional, List
+
+# Асинхронные версии горячих функций из crud.py (работают через AsyncSessionLocal)
+
+
+async def get_user_by_telegram_id(db: AsyncSession, telegram_id: int) -> Optional[User]:
+    result = await db.execute(select(User).where(User.telegram_id == telegram_id))
+    return result.scalars().first()
+
+
+async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
+    """Получаем пользователя по ID"""
+    result = await db.execute(select(User).where(User.id == user_id))
+    return result.scalars().first()
+
+
+async def update_user_balance(
+    db: AsyncSession,
+    telegram_id: int,
+    currency: str,
+    amount: float,
+    non_negative: bool = False
+):
+    """Обновляем баланс пользователя одним UPDATE ... RETURNING (см. crud.update_user_balance)"""
+    result = await db.execute(balance_delta_statement(telegram_id, currency, amount, non_negative))
+    row = result.first()
+    await db.commit()
+    return row
+
+
+async def set_user_balance(db: AsyncSession, telegram_id: int, currency: str, amount: float):
+    """Устанавливаем баланс пользователя одним UPDATE ... RETURNING"""
+    result = await db.execute(balance_set_statement(telegram_id, currency, amount))
+    row = result.first()
+    await db.commit()
+    return row
+
+
+async def update_user_balances(db: AsyncSession, currency: str, deltas: dict, non_negative: bool = False) -> list:
+    """Применяем пачку изменений баланса telegram_id -> сумма; возвращаем обновленные строки"""
+    rows = []
+    for statement in balance_deltas_statements(currency, deltas, non_negative=non_negative):
+        result = await db.execute(statement)
+        rows.extend(result.all())
+    await db.commit()
+    return rows
+
+
+async def get_user_balance(db: AsyncSession, telegram_id: int) -> dict:
+    """Получаем балансы пользователя"""
+    user = await get_user_by_telegram_id(db, telegram_id)
+    if not user:
+        return {'ton': 0.0, 'stars': 0.0}
+
+    return {'ton': user.ton_balance, 'stars': user.stars_balance}
+
+
+async def add_crash_bet(
+    db: AsyncSession,
+    user_id: int,
+    telegram_id: int,
+    bet_amount: float,
+    crash_coefficient: Optional[float] = None,
+    win_amount: float = 0.0,
+    status: str = 'pending'
+) -> CrashBetHistory:
+    """Добавляем запись о ставке в crash игру"""
+    result = await db.execute(next_bet_number_statement(user_id))
+    next_bet_number = result.scalar()
+    if next_bet_number is None:
+        raise ValueError("User not found")
+
+    bet = CrashBetHistory(
+        user_id=user_id,
+        telegram_id=telegram_id,
+        bet_number=next_bet_number,
+        bet_amount=bet_amount,
+        crash_coefficient=crash_coefficient,
+        win_amount=win_amount,
+        status=status
+    )
+
+    db.add(bet)
+    await db.commit()
+    await db.refresh(bet)
+    return bet
+
+
+async def add_crash_bets(db: AsyncSession, bets: List[tuple]) -> List[Optional[int]]:
+    """Пачка ставок (user_id, telegram_id, bet_amount) одной транзакцией
+
+    Возвращает id ставок в том же порядке (None, если пользователя нет).
+    """
+    counts = Counter(user_id for user_id, _, _ in bets)
+    last_numbers = {}
+    for statement in bet_counters_statements(counts):
+        result = await db.execute(statement)
+        last_numbers.update(result.tuples().all())
+
+    # Номера ставок пользователя внутри пачки идут по порядку поступления
+    next_numbers = {user_id: last - counts[user_id] + 1 for user_id, last in last_numbers.items()}
+    rows = []
+    for user_id, telegram_id, bet_amount in bets:
+        if user_id not in next_numbers:
+            continue
+        rows.append({
+            "user_id": user_id,
+            "telegram_id": telegram_id,
+            "bet_number": next_numbers[user_id],
+            "bet_amount": bet_amount,
+            "win_amount": 0.0,
+            "status": "pending"
+        })
+        next_numbers[user_id] += 1
+
+    ids = []
+    if rows:
+        result = await db.execute(
+            insert(CrashBetHistory).returning(CrashBetHistory.id, sort_by_parameter_order=True),
+            rows
+        )
+        ids = list(result.scalars().all())
+    await db.commit()
+
+    inserted = iter(ids)
+    return [next(inserted) if user_id in last_numbers else None for user_id, _, _ in bets]
+
+
+async def get_users_balances(db: AsyncSession, user_ids: List[int], currency: str = 'stars') -> dict:
+    """user_id -> (telegram_id, баланс в валюте) одним запросом"""
+    if not user_ids:
+        return {}
+    result = await db.execute(
+        select(User.id, User.telegram_id, balance_column(currency)).where(User.id.in_(user_ids))
+    )
+    return {user_id: (telegram_id, balance or 0.0) for user_id, telegram_id, balance in result}
+
+
+def crash_game_result(
+    game_id: int,
+    multiplier: float,
+    crashed_at: float,
+    total_players: int,
+    total_bet: float,
+    total_payout: float,
+    round_hash: Optional[str] = None,
+    chain_index: Optional[int] = None,
+    sampler: Optional[str] = None,
+    room_id: Optional[str] = None,
+    payout_limit: Optional[float] = None
+) -> CrashGameResult:
+    """Строка crash_game_results раунда (общая для settle_crash_round и симуляции)"""
+    return CrashGameResult(
+        game_id=game_id,
+        multiplier=multiplier,
+        crashed_at=crashed_at,
+        total_players=total_players,
+        total_bet=total_bet,
+        total_payout=total_payout,
+        round_hash=round_hash,
+        chain_index=chain_index,
+        sampler=sampler,
+        room=room_id,
+        payout_limit=payout_limit
+    )
+
+
+async def settle_crash_round(
+    db: AsyncSession,
+    game_id: int,
+    multiplier: float,
+    total_players: int,
+    total_bet: float,
+    total_payout: float,
+    bet_results: List[tuple],
+    credits: dict,
+    round_hash: Optional[str] = None,
+    chain_index: Optional[int] = None,
+    sampler: Optional[str] = None,
+    crashed_at: Optional[float] = None,
+    room_id: Optional[str] = None,
+    currency: str = 'stars',
+    payout_limit: Optional[float] = None
+) -> CrashGameResult:
+    """Сохраняем результат раунда, итоги ставок и выигрыши одной транзакцией
+
+    multiplier - точка краха из распределения (проверяемая по хешу), crashed_at -
+    множитель краха, записываемый в ставки; payout_limit - множитель, на котором
+    лимит выплат вывел невыведенные ставки (None - лимит не сработал).
+    """
+    if crashed_at is None:
+        crashed_at = multiplier
+    try:
+        db_result = crash_game_result(
+            game_id, multiplier, crashed_at, total_players, total_bet, total_payout,
+            round_hash=round_hash, chain_index=chain_index, sampler=sampler, room_id=room_id,
+            payout_limit=payout_limit
+        )
+        db.add(db_result)
+        for statement in crash_bet_results_statements(crashed_at, bet_results):
+            await db.execute(statement)
+        # Выигрыши - в валюте комнаты
+        for statement in balance_deltas_statements(currency, credits, key_column=User.id, returning=False):
+            await db.execute(statement)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    return db_result
+
+
+async def close_interrupted_crash_bets(db: AsyncSession, bet_results: List[tuple], credits: dict,
+                                      currency: str = 'stars'):
+    """Ставки недоигранного раунда и возвраты одной транзакцией; строка раунда не пишется"""
+    try:
+        for statement in crash_bet_results_statements(None, bet_results):
+            await db.execute(statement)
+        for statement in balance_deltas_statements(currency, credits, key_column=User.id, returning=False):
+            await db.execute(statement)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+
+async def reserve_crash_game_id(db: AsyncSession) -> int:
+    """Номер нового раунда (во всех комнатах); выданный номер не повторится"""
+    result = await db.execute(select(crash_game_id_seq.next_value()))
+    return result.scalar_one()
+
+
+async def reserve_chain_index(db: AsyncSession) -> int:
+    """Звено цепочки хешей для нового раунда; выданное звено не повторится"""
+    result = await db.execute(select(crash_chain_index_seq.next_value()))
+    return result.scalar_one()
+
+
+async def sync_crash_round_sequences(db: AsyncSession):
+    """Последовательности раундов не ниже уже сохраненных (раунды до миграции, create_all на старой БД)"""
+    for sequence, column, first in (
+        ("crash_game_id_seq", "game_id", 1),
+        ("crash_chain_index_seq", "chain_index", 0),
+    ):
+        await db.execute(text(
+            f"SELECT setval('{sequence}', GREATEST("
+            f"COALESCE((SELECT MAX({column}) FROM crash_game_results) + 1, {first}), "
+            f"(SELECT CASE WHEN is_called THEN last_value + 1 ELSE last_value END FROM {sequence})"
+            f"), false)"
+        ))
+    await db.commit()
+
+
+async def get_crash_game_by_game_id(db: AsyncSession, game_id: int) -> Optional[CrashGameResult]:
+    """Последний сохраненный раунд с данным game_id"""
+    result = await db.execute(
+        select(CrashGameResult)
+        .where(CrashGameResult.game_id == game_id)
+        .order_by(CrashGameResult.timestamp.desc())
+        .limit(1)
+    )
+    return result.scalars().first()
+
+
+async def get_crash_game_by_chain_index(db: AsyncSession, chain_index: int) -> Optional[CrashGameResult]:
+    """Раунд, использовавший звено цепочки chain_index"""
+    result = await db.execute(
+        select(CrashGameResult).where(CrashGameResult.chain_index == chain_index).limit(1)
+    )
+    return result.scalars().first()
+
+
+async def get_user_crash_bet_history(db: AsyncSession, user_id: int, limit: int = 50) -> List[CrashBetHistory]:
+    """Получаем историю ставок пользователя"""
+    result = await db.execute(
+        select(CrashBetHistory)
+        .where(CrashBetHistory.user_id == user_id)
+        .order_by(CrashBetHistory.created_at.desc())
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def get_all_crash_bet_history(db: AsyncSession, limit: int = 100) -> List[CrashBetHistory]:
+    """Получаем всю историю ставок"""
+    result = await db.execute(
+        select(CrashBetHistory)
+        .order_by(CrashBetHistory.created_at.desc())
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def get_crash_game_history(db: AsyncSession, limit: int = 50, room: Optional[str] = None) -> List[CrashGameResult]:
+    """Получаем историю краш-игр (room - только раунды этой комнаты)"""
+    query = select(CrashGameResult)
+    if room is not None:
+        query = query.where(CrashGameResult.room == room)
+    result = await db.execute(
+        query
+        .order_by(CrashGameResult.timestamp.desc())
+        .limit(limit)
+    )
+    return list(result.scalars().all())
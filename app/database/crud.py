@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, update, values, column, cast, literal, Integer, Float, String, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from app.database import models
 from app.database.models import User, DepositHistory, CrashBetHistory, Wallet, Transaction, CrashGameResult, AdminUser
 from typing import Optional
@@ -96,25 +97,112 @@ def update_referrer_stats(db: Session, referrer_id: int):
         ).count()
         db.commit()
 
+def balance_column(currency: str):
+    """Колонка баланса по валюте"""
+    if currency == 'ton':
+        return User.ton_balance
+    if currency == 'stars':
+        return User.stars_balance
+    raise ValueError(f"Unknown currency: {currency}")
+
+
+def _returning_balances(statement):
+    return statement.returning(
+        User.id, User.telegram_id, User.ton_balance, User.stars_balance
+    ).execution_options(synchronize_session=False)
+
+
+def balance_delta_statement(telegram_id: int, currency: str, amount: float, non_negative: bool = False):
+    """UPDATE users SET <валюта>_balance = <валюта>_balance + :amount ... RETURNING балансы
+
+    non_negative - списание проходит, только если баланс не уходит в минус.
+    """
+    balance = balance_column(currency)
+    statement = update(User).where(User.telegram_id == telegram_id)
+    if non_negative:
+        statement = statement.where(balance + amount >= 0)
+    return _returning_balances(statement.values({balance: balance + amount}))
+
+
+def balance_set_statement(telegram_id: int, currency: str, amount: float):
+    """UPDATE users SET <валюта>_balance = :amount ... RETURNING балансы"""
+    balance = balance_column(currency)
+    return _returning_balances(
+        update(User).where(User.telegram_id == telegram_id).values({balance: amount})
+    )
+
+
+def balance_deltas_statements(
+    currency: str,
+    deltas: dict,
+    key_column=User.telegram_id,
+    non_negative: bool = False,
+    returning: bool = True
+):
+    """UPDATE ... FROM (VALUES ...) для пачки изменений баланса: ключ -> сумма"""
+    balance = balance_column(currency)
+    rows = [(key, amount) for key, amount in deltas.items() if amount]
+    for chunk in _chunks(rows):
+        table = values(
+            column("key", key_column.type),
+            column("amount", Float),
+            name="balance_deltas"
+        ).data(chunk)
+        statement = update(User).where(key_column == table.c.key)
+        if non_negative:
+            statement = statement.where(balance + table.c.amount >= 0)
+        statement = statement.values({balance: balance + table.c.amount})
+        if returning:
+            yield _returning_balances(statement)
+        else:
+            yield statement.execution_options(synchronize_session=False)
+
+
+def stars_payment_statement(telegram_id: int, amount: float, payment_id):
+    """Зачисление платежа Stars и запись его ID одним UPDATE; повторный payment_id ничего не меняет"""
+    paid = func.coalesce(cast(User.stars_payment_ids, JSONB), literal([], JSONB))
+    payment = literal([payment_id], JSONB)
+    return _returning_balances(
+        update(User)
+        .where(User.telegram_id == telegram_id, ~paid.contains(payment))
+        .values(
+            stars_balance=User.stars_balance + amount,
+            stars_payment_ids=cast(paid.op('||')(payment), JSON)
+        )
+    )
+
+
 def update_user_balance(
     db: Session, 
     telegram_id: int, 
     currency: str, 
-    amount: float
-) -> Optional[User]:
-    """Обновляем баланс пользователя"""
-    user = get_user_by_telegram_id(db, telegram_id)
-    if not user:
-        return None
-    
-    if currency == 'ton':
-        user.ton_balance += amount
-    elif currency == 'stars':
-        user.stars_balance += amount
-    
+    amount: float,
+    non_negative: bool = False
+):
+    """Обновляем баланс пользователя одним UPDATE ... RETURNING
+
+    Возвращает строку (id, telegram_id, ton_balance, stars_balance) или None,
+    если пользователя нет или (при non_negative) не хватает средств.
+    """
+    row = db.execute(balance_delta_statement(telegram_id, currency, amount, non_negative)).first()
     db.commit()
-    db.refresh(user)
-    return user
+    return row
+
+
+def update_user_balances(db: Session, currency: str, deltas: dict, non_negative: bool = False) -> list:
+    """Применяем пачку изменений баланса telegram_id -> сумма; возвращаем обновленные строки"""
+    rows = []
+    for statement in balance_deltas_statements(currency, deltas, non_negative=non_negative):
+        rows.extend(db.execute(statement).all())
+    db.commit()
+    return rows
+
+
+def credit_stars_payment(db: Session, telegram_id: int, amount: float, payment_id):
+    """Зачисляем платеж Stars; None - пользователя нет или платеж уже обработан"""
+    row = db.execute(stars_payment_statement(telegram_id, amount, payment_id)).first()
+    db.commit()
+    return row
 
 def get_user_balance(db: Session, telegram_id: int) -> dict:
     """Получаем балансы пользователя"""
@@ -144,6 +232,42 @@ def add_deposit_history(
     db.refresh(deposit)
     return deposit
 
+def next_bet_number_statement(user_id: int):
+    """Инкремент счетчика ставок пользователя с RETURNING нового номера
+
+    Строка пользователя блокируется до конца транзакции, поэтому
+    параллельные ставки одного игрока получают разные номера.
+    """
+    return (
+        update(User)
+        .where(User.id == user_id)
+        .values(crash_bets_count=User.crash_bets_count + 1)
+        .returning(User.crash_bets_count)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def bet_counters_statements(counts: dict):
+    """UPDATE ... FROM (VALUES ...) для счетчиков ставок: user_id -> число новых ставок
+
+    RETURNING (id, crash_bets_count): номера новых ставок пользователя -
+    последние count значений до crash_bets_count включительно.
+    """
+    for chunk in _chunks(list(counts.items())):
+        table = values(
+            column("user_id", Integer),
+            column("count", Integer),
+            name="bet_counts"
+        ).data(chunk)
+        yield (
+            update(User)
+            .where(User.id == table.c.user_id)
+            .values(crash_bets_count=User.crash_bets_count + table.c.count)
+            .returning(User.id, User.crash_bets_count)
+            .execution_options(synchronize_session=False)
+        )
+
+
 def add_crash_bet(
     db: Session,
     user_id: int,
@@ -154,12 +278,9 @@ def add_crash_bet(
     status: str = 'pending'
 ) -> CrashBetHistory:
     """Добавляем запись о ставке в crash игру"""
-    # Получаем последний номер ставки для пользователя
-    last_bet = db.query(CrashBetHistory).filter(
-        CrashBetHistory.user_id == user_id
-    ).order_by(CrashBetHistory.bet_number.desc()).first()
-    
-    next_bet_number = (last_bet.bet_number + 1) if last_bet else 1
+    next_bet_number = db.execute(next_bet_number_statement(user_id)).scalar()
+    if next_bet_number is None:
+        raise ValueError("User not found")
     
     bet = CrashBetHistory(
         user_id=user_id,
@@ -285,6 +406,37 @@ def update_crash_bet_result(db: Session, bet_id: int, crash_coefficient: float,
         db.refresh(bet)
     return bet
 
+# Максимум строк в одном VALUES-блоке при массовых обновлениях
+BULK_VALUES_CHUNK = 5000
+
+
+def _chunks(rows: list, size: int = BULK_VALUES_CHUNK):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def crash_bet_results_statements(crash_coefficient: float, bet_results: List[tuple]):
+    """UPDATE ... FROM (VALUES ...) для итогов ставок: (bet_id, win_amount, status)"""
+    for chunk in _chunks(bet_results):
+        results = values(
+            column("bet_id", Integer),
+            column("win_amount", Float),
+            column("status", String),
+            name="bet_results"
+        ).data(chunk)
+        yield (
+            update(CrashBetHistory)
+            .where(CrashBetHistory.id == results.c.bet_id)
+            .values(
+                crash_coefficient=crash_coefficient,
+                win_amount=results.c.win_amount,
+                status=results.c.status,
+                ended_at=func.now()
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+
 def get_user_active_crash_bets(db: Session, user_id: int):
     """Получаем активные ставки пользователя в краш-игре"""
     return db.query(CrashBetHistory).filter(
@@ -342,7 +494,8 @@ def update_game_settings(
     admin_password: str = None,
     crash_rtp: float = None,
     crash_min_multiplier: float = None,
-    crash_max_multiplier: float = None
+    crash_max_multiplier: float = None,
+    crash_distribution: str = None
 ):
     """Обновляем настройки игры"""
     from app.database.models import GameSettings
@@ -362,6 +515,8 @@ def update_game_settings(
         settings.crash_min_multiplier = crash_min_multiplier
     if crash_max_multiplier is not None:
         settings.crash_max_multiplier = crash_max_multiplier
+    if crash_distribution is not None:
+        settings.crash_distribution = crash_distribution
     
     db.commit()
     db.refresh(settings)
@@ -380,13 +535,15 @@ def init_default_settings(db: Session):
             admin_password="KBV4B92clwn8juHJHF45106KBNJHF31cvo2pl5g",  # Пароль по умолчанию
             crash_rtp=0.95,
             crash_min_multiplier=1.1,
-            crash_max_multiplier=100.0
+            crash_max_multiplier=100.0,
+            crash_distribution="inverse"
         )
         db.add(default_settings)
         db.commit()
         db.refresh(default_settings)
         print("✅ Настройки по умолчанию созданы")
         print("🔐 Пароль админа по умолчанию: admin")
+        return default_settings
     return existing_settings
 
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, BigInteger, ForeignKey, Index, func, Boolean, Numeric, JSON  
+from sqlalchemy import Column, Integer, String, DateTime, Float, BigInteger, ForeignKey, Index, func, Boolean, Numeric, JSON, Sequence
 from sqlalchemy.orm import relationship, backref 
 from app.database.session import Base
 
@@ -51,6 +51,9 @@ class User(Base):
     
     stars_payment_ids = Column(JSON, default=[])  # ← ВОТ ЭТУ СТРОЧКУ
     
+    # Счетчик ставок в краш: следующий bet_number без поиска по истории
+    crash_bets_count = Column(Integer, default=0, server_default="0", nullable=False)
+    
     # Язык и настройки
     language = Column(String, default="ru")
     
@@ -121,7 +124,7 @@ class CrashBetHistory(Base):
     win_amount = Column(Float, default=0.0)  # выигрышная сумма
     
     # Статус ставки
-    status = Column(String, default='pending')  # pending, won, lost
+    status = Column(String, default='pending')  # pending, won, lost, cancelled
     
     # Временные метки
     created_at = Column(DateTime, default=func.now())
@@ -167,11 +170,25 @@ class CrashGameResult(Base):
     total_payout = Column(Numeric(20, 2), default=0.0)
     timestamp = Column(DateTime, default=func.now())
     
+    # Provably fair: звено цепочки хешей, из которого получен множитель
+    round_hash = Column(String(64), nullable=True)
+    chain_index = Column(Integer, nullable=True, index=True)
+    sampler = Column(String, nullable=True)  # распределение и параметры, которыми получен множитель
+    room = Column(String, nullable=True, index=True)  # комната краш-игры (RoomManager)
+    payout_limit = Column(Numeric(10, 2), nullable=True)  # множитель, на котором лимит выплат вывел ставки
+    
     # Индексы для быстрого поиска
     __table_args__ = (
         Index('idx_crash_game_id', 'game_id'),
         Index('idx_crash_timestamp', 'timestamp'),
     )
+
+
+# game_id и звено цепочки хешей резервируются при открытии приема ставок, а строка
+# раунда пишется после краха: nextval не откатывается, поэтому ни перезапуск, ни
+# новый лидер не выдадут номер или хеш раунда, который еще не успели сохранить
+crash_game_id_seq = Sequence("crash_game_id_seq", start=1, metadata=Base.metadata)
+crash_chain_index_seq = Sequence("crash_chain_index_seq", start=0, minvalue=0, metadata=Base.metadata)
     
     
 class GameSettings(Base):
@@ -182,6 +199,7 @@ class GameSettings(Base):
     crash_rtp = Column(Float, default=0.95)  # RTP для краша
     crash_min_multiplier = Column(Float, default=1.1)
     crash_max_multiplier = Column(Float, default=100.0)
+    crash_distribution = Column(String, default="inverse")  # имя из multiplier_sampler.sampler_registry
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
 
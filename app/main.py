@@ -9,10 +9,11 @@ from app.routers.telegram import router as telegram_router
 from app.routers import wallet
 import os
 from app.database.crud import get_user_by_telegram_id
-from app.database.session import get_db
+from app.database.session import get_db, get_async_db
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
-from app.database.models import User, CrashGameResult, ReferralAction
+from app.database.models import User, ReferralAction
 from urllib.parse import parse_qs
 import secrets
 import hmac
@@ -20,7 +21,7 @@ import hashlib
 import json
 import asyncio
 from app.services.ton_service import ton_service
-from app.database import crud
+from app.database import crud, async_crud
 from app.database.session import SessionLocal
 from app.services.crash_game import CrashGame
 from app.routers import wallet
@@ -28,7 +29,14 @@ from app.routers import websocket
 import random
 from datetime import datetime 
 from app.services.crash_game import CrashGame
-from app.services.websocket_manager import websocket_manager
+from app.services.websocket_manager import websocket_manager, DEFAULT_ROOM
+from app.services.room_manager import RoomManager
+from app.services import crash_protocol
+from app.services.fanout_bus import make_bus
+from app.services.leadership import Leadership, make_lock
+from app.services.provably_fair import CHAIN_SALT, link_to_uniform, verify_link
+from app.services.multiplier_sampler import sampler_registry, DEFAULT_SPEC
+from app.services.settings_cache import settings_cache
 import websockets
 from app.routers import stars, admin
 from aiogram.methods import AnswerPreCheckoutQuery
@@ -82,9 +90,14 @@ app.include_router(admin.router, prefix="/api")
 app.include_router(stars.router, prefix="/api/stars") 
 app.include_router(websocket.router)
 
-# Создайте экземпляр игры с передачей websocket_manager
-crash_game = CrashGame(websocket_manager)
-websocket_manager.set_crash_game(crash_game)  # ✅ Устанавливаем ссылку
+# Комнаты краш-игры (CRASH_ROOMS) на общем планировщике тиков
+room_manager = RoomManager(websocket_manager).load_rooms()
+# Основная комната - для эндпоинтов без параметра комнаты
+crash_game = room_manager.get(DEFAULT_ROOM) or next(iter(room_manager.rooms.values()))
+
+# Рассылка между воркерами (WS_FANOUT_BUS); игру ведет один процесс - держатель блокировки лидера
+fanout_bus = make_bus()
+leadership = Leadership(make_lock(engine=engine))
 
 # Запускаем health check
 asyncio.create_task(websocket_manager.check_connection_health())
@@ -105,6 +118,29 @@ async def webhook_handler(request: Request):
             ok=True
         ))
 
+async def start_crash_engine():
+    """Процесс стал лидером: продолжаем раунды с последнего сохраненного и запускаем комнаты"""
+    websocket_manager.is_relay = False
+    await room_manager.resume()
+    room_manager.start()
+
+
+async def stop_crash_engine():
+    """Блокировка лидера потеряна: игра останавливается, процесс только ретранслирует"""
+    await room_manager.stop_rooms()
+    # Сыгранные раунды сохраняем до следующей попытки стать лидером
+    await room_manager.drain_settlement(timeout=10)
+    websocket_manager.is_relay = websocket_manager.bus is not None
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    settings_cache.stop()
+    # Не теряем рассчитанные, но не сохраненные раунды
+    await room_manager.stop(timeout=10)
+    await leadership.stop()
+    await websocket_manager.detach_bus()
+
 @app.on_event("startup")
 async def startup():
     Base.metadata.create_all(bind=engine)
@@ -117,8 +153,15 @@ async def startup():
         print("✅ Админ добавлен")
     except Exception as e:
         print(f"⚠️ Ошибка добавления админа: {e}")
+    
+    try:
+        # Настройки в кэш, по ним собирается сэмплер множителя
+        settings_cache.get(db)
+    except Exception as e:
+        print(f"⚠️ Ошибка загрузки настроек игры: {e}")
     finally:
         db.close()
+    settings_cache.start()
     
     # Telegram webhook
     webhook_url_telegram = os.getenv("WEBHOOK_URL_TELEGRAM")
@@ -149,8 +192,11 @@ async def startup():
         if not webhook_url_ton: missing_vars.append("WEBHOOK_URL_TON")
         print(f"⚠️ TON Webhook skipped - missing environment variables: {', '.join(missing_vars)}")
     
-    # ✅ Запускаем фоновую задачу для краш-игры ОДИН РАЗ
-    asyncio.create_task(run_crash_game())
+    # ✅ Циклы комнат краш-игры запускает только процесс, ставший лидером
+    if fanout_bus is not None:
+        # До выборов воркер - ретранслятор
+        await websocket_manager.attach_bus(fanout_bus, relay=True)
+    leadership.start(start_crash_engine, stop_crash_engine)
   
     # Проверяем WebSocket библиотеки
     try:
@@ -166,17 +212,6 @@ async def startup():
         print("❌ WebSocket support: wsproto library missing")
         
 
-async def run_crash_game():
-    """Фоновая задача для управления краш-игрой"""
-    while True:
-        try:
-            await crash_game.run_game_cycle()  # ✅ Используем существующий экземпляр
-            # Пауза между играми
-            await asyncio.sleep(3)
-        except Exception as e:
-            print(f"Error in crash game: {e}")
-            await asyncio.sleep(10)
-            
             
             
 @app.get("/api/webhook-status")
@@ -529,8 +564,12 @@ async def websocket_endpoint(websocket: WebSocket):
         websocket_manager.disconnect(websocket, "general")
 
 @app.websocket("/ws/crash")
-async def websocket_crash(websocket: WebSocket, db: Session = Depends(get_db)):
-    await websocket_manager.connect_crash_game(websocket)
+async def websocket_crash(websocket: WebSocket, room: str = DEFAULT_ROOM, db: Session = Depends(get_db)):
+    if room_manager.get(room) is None:
+        await websocket.close(code=1008)
+        return
+    # Ставку игрока в снимке показываем только по сессии, а не по параметру запроса
+    await websocket_manager.connect_crash_game(websocket, room, websocket.session.get("user_id"))
     try:
         while True:
             data = await websocket.receive_text()
@@ -593,8 +632,12 @@ async def check_deposits_periodically():
 
 
 @app.websocket("/ws/crash")
-async def websocket_crash_endpoint(websocket: WebSocket):
-    await websocket_manager.connect_crash_game(websocket)
+async def websocket_crash_endpoint(websocket: WebSocket, room: str = DEFAULT_ROOM):
+    game = room_manager.get(room)
+    if game is None:
+        await websocket.close(code=1008)
+        return
+    await websocket_manager.connect_crash_game(websocket, room, websocket.session.get("user_id"))
     try:
         while True:
             data = await websocket.receive_text()
@@ -602,19 +645,9 @@ async def websocket_crash_endpoint(websocket: WebSocket):
             try:
                 message = json.loads(data)
                 if message.get("type") == "place_bet":
-                    # Здесь логика обработки ставки
-                    user_id = message.get("user_id")
-                    amount = message.get("amount")
-                    auto_cashout = message.get("auto_cashout")
-                    
-                    # Сохраняем ставку
-                    if user_id and amount:
-                        crash_game.bets[user_id] = {
-                            "amount": amount,
-                            "auto_cashout": auto_cashout,
-                            "placed_at": datetime.now()
-                        }
-                        
+                    # Игрок - из сессии, ставка списывается до подтверждения
+                    await websocket_manager.handle_crash_bet(websocket, message)
+
             except json.JSONDecodeError:
                 pass
     except WebSocketDisconnect:
@@ -623,6 +656,51 @@ async def websocket_crash_endpoint(websocket: WebSocket):
         
 
 
+@app.get("/api/websocket/metrics")
+async def websocket_metrics():
+    """Глубина очередей и задержка отправки для клиентов краш-игры, очередь записи ставок"""
+    metrics = websocket_manager.get_metrics()
+    metrics["bet_writer"] = room_manager.bet_writer.get_stats()
+    metrics["settlement"] = {room_id: game.settlement.get_stats() for room_id, game in room_manager.rooms.items()}
+    metrics["crash_rooms"] = room_manager.get_stats()
+    metrics["leadership"] = leadership.get_stats()
+    return metrics
+
+
+# Замер кодирования не зависит от нагрузки - считаем один раз на процесс
+_protocol_benchmark = None
+
+
+@app.get("/api/websocket/protocol-stats")
+async def websocket_protocol_stats():
+    """JSON против бинарного подпротокола /ws/crash: отправленные байты и стоимость кодирования тика"""
+    global _protocol_benchmark
+    if _protocol_benchmark is None:
+        # Замер в отдельном потоке, чтобы не задерживать тики комнат
+        _protocol_benchmark = await asyncio.to_thread(crash_protocol.benchmark)
+    metrics = websocket_manager.metrics
+    text_frames = metrics.frames_sent - metrics.frames_sent_binary
+    connections = len(websocket_manager.connection_rooms)
+    binary_connections = sum(channel.binary_connections for channel in websocket_manager.rooms.values())
+    return {
+        "connections": {"json": connections - binary_connections, "binary": binary_connections},
+        "sent": {
+            "json": {
+                "frames": text_frames,
+                "bytes": metrics.bytes_sent_text,
+                "bytes_per_frame": round(metrics.bytes_sent_text / text_frames, 1) if text_frames else 0.0
+            },
+            "binary": {
+                "frames": metrics.frames_sent_binary,
+                "bytes": metrics.bytes_sent_binary,
+                "bytes_per_frame": round(metrics.bytes_sent_binary / metrics.frames_sent_binary, 1)
+                if metrics.frames_sent_binary else 0.0
+            }
+        },
+        "encode_benchmark": _protocol_benchmark
+    }
+
+
 @app.get("/api/ws/test")
 async def websocket_test():
     return {
@@ -646,7 +724,7 @@ async def websocket_test():
 async def sync_user_balance(
     request: Request,
     balance_data: dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Синхронизация баланса с клиентом"""
     try:
@@ -654,7 +732,7 @@ async def sync_user_balance(
         if not telegram_id:
             raise HTTPException(status_code=401, detail="Not authenticated")
         
-        user = crud.get_user_by_telegram_id(db, telegram_id)
+        user = await async_crud.get_user_by_telegram_id(db, telegram_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -672,7 +750,7 @@ async def sync_user_balance(
 async def update_user_balance(
     request: Request,
     balance_data: dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Обновляем баланс пользователя"""
     try:
@@ -680,27 +758,20 @@ async def update_user_balance(
         if not telegram_id:
             raise HTTPException(status_code=401, detail="Not authenticated")
         
-        user = crud.get_user_by_telegram_id(db, telegram_id)
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
         currency = balance_data.get("currency")
         amount = float(balance_data.get("amount", 0))
         operation = balance_data.get("operation", "add")  # add или set
         
-        if currency == "stars":
-            if operation == "add":
-                user.stars_balance += amount
-            else:  # set
-                user.stars_balance = amount
-        elif currency == "ton":
-            if operation == "add":
-                user.ton_balance += amount
-            else:  # set
-                user.ton_balance = amount
+        if currency not in ("stars", "ton"):
+            raise HTTPException(status_code=400, detail="Unknown currency")
         
-        db.commit()
-        db.refresh(user)
+        # Арифметика на стороне БД: одновременные зачисления не теряются
+        if operation == "add":
+            user = await async_crud.update_user_balance(db, telegram_id, currency, amount)
+        else:  # set
+            user = await async_crud.set_user_balance(db, telegram_id, currency, amount)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
         
         return {
             "status": "success",
@@ -710,8 +781,10 @@ async def update_user_balance(
             }
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     
     
@@ -741,13 +814,13 @@ async def get_user_data(request: Request, db: Session = Depends(get_db)):
     
     
 @app.get("/api/user/balance")
-async def get_balance(request: Request, db: Session = Depends(get_db)):
+async def get_balance(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Получаем баланс пользователя"""
     telegram_id = request.session.get("telegram_id")
     if not telegram_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    user = get_user_by_telegram_id(db, telegram_id)
+    user = await async_crud.get_user_by_telegram_id(db, telegram_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -775,7 +848,8 @@ async def make_deposit(
         note = deposit_data.get("note", "")
         
         # Обновляем баланс
-        user = update_user_balance(db, telegram_id, currency, amount)
+        # crud-функция: имя update_user_balance в модуле занято эндпоинтом
+        user = crud.update_user_balance(db, telegram_id, currency, amount)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -1029,10 +1103,10 @@ async def set_user_language_api(
 
     
 @app.get("/games/crash/history")
-async def get_crash_history(limit: int = 100, db: Session = Depends(get_db)):
+async def get_crash_history(limit: int = 100, db: AsyncSession = Depends(get_async_db)):
     """Получить историю краш-игр из базы данных"""
     try:
-        results = crud.get_crash_game_history(db, limit)
+        results = await async_crud.get_crash_game_history(db, limit)
         return {
             "history": [
                 {
@@ -1054,7 +1128,7 @@ async def get_crash_history(limit: int = 100, db: Session = Depends(get_db)):
 
 
 @app.post("/api/games/crash/bet")
-async def make_crash_bet(request: Request, bet_data: dict, db: Session = Depends(get_db)):
+async def make_crash_bet(request: Request, bet_data: dict, db: AsyncSession = Depends(get_async_db)):
     """Делаем ставку в crash игру"""
     telegram_id = request.session.get("telegram_id")
     user_id = request.session.get("user_id")
@@ -1066,21 +1140,18 @@ async def make_crash_bet(request: Request, bet_data: dict, db: Session = Depends
         amount = float(bet_data.get("amount", 0))
         currency = bet_data.get("currency", "stars")
         
-        # Проверяем достаточно ли средств
-        user = get_user_by_telegram_id(db, telegram_id)
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        if currency == "stars" and user.stars_balance < amount:
-            raise HTTPException(status_code=400, detail="Insufficient stars balance")
-        elif currency == "ton" and user.ton_balance < amount:
-            raise HTTPException(status_code=400, detail="Insufficient ton balance")
+        if amount <= 0:
+            raise HTTPException(status_code=400, detail="Invalid bet amount")
         
-        # ✅ ИСПРАВЛЯЕМ ВЫЗОВ ФУНКЦИИ:
-        user = update_user_balance(db, telegram_id, currency, -amount)
+        # Проверка средств и списание одним UPDATE: баланс не уходит в минус при параллельных ставках
+        user = await async_crud.update_user_balance(db, telegram_id, currency, -amount, non_negative=True)
+        if not user:
+            if not await async_crud.get_user_by_telegram_id(db, telegram_id):
+                raise HTTPException(status_code=404, detail="User not found")
+            raise HTTPException(status_code=400, detail=f"Insufficient {currency} balance")
         
         # Создаем запись о ставке
-        bet = add_crash_bet(db, user_id, telegram_id, amount)
+        bet = await async_crud.add_crash_bet(db, user_id, telegram_id, amount)
         
         return {
             "status": "success",
@@ -1089,10 +1160,12 @@ async def make_crash_bet(request: Request, bet_data: dict, db: Session = Depends
             "new_balance": user.stars_balance if currency == "stars" else user.ton_balance
         }
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     
     
@@ -1100,12 +1173,9 @@ async def make_crash_bet(request: Request, bet_data: dict, db: Session = Depends
 @app.get("/crash/history")
 async def get_crash_history(
     limit: int = Query(5, ge=1, le=100),
-    db: Session = Depends(get_db)  # ← ДОБАВЬТЕ ЭТУ СТРОЧКУ
+    db: AsyncSession = Depends(get_async_db)  # ← ДОБАВЬТЕ ЭТУ СТРОЧКУ
 ):
-    history = db.query(CrashGameResult)\
-        .order_by(CrashGameResult.timestamp.desc())\
-        .limit(limit)\
-        .all()
+    history = await async_crud.get_crash_game_history(db, limit)
     
     return [
         {
@@ -1121,11 +1191,58 @@ async def get_crash_history(
     ]
 
 
+@app.get("/api/crash/fairness")
+async def get_crash_fairness():
+    """Терминальный хеш цепочки (публикуется до начала раундов) и параметры проверки"""
+    if not crash_game.hash_chain:
+        return {"enabled": False}
+    
+    return {
+        "enabled": True,
+        "terminating_hash": crash_game.hash_chain.terminating_hash(),
+        "chain_length": crash_game.hash_chain.length,
+        "salt": CHAIN_SALT,
+        "sampler": sampler_registry.spec(sampler_registry.active)
+    }
+
+
+@app.get("/api/crash/verify/{game_id}")
+async def verify_crash_game(game_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Проверка раунда: множитель из хеша и связь хеша с предыдущим раундом"""
+    game = await async_crud.get_crash_game_by_game_id(db, game_id)
+    if not game or not game.round_hash:
+        raise HTTPException(status_code=404, detail="Round not found or not provably fair")
+    
+    previous = None
+    if game.chain_index:
+        previous = await async_crud.get_crash_game_by_chain_index(db, game.chain_index - 1)
+    
+    # Множитель пересчитывается тем же распределением, что действовало в раунде
+    sampler = sampler_registry.build_from_spec(game.sampler or DEFAULT_SPEC)
+    computed_multiplier = sampler.sample(link_to_uniform(game.round_hash))
+    return {
+        "game_id": game.game_id,
+        "room": game.room,
+        "round_hash": game.round_hash,
+        "chain_index": game.chain_index,
+        "sampler": game.sampler,
+        "multiplier": float(game.multiplier),
+        "computed_multiplier": computed_multiplier,
+        "multiplier_valid": abs(computed_multiplier - float(game.multiplier)) < 0.005,
+        "crashed_at": float(game.crashed_at),
+        # Лимит выплат вывел невыведенные ставки на этом множителе
+        "payout_capped": game.payout_limit is not None,
+        "payout_limit": float(game.payout_limit) if game.payout_limit is not None else None,
+        "previous_hash": previous.round_hash if previous else None,
+        "chain_valid": verify_link(game.round_hash, previous.round_hash) if previous and previous.round_hash else None
+    }
+
+
 @app.get("/api/crash/bet-history")
 async def get_crash_bet_history(
     request: Request,
     limit: int = Query(100, ge=1, le=500),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получаем историю ставок краш-игры"""
     try:
@@ -1133,12 +1250,12 @@ async def get_crash_bet_history(
         if not telegram_id:
             raise HTTPException(status_code=401, detail="Not authenticated")
         
-        user = crud.get_user_by_telegram_id(db, telegram_id)
+        user = await async_crud.get_user_by_telegram_id(db, telegram_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
         # Получаем всю историю ставок
-        bets = crud.get_all_crash_bet_history(db, limit)
+        bets = await async_crud.get_all_crash_bet_history(db, limit)
         
         return {
             "bets": [
@@ -1194,27 +1311,15 @@ async def handle_stars_payment(payload: dict, db: Session):
             print("⚠️ Missing required payment data")
             return
         
-        # Находим пользователя
-        user = crud.get_user_by_telegram_id(db, telegram_id)
+        # Зачисление и проверка дубликата платежа одним UPDATE
+        user = crud.credit_stars_payment(db, telegram_id, amount, payment_id)
         if not user:
-            print(f"⚠️ User {telegram_id} not found")
-            return
-        
-        # Проверяем не обрабатывали ли уже этот платеж
-        if user.stars_payment_ids and payment_id in user.stars_payment_ids:
-            print(f"⚠️ Payment {payment_id} already processed")
+            if not crud.get_user_by_telegram_id(db, telegram_id):
+                print(f"⚠️ User {telegram_id} not found")
+            else:
+                print(f"⚠️ Payment {payment_id} already processed")
             return
         
-        # Обновляем баланс пользователя
-        user.stars_balance += amount
-        
-        # Сохраняем ID платежа
-        if user.stars_payment_ids is None:
-            user.stars_payment_ids = []
-        
-        user.stars_payment_ids.append(payment_id)
-        db.commit()
-        
         print(f"✅ Added {amount} STARS to user {telegram_id}. New balance: {user.stars_balance}")
         
         # Отправляем уведомление через WebSocket если нужно
@@ -1319,11 +1424,8 @@ async def handle_telegram_webhook(request: Request, db: Session = Depends(get_db
                     amount = float(parts[2])
                     
                     # Обновляем баланс пользователя
-                    user = crud.get_user_by_telegram_id(db, user_id)
+                    user = crud.update_user_balance(db, user_id, "stars", amount)
                     if user:
-                        user.stars_balance += amount
-                        db.commit()
-                        
                         # ✅ Отправляем уведомление через WebSocket
                         await websocket_manager.send_to_user(
                             f"user_{user_id}",
@@ -1,19 +1,44 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Request, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
 from app.database.session import get_db
 from app.database import crud
+from app.services.multiplier_sampler import sampler_registry
+from app.services.settings_cache import settings_cache
+from app.services.websocket_manager import websocket_manager
 
 router = APIRouter()
 
+
+def build_candidate_sampler(settings, distribution=None, rtp=None, min_multiplier=None, max_multiplier=None):
+    """Сэмплер для новых настроек поверх текущих; 400 если параметры недопустимы"""
+    try:
+        return sampler_registry.build(
+            distribution if distribution is not None else settings.crash_distribution,
+            rtp if rtp is not None else settings.crash_rtp,
+            min_multiplier if min_multiplier is not None else settings.crash_min_multiplier,
+            max_multiplier if max_multiplier is not None else settings.crash_max_multiplier
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def save_game_settings(db: Session, **fields):
+    """Записываем настройки в БД; новые сразу в кэш этого процесса, остальным воркерам - инвалидация"""
+    settings = crud.update_game_settings(db, **fields)
+    settings_cache.invalidate(settings)
+    return settings
+
+
 @router.post("/admin/login")
 async def admin_login(admin_data: dict, db: Session = Depends(get_db)):
     """Простая авторизация по паролю"""
     password = admin_data.get("password", "")
     
-    settings = crud.get_game_settings(db)
+    settings = settings_cache.get(db)
     if not settings:
         # Создаем настройки по умолчанию с паролем "admin"
-        settings = crud.update_game_settings(db, admin_password="admin")
+        settings = save_game_settings(db, admin_password="admin")
     
     if password != settings.admin_password:
         raise HTTPException(status_code=401, detail="Неверный пароль админа")
@@ -27,9 +52,10 @@ async def update_settings(admin_data: dict, db: Session = Depends(get_db)):
     new_rtp = admin_data.get("crash_rtp")
     new_min = admin_data.get("crash_min_multiplier")
     new_max = admin_data.get("crash_max_multiplier")
+    new_distribution = admin_data.get("crash_distribution")
     
     # Проверяем пароль
-    settings = crud.get_game_settings(db)
+    settings = settings_cache.get(db)
     if password != settings.admin_password:
         raise HTTPException(status_code=401, detail="Неверный пароль админа")
     
@@ -37,12 +63,16 @@ async def update_settings(admin_data: dict, db: Session = Depends(get_db)):
     if new_rtp is not None and not (0.5 <= new_rtp <= 0.99):
         raise HTTPException(400, "RTP должен быть между 0.5 и 0.99")
     
+    # Сэмплер строим до записи в БД: недопустимые настройки не сохраняются
+    build_candidate_sampler(settings, new_distribution, new_rtp, new_min, new_max)
+    
     # Обновляем настройки
-    updated = crud.update_game_settings(
+    updated = save_game_settings(
         db=db,
         crash_rtp=new_rtp,
         crash_min_multiplier=new_min,
-        crash_max_multiplier=new_max
+        crash_max_multiplier=new_max,
+        crash_distribution=new_distribution
     )
     
     return {
@@ -51,10 +81,49 @@ async def update_settings(admin_data: dict, db: Session = Depends(get_db)):
         "settings": {
             "crash_rtp": updated.crash_rtp,
             "crash_min_multiplier": updated.crash_min_multiplier,
-            "crash_max_multiplier": updated.crash_max_multiplier
+            "crash_max_multiplier": updated.crash_max_multiplier,
+            "crash_distribution": updated.crash_distribution
         }
     }
 
+@router.post("/admin/rtp-simulation")
+async def run_rtp_simulation(admin_data: dict, db: Session = Depends(get_db)):
+    """Монте-Карло проверка RTP генератора множителя - требует пароль админа"""
+    from app.services.rtp_simulator import GENERATORS, DEFAULT_TARGETS, simulate
+    
+    password = admin_data.get("password", "")
+    settings = settings_cache.get(db)
+    if password != settings.admin_password:
+        raise HTTPException(status_code=401, detail="Неверный пароль админа")
+    
+    # generator: старый генератор CrashGame, "active" - текущий сэмплер,
+    # или имя распределения из реестра (проверка настроек до их применения)
+    generator = admin_data.get("generator", "active")
+    sampler = None
+    if generator == "active":
+        sampler = sampler_registry.active
+    elif generator in sampler_registry.factories:
+        sampler = build_candidate_sampler(
+            settings,
+            generator,
+            admin_data.get("crash_rtp"),
+            admin_data.get("crash_min_multiplier"),
+            admin_data.get("crash_max_multiplier")
+        )
+    elif generator not in GENERATORS:
+        available = ["active"] + list(sampler_registry.factories) + list(GENERATORS)
+        raise HTTPException(400, f"Неизвестный генератор. Доступны: {', '.join(available)}")
+    
+    rounds = int(admin_data.get("rounds", 10_000_000))
+    if not (10_000 <= rounds <= 100_000_000):
+        raise HTTPException(400, "Количество раундов должно быть между 10 000 и 100 000 000")
+    
+    targets = admin_data.get("targets") or DEFAULT_TARGETS
+    
+    # Симуляция занимает секунды CPU - выполняем вне event loop
+    report = await asyncio.to_thread(simulate, generator, rounds, targets, sampler=sampler)
+    return {"status": "success", "report": report}
+
 @router.post("/admin/change-password")
 async def change_password(admin_data: dict, db: Session = Depends(get_db)):
     """Смена пароля админа"""
@@ -64,11 +133,11 @@ async def change_password(admin_data: dict, db: Session = Depends(get_db)):
     if not new_password or len(new_password) < 4:
         raise HTTPException(status_code=400, detail="Новый пароль слишком короткий")
     
-    settings = crud.get_game_settings(db)
+    settings = settings_cache.get(db)
     if old_password != settings.admin_password:
         raise HTTPException(status_code=401, detail="Неверный старый пароль")
     
-    crud.update_game_settings(db=db, admin_password=new_password)
+    save_game_settings(db=db, admin_password=new_password)
     return {"status": "success", "message": "Пароль успешно изменен"}
 
 
@@ -89,11 +158,15 @@ async def check_admin_status(
 @router.get("/admin/settings")
 async def get_settings(db: Session = Depends(get_db)):
     """Получаем текущие настройки"""
-    settings = crud.get_game_settings(db)
+    settings = settings_cache.get(db)
     return {
         "crash_rtp": settings.crash_rtp,
         "crash_min_multiplier": settings.crash_min_multiplier,
-        "crash_max_multiplier": settings.crash_max_multiplier
+        "crash_max_multiplier": settings.crash_max_multiplier,
+        "crash_distribution": settings.crash_distribution,
+        "distributions": list(sampler_registry.factories),
+        "active_sampler": sampler_registry.spec(sampler_registry.active),
+        "cache": settings_cache.get_stats()
     }
 
 @router.post("/admin/update-settings")
@@ -104,7 +177,9 @@ async def update_settings(settings_data: dict, db: Session = Depends(get_db)):
     if crash_rtp is not None and not (0.8 <= crash_rtp <= 0.99):
         raise HTTPException(status_code=400, detail="RTP должен быть между 0.8 и 0.99")
     
-    updated = crud.update_game_settings(
+    build_candidate_sampler(settings_cache.get(db), rtp=crash_rtp)
+    
+    updated = save_game_settings(
         db=db,
         crash_rtp=crash_rtp
     )
@@ -114,4 +189,19 @@ async def update_settings(settings_data: dict, db: Session = Depends(get_db)):
         "settings": {
             "crash_rtp": updated.crash_rtp
         }
-    }
\ No newline at end of file
+    }
+
+
+@router.websocket("/ws/admin/exposure")
+async def exposure_stream(websocket: WebSocket, password: str = ""):
+    """Поток экспозиции текущего раунда (каждый тик полета) - требует пароль админа"""
+    if password != settings_cache.get().admin_password:
+        await websocket.close(code=1008)
+        return
+    
+    await websocket_manager.connect_admin(websocket)
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        websocket_manager.disconnect_admin(websocket)
@@ -74,25 +74,13 @@ async def stars_webhook(request: Request, db: Session = Depends(get_db)):
             if not all([telegram_id, amount, payment_id]):
                 return {"status": "error", "message": "Missing data"}
             
-            # Находим пользователя
-            user = crud.get_user_by_telegram_id(db, telegram_id)
+            # Зачисляем средства и сохраняем ID платежа одним UPDATE (дубликат ничего не меняет)
+            user = crud.credit_stars_payment(db, telegram_id, amount, payment_id)
             if not user:
-                return {"status": "error", "message": "User not found"}
-            
-            # Проверяем дубликат платежа
-            if user.stars_payment_ids and payment_id in user.stars_payment_ids:
+                if not crud.get_user_by_telegram_id(db, telegram_id):
+                    return {"status": "error", "message": "User not found"}
                 return {"status": "success", "message": "Payment already processed"}
             
-            # Зачисляем средства
-            user.stars_balance += amount
-            
-            # Сохраняем ID платежа
-            if user.stars_payment_ids is None:
-                user.stars_payment_ids = []
-            user.stars_payment_ids.append(payment_id)
-            
-            db.commit()
-            
             logger.info(f"Added {amount} STARS to user {telegram_id}")
             
             return {"status": "success"}
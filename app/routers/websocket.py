@@ -1,5 +1,5 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from app.services.websocket_manager import websocket_manager
+from app.services.websocket_manager import websocket_manager, DEFAULT_ROOM
 from app.database.session import get_db
 from sqlalchemy.orm import Session
 import json
@@ -48,8 +48,15 @@ async def websocket_general(websocket: WebSocket, db: Session = Depends(get_db))
         websocket_manager.disconnect(websocket, "general")
 
 @router.websocket("/ws/crash")
-async def websocket_crash(websocket: WebSocket, db: Session = Depends(get_db)):
-    await websocket_manager.connect_crash_game(websocket)
+async def websocket_crash(websocket: WebSocket, room: str = DEFAULT_ROOM, db: Session = Depends(get_db)):
+    """Подписка на комнату краш-игры (?room=<id>, по умолчанию основная)
+
+    Первым сообщением приходит crash_snapshot; для авторизованной сессии в нем есть ставка игрока.
+    """
+    if room not in websocket_manager.rooms:
+        await websocket.close(code=1008)
+        return
+    await websocket_manager.connect_crash_game(websocket, room, websocket.session.get("user_id"))
     try:
         while True:
             data = await websocket.receive_text()
@@ -57,8 +64,13 @@ async def websocket_crash(websocket: WebSocket, db: Session = Depends(get_db)):
             try:
                 message = json.loads(data)
                 if message.get("type") == "place_bet":
-                    # Здесь логика обработки ставки
-                    pass
+                    # Ставка уходит в игру комнаты, к которой подключен клиент
+                    await websocket_manager.handle_crash_bet(websocket, message)
+                elif message.get("type") == "ping":
+                    await websocket_manager.send_personal_message({
+                        "type": "pong",
+                        "timestamp": message.get("timestamp")
+                    }, websocket)
             except json.JSONDecodeError:
                 pass
                 
@@ -0,0 +1,167 @@
+"""
+Компактная книга ставок раунда краш-игры.
+
+Ставка - объект с __slots__ (без __dict__ и без datetime), итоги раунда
+(сумма ставок, невыведенная сумма, уже выплаченное) ведутся при каждом
+изменении, поэтому расчет и экспозиция не обходят все ставки.
+
+Замер памяти:
+    python -m app.services.bet_book --bets 100000
+"""
+import argparse
+import math
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+
+class Bet:
+    """Ставка игрока в текущем раунде"""
+
+    __slots__ = ("user_id", "amount", "auto_cashout", "placed_at", "cashed_out",
+                 "cashout_multiplier", "profit", "bet_id")
+
+    def __init__(self, user_id: int, amount: float, auto_cashout: Optional[float], placed_at: float):
+        self.user_id = user_id
+        self.amount = amount
+        self.auto_cashout = auto_cashout
+        self.placed_at = placed_at  # time.time()
+        self.cashed_out = False
+        self.cashout_multiplier = 0.0
+        self.profit = 0.0
+        self.bet_id: Optional[int] = None
+
+
+class BetBook:
+    """Ставки раунда по user_id с инкрементальными итогами"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Новый раунд: подменяем словарь целиком вместо удаления по одной ставке"""
+        self.bets: Dict[int, Bet] = {}
+        self.total_bet = 0.0
+        self.pending_amount = 0.0  # ставки, еще не выведенные
+        self.total_payout = 0.0  # выплаты по уже выведенным ставкам
+        self.cancelled: List[Bet] = []  # снятые с раунда ставки; записанные расчет закроет с возвратом
+
+    def __len__(self) -> int:
+        return len(self.bets)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.bets
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.bets)
+
+    def get(self, user_id: int) -> Optional[Bet]:
+        return self.bets.get(user_id)
+
+    def values(self):
+        return self.bets.values()
+
+    def place(self, user_id: int, amount: float, auto_cashout: Optional[float] = None) -> Bet:
+        """Добавляем ставку; повторная ставка игрока в раунде заменяет предыдущую"""
+        previous = self.bets.get(user_id)
+        if previous is not None:
+            self._discard(previous)
+            # bet_id может появиться позже: запись прежней ставки еще идет
+            self.cancelled.append(previous)
+
+        bet = Bet(user_id, amount, auto_cashout, time.time())
+        self.bets[user_id] = bet
+        self.total_bet += amount
+        self.pending_amount += amount
+        return bet
+
+    def remove(self, bet: Bet):
+        """Снимаем ставку с раунда (не записана или отменена); замененную новой ставку не трогаем"""
+        if self.bets.get(bet.user_id) is bet:
+            del self.bets[bet.user_id]
+            self._discard(bet)
+            self.cancelled.append(bet)
+
+    def _discard(self, bet: Bet):
+        self.total_bet -= bet.amount
+        if bet.cashed_out:
+            self.total_payout -= bet.profit
+        else:
+            self.pending_amount -= bet.amount
+
+    def cash_out(self, user_id: int, multiplier: float) -> Bet:
+        """Выводим ставку на множителе multiplier"""
+        bet = self.bets.get(user_id)
+        if bet is None:
+            raise Exception("No active bet found")
+        if bet.cashed_out:
+            raise Exception("Bet already cashed out")
+
+        bet.cashed_out = True
+        bet.cashout_multiplier = multiplier
+        bet.profit = bet.amount * multiplier
+        self.pending_amount -= bet.amount
+        self.total_payout += bet.profit
+        return bet
+
+    def exposure(self, multiplier: float) -> float:
+        """Сколько придется выплатить, если все невыведенные ставки выведут на multiplier"""
+        return self.total_payout + self.pending_amount * multiplier
+
+
+def _measure(build) -> tuple:
+    tracemalloc.start()
+    started = time.perf_counter()
+    container = build()
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return container, current, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory benchmark: dict-of-dicts bets vs BetBook")
+    parser.add_argument("--bets", type=int, default=100_000)
+    args = parser.parse_args()
+    n = args.bets
+
+    def build_dicts():
+        bets = {}
+        for user_id in range(n):
+            bets[user_id] = {
+                "amount": 10.0 + user_id % 100,
+                "auto_cashout": 2.0 if user_id % 3 else None,
+                "placed_at": datetime.now(),
+                "cashed_out": False,
+                "profit": 0,
+                "bet_id": user_id
+            }
+        return bets
+
+    def build_book():
+        book = BetBook()
+        for user_id in range(n):
+            bet = book.place(user_id, 10.0 + user_id % 100, 2.0 if user_id % 3 else None)
+            bet.bet_id = user_id
+        return book
+
+    dicts, dicts_bytes, dicts_time = _measure(build_dicts)
+    book, book_bytes, book_time = _measure(build_book)
+
+    started = time.perf_counter()
+    total = sum(bet["amount"] for bet in dicts.values())
+    dicts_sum_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    assert math.isclose(book.total_bet, total)
+    book_sum_ms = (time.perf_counter() - started) * 1000
+
+    print(f"🧮 {n:,} ставок")
+    print(f"   dict of dicts: {dicts_bytes / n:>7.1f} байт/ставка, вставка {dicts_time * 1000:.1f} мс, "
+          f"сумма ставок {dicts_sum_ms:.2f} мс")
+    print(f"   BetBook:       {book_bytes / n:>7.1f} байт/ставка, вставка {book_time * 1000:.1f} мс, "
+          f"сумма ставок {book_sum_ms:.4f} мс")
+
+
+if __name__ == "__main__":
+    main()
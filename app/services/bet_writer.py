@@ -0,0 +1,98 @@
+"""
+Фоновая запись ставок краш-игры в crash_bet_history.
+
+Ставка проверяется по балансу в памяти, а строка в БД пишется пачкой:
+писатель ждет BET_FLUSH_INTERVAL после первой ставки, собирает все
+накопившиеся (до BET_BATCH_SIZE) и вставляет их одной транзакцией.
+submit возвращает future: bet_id после вставки пачки или ошибку записи,
+поэтому игрок получает подтверждение только записанной ставки.
+"""
+import asyncio
+import os
+import time
+from typing import Optional
+
+from app.database.session import AsyncSessionLocal
+from app.database import async_crud
+from app.services.clock import MonotonicClock
+
+BET_FLUSH_INTERVAL = float(os.getenv("BET_FLUSH_INTERVAL_MS", "5")) / 1000
+BET_BATCH_SIZE = int(os.getenv("BET_BATCH_SIZE", "500"))
+
+
+class BetWriter:
+    """Очередь ставок и фоновая задача пакетной вставки"""
+
+    def __init__(self, flush_interval: float = BET_FLUSH_INTERVAL, batch_size: int = BET_BATCH_SIZE, clock=None):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.clock = clock or MonotonicClock()
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.rows = 0
+        self.failed = 0
+        self.last_flush_ms = 0.0
+
+    def submit(self, bet, telegram_id: int) -> asyncio.Future:
+        """Ставим ставку (bet_book.Bet) в очередь записи; future завершится bet_id или ошибкой"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        written = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((bet, telegram_id, written))
+        return written
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            # Даем набраться пачке - ставки приходят всплесками в конце приема
+            await self.clock.sleep(self.flush_interval)
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _flush(self, batch: list):
+        started = time.perf_counter()
+        try:
+            ids = await self.insert([(bet.user_id, telegram_id, bet.amount) for bet, telegram_id, _ in batch])
+        except Exception as e:
+            # Ставки без bet_id не попадут в расчет раунда - игра снимет их с раунда
+            self.failed += len(batch)
+            print(f"❌ [BetWriter] Ошибка записи пачки из {len(batch)} ставок: {e}")
+            for _, _, written in batch:
+                if not written.done():
+                    written.set_exception(e)
+            return
+
+        for (bet, _, written), bet_id in zip(batch, ids):
+            if bet_id is None:
+                self.failed += 1
+                print(f"❌ [BetWriter] Пользователь {bet.user_id} не найден, ставка не записана")
+                if not written.done():
+                    written.set_exception(Exception(f"User {bet.user_id} not found"))
+                continue
+            bet.bet_id = bet_id
+            if not written.done():
+                written.set_result(bet_id)
+
+        self.batches += 1
+        self.rows += len(batch)
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+    async def insert(self, rows: list) -> list:
+        """Вставка пачки (user_id, telegram_id, amount); id строк в порядке rows, None - пользователь не найден"""
+        async with AsyncSessionLocal() as db:
+            return await async_crud.add_crash_bets(db, rows)
+
+    def get_stats(self) -> dict:
+        return {
+            "pending": self.queue.qsize(),
+            "batches": self.batches,
+            "rows": self.rows,
+            "failed": self.failed,
+            "last_flush_ms": round(self.last_flush_ms, 2)
+        }
@@ -0,0 +1,96 @@
+"""
+Часы игрового цикла краш-игры.
+
+CrashGame не вызывает time.monotonic и asyncio.sleep напрямую, а берет
+now() и sleep_until() у своих часов:
+  - MonotonicClock - реальное время (по умолчанию);
+  - TimerWheel (timer_wheel.py) - реальное время, общее колесо таймеров для комнат;
+  - VirtualClock - виртуальное время для симуляции: время перескакивает
+    к ближайшему дедлайну, как только всем корутинам больше нечего делать.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+
+# Сколько раз отдаем управление event loop, прежде чем считать, что все ждут часов
+# (если у цикла нет очереди _ready, как у uvloop)
+VIRTUAL_IDLE_PASSES = 16
+
+
+class MonotonicClock:
+    """Часы по умолчанию: time.monotonic и asyncio.sleep (комнаты RoomManager используют TimerWheel)"""
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    async def sleep_until(self, deadline: float):
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def sleep(self, delay: float):
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class VirtualClock:
+    """Виртуальное время: sleep_until не ждет реально, run() переводит часы к ближайшему дедлайну"""
+
+    def __init__(self, start: float = 0.0, idle_passes: int = VIRTUAL_IDLE_PASSES):
+        self.time = start
+        self.idle_passes = idle_passes
+        self.timers = []  # min-heap (deadline, seq, future)
+        self.sequence = itertools.count()
+        self.advances = 0
+
+    def now(self) -> float:
+        return self.time
+
+    async def sleep_until(self, deadline: float):
+        if deadline <= self.time:
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.timers, (deadline, next(self.sequence), future))
+        await future
+
+    async def sleep(self, delay: float):
+        await self.sleep_until(self.time + delay)
+
+    async def _run_ready(self):
+        """Даем проснувшимся корутинам дойти до следующего ожидания часов"""
+        ready = getattr(asyncio.get_running_loop(), "_ready", None)
+        if ready is None:
+            for _ in range(self.idle_passes):
+                await asyncio.sleep(0)
+            return
+        # Очередь готовых колбэков стандартного цикла пуста - все ждут часов
+        await asyncio.sleep(0)
+        while ready:
+            await asyncio.sleep(0)
+
+    async def run(self, coro):
+        """Выполняем coro в виртуальном времени и возвращаем ее результат"""
+        task = asyncio.ensure_future(coro)
+        while True:
+            await self._run_ready()
+            if task.done():
+                return task.result()
+            if not self.timers:
+                task.cancel()
+                raise RuntimeError("Simulation stalled: nothing is waiting on the virtual clock")
+
+            # Перескакиваем к ближайшему дедлайну и будим всех, у кого он наступил
+            self.time = max(self.time, self.timers[0][0])
+            self.advances += 1
+            while self.timers and self.timers[0][0] <= self.time:
+                _, _, future = heapq.heappop(self.timers)
+                if not future.done():
+                    future.set_result(None)
+
+    def get_stats(self) -> dict:
+        return {
+            "virtual_time": round(self.time, 3),
+            "pending_timers": len(self.timers),
+            "advances": self.advances
+        }
@@ -0,0 +1,60 @@
+from bisect import bisect_right
+
+# Ступени скорости: (множитель, с которого действует ступень, скорость)
+SPEED_TIERS = (
+    (1.0, 1.0),    # Базовая скорость
+    (2.0, 1.2),    # 1.2x скорость при 2x+
+    (5.0, 1.5),    # 1.5x скорость при 5x+
+    (10.0, 2.0),   # 2x скорость при 10x+
+    (50.0, 4.0),   # 4x скорость при 50x+
+)
+
+# Прирост множителя в секунду при скорости 1.0.
+# Старый цикл делал шаг 0.01 * speed каждые 0.1 / speed секунды, то есть 0.1 * speed^2 в секунду.
+BASE_RATE = 0.1
+
+
+class CrashCurve:
+    """Множитель как функция прошедшего времени полета (кусочно-линейная по ступеням скорости)"""
+
+    def __init__(self, base_rate: float = BASE_RATE, tiers=SPEED_TIERS):
+        self.tier_multipliers = [multiplier for multiplier, _ in tiers]
+        self.tier_speeds = [speed for _, speed in tiers]
+        self.tier_rates = [base_rate * speed * speed for speed in self.tier_speeds]
+
+        # Момент времени, когда начинается каждая ступень
+        self.tier_times = [0.0]
+        for i in range(1, len(tiers)):
+            span = self.tier_multipliers[i] - self.tier_multipliers[i - 1]
+            self.tier_times.append(self.tier_times[-1] + span / self.tier_rates[i - 1])
+
+    def speed_at(self, multiplier: float) -> float:
+        """Скорость полета на данном множителе"""
+        index = max(bisect_right(self.tier_multipliers, multiplier) - 1, 0)
+        return self.tier_speeds[index]
+
+    def tier_at(self, multiplier: float) -> int:
+        """Номер ступени скорости (индекс в SPEED_TIERS) на данном множителе"""
+        return max(bisect_right(self.tier_multipliers, multiplier) - 1, 0)
+
+    def rate_at(self, multiplier: float) -> float:
+        """Прирост множителя в секунду на данном множителе"""
+        index = max(bisect_right(self.tier_multipliers, multiplier) - 1, 0)
+        return self.tier_rates[index]
+
+    def multiplier_at(self, elapsed: float) -> float:
+        """Множитель через elapsed секунд после начала полета"""
+        if elapsed <= 0:
+            return self.tier_multipliers[0]
+        index = bisect_right(self.tier_times, elapsed) - 1
+        return self.tier_multipliers[index] + (elapsed - self.tier_times[index]) * self.tier_rates[index]
+
+    def time_to(self, multiplier: float) -> float:
+        """Через сколько секунд полета будет достигнут множитель"""
+        if multiplier <= self.tier_multipliers[0]:
+            return 0.0
+        index = bisect_right(self.tier_multipliers, multiplier) - 1
+        return self.tier_times[index] + (multiplier - self.tier_multipliers[index]) / self.tier_rates[index]
+
+
+crash_curve = CrashCurve()
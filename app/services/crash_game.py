@@ -1,52 +1,150 @@
 import asyncio
+import heapq
 import random
 import math
+import os
 from datetime import datetime
-from sqlalchemy.orm import Session
-from app.database.session import SessionLocal
-from app.database import crud
-from app.database.models import User
+from typing import Optional
+from app.database.session import AsyncSessionLocal
+from app.database import async_crud
+from app.services.crash_curve import crash_curve
+from app.services.provably_fair import CrashHashChain, link_to_uniform
+from app.services.multiplier_sampler import sampler_registry
+from app.services.settings_cache import settings_cache
+from app.services.bet_writer import BetWriter
+from app.services.bet_book import BetBook
+from app.services.clock import MonotonicClock
+from app.services.flight_frames import FlightFrames
+from app.services.round_state import RoundState, CRASH_SNAPSHOT_HISTORY
+from app.services.settlement_worker import SettlementWorker, RoundSettlement
+
+# Сколько кадров полета в секунду рассылается клиентам (между кадрами клиент интерполирует)
+CRASH_TICK_RATE = float(os.getenv("CRASH_TICK_RATE", "10"))
+# Максимальная выплата за раунд; при достижении невыведенные ставки выводятся на лимите (0 - без лимита)
+CRASH_MAX_ROUND_PAYOUT = float(os.getenv("CRASH_MAX_ROUND_PAYOUT", "0"))
+# Длительность приема ставок, секунд
+BETTING_SECONDS = 15
+
+
+class ChainCursor:
+    """Цепочка хешей, общая для всех комнат: каждое звено - ровно одному раунду"""
+
+    def __init__(self, hash_chain: CrashHashChain = None):
+        self.hash_chain = hash_chain
+
+    async def take(self):
+        """(chain_index, round_hash) для нового раунда; звено резервирует последовательность БД"""
+        async with AsyncSessionLocal() as db:
+            index = await async_crud.reserve_chain_index(db)
+        return index, self.hash_chain.link(index)
+
 
 class CrashGame:
-    def __init__(self, ws_manager):
+    def __init__(
+        self,
+        ws_manager,
+        room_id: str = "main",
+        currency: str = "stars",
+        min_bet: float = None,
+        max_bet: float = None,
+        clock=None,
+        chain: ChainCursor = None,
+        bet_writer: BetWriter = None,
+        game_ids=None
+    ):
+        # ws_manager - канал комнаты (WebSocketManager.room): send_crash_update, send_crash_result, ...
+        # clock - MonotonicClock, TimerWheel или VirtualClock (симуляция)
         self.ws_manager = ws_manager
+        self.room_id = room_id
+        self.currency = currency
+        self.min_bet = min_bet
+        self.max_bet = max_bet
+        self.clock = clock or MonotonicClock()
         self.current_multiplier = 1.0
         self.is_playing = False
-        self.bets = {}  # user_id -> bet_data
+        self.bets = BetBook()  # user_id -> Bet
+        self.auto_cashouts = []  # min-heap (auto_cashout, user_id) для авто-вывода в полете
         self.game_history = []
         self.game_id = 0
+        # Номера раундов общие для всех комнат, чтобы game_id не повторялся
+        self.game_ids = game_ids  # счетчик в памяти (симуляция); None - последовательность БД
         self.current_speed = 1.0  # ← Добавляем переменную скорости
+        self.curve = crash_curve
+        self.tick_rate = CRASH_TICK_RATE
+        # Provably fair: цепочка хешей (если сгенерирована) и позиция в ней
+        self.chain = chain or ChainCursor(CrashHashChain.load())
+        self.round_hash = None
+        self.round_chain_index = None
+        self.round_sampler = None
+        # Прием ставок: проверка по балансам в памяти, запись в БД пачками
+        self.accepting_bets = False
+        self.balances = {}  # user_id -> (telegram_id, баланс в валюте комнаты), снимок на раунд
+        self.bet_writer = bet_writer or BetWriter()
+        self.pending_writes = set()  # ставки этой комнаты, ожидающие записи; BetWriter общий для комнат
+        self.max_round_payout = CRASH_MAX_ROUND_PAYOUT
+        self.crash_point = 1.0  # точка краха раунда
+        self.limit_multiplier = None  # множитель, на котором лимит выплат вывел оставшиеся ставки
+        self.limit_rounds = 0
+        # Раунды сохраняются в фоне, пока следующий раунд принимает ставки
+        self.settlement = SettlementWorker()
+        self.last_players = []
+        # Закодированные кадры полета текущего раунда и индекс последнего отправленного
+        self.flight_frames = None
+        self.flight_frame = None
+        # Состояние для снимка при подключении; после краха - книга ставок завершенного раунда
+        self.state = RoundState()
+        self.crashed_bets = None
 
     def calculate_speed(self, multiplier: float) -> float:
-        """Вычисляем скорость на основе текущего множителя"""
-        if multiplier >= 50:
-            return 4.0    # 4x скорость при 50x+
-        elif multiplier >= 10:
-            return 2.0    # 2x скорость при 10x+  
-        elif multiplier >= 5:
-            return 1.5    # 1.5x скорость при 5x+
-        elif multiplier >= 2:
-            return 1.2    # 1.2x скорость при 2x+
-        else:
-            return 1.0    # Базовая скорость
+        """Вычисляем скорость на основе текущего множителя (ступени в crash_curve.SPEED_TIERS)"""
+        return self.curve.speed_at(multiplier)
+
+    @property
+    def hash_chain(self):
+        return self.chain.hash_chain
+
+    async def sleep_until(self, deadline: float):
+        """Спим до момента deadline по часам комнаты"""
+        await self.clock.sleep_until(deadline)
 
     async def run_game_cycle(self):
         """Запуск цикла игры"""
-        self.game_id += 1
+        # Не начинаем раунд, пока воркер расчета не догонит игру
+        await self.settlement.wait_for_capacity()
+        
+        if not self.state.history_loaded:
+            await self.load_recent_crashes()
+        
+        self.game_id = await self.reserve_game_id()
         self.is_playing = True
         self.bets.clear()
+        self.auto_cashouts.clear()
+        self.crashed_bets = None
+        
+        # Точку краха определяем заранее, пока идет прием ставок
+        target_multiplier = await self.prepare_round_outcome()
+        # Кадры полета до точки из распределения кодируем один раз
+        self.flight_frames = FlightFrames(self.game_id, self.curve, self.tick_rate, self.curve.time_to(target_multiplier))
+        self.flight_frame = None
+        
+        # Снимок балансов игроков прошлого раунда - их ставки проверяются без запросов в БД
+        await self.load_balances(self.last_players)
+        self.accepting_bets = True
+        betting_started = self.clock.now()
+        self.state.start_betting(self.game_id, betting_started + BETTING_SECONDS)
         
         # Фаза приема ставок
         await self.ws_manager.send_crash_update({
             "game_id": self.game_id,
             "phase": "betting",
-            "time_remaining": 15,
+            "time_remaining": BETTING_SECONDS,
             "multiplier": 1.0
         })
         
-        for i in range(15, 0, -1):
-            await asyncio.sleep(1)
+        for i in range(BETTING_SECONDS, 0, -1):
+            await self.sleep_until(betting_started + BETTING_SECONDS - i + 1)
             if not self.is_playing:
+                self.accepting_bets = False
                 return
                 
             await self.ws_manager.send_crash_update({
@@ -55,48 +153,239 @@ class CrashGame:
                 "time_remaining": i,
                 "multiplier": 1.0
             })
-
-        # Генерируем множитель с RTP 92%
-        target_multiplier = self.generate_multiplier_rtp_92_v4()
         
-        # Фаза полета
-        current_multiplier = 1.0
-        base_step = 0.01  # Базовая скорость увеличения
-        
-        while current_multiplier < target_multiplier and self.is_playing:
-            # Вычисляем текущую скорость
-            self.current_speed = self.calculate_speed(current_multiplier)
+        # Прием закрыт; полет начинается, когда все ставки записаны и получили bet_id
+        self.accepting_bets = False
+        # Ждем только свои ставки: пачки других комнат не задерживают полет
+        if self.pending_writes:
+            await asyncio.gather(*self.pending_writes, return_exceptions=True)
+
+        # Фаза полета: множитель - функция прошедшего времени, крах ровно в crash_time
+        self.current_multiplier = 1.0
+        self.crash_point = target_multiplier
+        self.limit_multiplier = None
+        crash_time = self.curve.time_to(self.crash_point)
+        frames = self.flight_frames
+        frame_interval = 1.0 / frames.tick_rate
+        started = self.clock.now()
+        self.state.start_flight(started)
+        frame = 0
+        
+        while self.is_playing:
+            elapsed = frame * frame_interval
+            if elapsed >= crash_time or frame >= len(frames):
+                break
+            await self.sleep_until(started + elapsed)
             
-            # Увеличиваем множитель с учетом скорости
-            current_multiplier += base_step * self.current_speed
-            current_multiplier = round(current_multiplier, 2)
+            self.current_multiplier = frames.multipliers[frame]
+            self.current_speed = frames.speeds[frame]  # ← скорость уходит клиентам в кадре
+            self.flight_frame = frame
             
-            # Отправляем обновление с информацией о скорости
-            await self.ws_manager.send_crash_update({
-                "game_id": self.game_id,
-                "phase": "flying",
-                "multiplier": current_multiplier,
-                "time_remaining": 0,
-                "speed": self.current_speed  # ← Отправляем скорость клиентам
-            })
+            # Отправляем готовый кадр; клиент интерполирует по elapsed и rate до следующего
+            await self.ws_manager.send_flight_frame(frames, frame)
+            
+            # Авто-выводы и, если экспозиция дошла до лимита выплат, вывод остальных ставок на лимите
+            await self.send_auto_cashouts(self.current_multiplier)
+            await self.ws_manager.send_exposure(self.exposure_snapshot())
             
-            # Задержка с учетом скорости (чем выше скорость - тем меньше задержка)
-            await asyncio.sleep(0.1 / self.current_speed)
+            # Если цикл опоздал, пропускаем устаревшие кадры, а не сдвигаем кривую
+            frame = max(frame + 1, int((self.clock.now() - started) / frame_interval) + 1)
+        
+        await self.sleep_until(started + crash_time)
+        crash_point = self.crash_point
+        self.current_multiplier = crash_point
+        self.current_speed = self.calculate_speed(crash_point)
+        
+        # Авто-выводы ровно на точке краха еще выигрывают
+        await self.send_auto_cashouts(crash_point)
 
         # Крах - игра окончена
         self.is_playing = False
+        await self.ws_manager.send_exposure(self.exposure_snapshot(crashed=True))
         
-        # Сохраняем результаты
-        await self.save_game_results(target_multiplier)
+        # Результат рассылаем сразу, сохранение - в фоне
+        settled_bets = self.submit_settlement(target_multiplier, crash_point)
+        self.last_players = list(settled_bets)
+        self.crashed_bets = settled_bets
+        self.state.crash(crash_point, self.round_hash)
         
         await self.ws_manager.send_crash_result({
             "game_id": self.game_id,
-            "final_multiplier": target_multiplier,
-            "crashed_at": target_multiplier,
+            "final_multiplier": crash_point,
+            "crashed_at": crash_point,
             "timestamp": datetime.now().isoformat(),
-            "max_speed": self.current_speed  # ← Отправляем максимальную скорость
+            "max_speed": self.current_speed,  # ← Отправляем максимальную скорость
+            "round_hash": self.round_hash  # Раскрываем хеш раунда для проверки
         })
 
+    def snapshot(self, user_id: int = None) -> dict:
+        """Снимок раунда для клиента, подключившегося посреди раунда (O(1), из памяти)"""
+        bets = self.crashed_bets if self.state.phase == "crashed" and self.crashed_bets is not None else self.bets
+        snapshot = self.state.snapshot(self.clock.now(), self.curve, bets, self.crash_point, user_id)
+        snapshot["room"] = self.room_id
+        return snapshot
+
+    async def load_recent_crashes(self):
+        """Последние точки краха комнаты из БД - один запрос при старте, дальше история ведется в памяти"""
+        try:
+            self.state.load_history(await self.fetch_recent_crashes(CRASH_SNAPSHOT_HISTORY))
+        except Exception as e:
+            print(f"⚠️ История раундов для снимка не загружена: {e}")
+            self.state.history_loaded = True
+
+    async def fetch_recent_crashes(self, limit: int) -> list:
+        """[(game_id, crashed_at), ...] от новых к старым"""
+        async with AsyncSessionLocal() as db:
+            results = await async_crud.get_crash_game_history(db, limit, room=self.room_id)
+        return [(result.game_id, float(result.crashed_at)) for result in results]
+
+    async def prepare_round_outcome(self) -> float:
+        """Точка краха раунда: активный сэмплер настроек от u из цепочки хешей (или случайного u)"""
+        try:
+            # Из памяти; в БД только по истечении TTL или после инвалидации
+            await settings_cache.aget()
+        except Exception as e:
+            print(f"⚠️ Настройки не обновлены, используем текущий сэмплер: {e}")
+        # Берем ссылку один раз: смена настроек посреди раунда на него не влияет
+        sampler = sampler_registry.active
+        self.round_sampler = sampler_registry.spec(sampler)
+        self.round_hash = None
+        self.round_chain_index = None
+        if self.hash_chain is None:
+            return sampler.sample(random.random())
+
+        try:
+            chain_index, round_hash = await self.chain.take()
+        except Exception as e:
+            print(f"❌ Цепочка хешей недоступна, используем случайный множитель: {e}")
+            return sampler.sample(random.random())
+
+        self.round_hash = round_hash
+        self.round_chain_index = chain_index
+        return sampler.sample(link_to_uniform(round_hash))
+
+    async def reserve_game_id(self) -> int:
+        """Номер раунда, общий для всех комнат и процессов"""
+        if self.game_ids is not None:
+            return next(self.game_ids)
+        async with AsyncSessionLocal() as db:
+            return await async_crud.reserve_crash_game_id(db)
+
+    async def load_balances(self, user_ids: list):
+        """Снимок (telegram_id, баланс в валюте комнаты) для проверки ставок раунда"""
+        self.balances = {}
+        if not user_ids:
+            return
+        try:
+            # Выигрыши прошлого раунда могут быть еще не сохранены - добавляем их из очереди расчета
+            self.balances = self.settlement.with_unsettled_credits(await self.fetch_balances(user_ids))
+        except Exception as e:
+            print(f"⚠️ Снимок балансов не загружен: {e}")
+
+    async def fetch_balances(self, user_ids: list) -> dict:
+        """user_id -> (telegram_id, баланс в валюте комнаты) из БД"""
+        async with AsyncSessionLocal() as db:
+            return await async_crud.get_users_balances(db, user_ids, self.currency)
+
+    async def get_balance(self, user_id: int):
+        """Баланс из снимка; нового игрока подгружаем один раз за раунд"""
+        account = self.balances.get(user_id)
+        if account is None:
+            account = self.settlement.with_unsettled_credits(await self.fetch_balances([user_id])).get(user_id)
+            if account is not None:
+                self.balances[user_id] = account
+        return account
+
+    def fits_round_payout(self, user_id: int, amount: float) -> bool:
+        """Лимит выплат должен покрывать возврат всех ставок на 1.00x, иначе раунд крашился бы сразу"""
+        if self.max_round_payout <= 0:
+            return True
+        previous = self.bets.get(user_id)
+        # Повторная ставка игрока заменяет прежнюю
+        stake = self.bets.total_bet - (previous.amount if previous is not None else 0.0) + amount
+        return stake <= self.max_round_payout
+
+    def payout_limit(self) -> Optional[float]:
+        """Множитель, на котором exposure(x) = выплачено + невыведено * x доходит до лимита выплат"""
+        pending = self.bets.pending_amount
+        if self.max_round_payout <= 0 or pending <= 0:
+            return None
+        limit = math.floor((self.max_round_payout - self.bets.total_payout) / pending * 100) / 100
+        # Ставки раунда не превышают лимит (fits_round_payout), поэтому возврат на 1.00x всегда покрыт
+        return max(limit, 1.0)
+
+    def cash_out_at_limit(self, limit: float) -> list:
+        """Лимит выплат достигнут: невыведенные ставки выводятся на limit, а не проигрывают"""
+        cashouts = []
+        for bet in self.bets.values():
+            if bet.cashed_out:
+                continue
+            self.bets.cash_out(bet.user_id, limit)
+            cashouts.append({
+                "user_id": bet.user_id,
+                "multiplier": limit,
+                "amount": bet.amount,
+                "win_amount": bet.profit
+            })
+        self.limit_multiplier = limit
+        self.limit_rounds += 1
+        print(f"🛑 Раунд {self.game_id}: лимит выплат {self.max_round_payout}, "
+              f"{len(cashouts)} ставок выведено на {limit}x")
+        return cashouts
+
+    def exposure_snapshot(self, crashed: bool = False) -> dict:
+        """Текущая экспозиция раунда - O(1) по итогам книги ставок"""
+        return {
+            "game_id": self.game_id,
+            "multiplier": round(self.current_multiplier, 2),
+            "exposure": round(self.bets.exposure(self.current_multiplier), 2),
+            "pending_amount": self.bets.pending_amount,
+            "total_payout": self.bets.total_payout,
+            "total_bet": self.bets.total_bet,
+            "players": len(self.bets),
+            "max_round_payout": self.max_round_payout or None,
+            "cap_multiplier": self.limit_multiplier or self.payout_limit(),
+            "crashed": crashed
+        }
+
+    def process_auto_cashouts(self, multiplier: float) -> list:
+        """Выводим все ставки, чей auto_cashout достигнут: O(k log n) на k сработавших"""
+        cashouts = []
+        while self.auto_cashouts and self.auto_cashouts[0][0] <= multiplier:
+            target, user_id = heapq.heappop(self.auto_cashouts)
+            bet = self.bets.get(user_id)
+            # Ставку могли уже вывести вручную или перезаписать новой
+            if bet is None or bet.cashed_out or bet.auto_cashout != target:
+                continue
+            
+            self.bets.cash_out(user_id, target)
+            cashouts.append({
+                "user_id": user_id,
+                "multiplier": target,
+                "amount": bet.amount,
+                "win_amount": bet.profit
+            })
+        return cashouts
+
+    async def send_auto_cashouts(self, multiplier: float):
+        """Одно пакетное уведомление на тик, если какие-то авто-выводы сработали"""
+        cashouts = []
+        while True:
+            # Авто-вывод выше лимита выплат не срабатывает; выводы ниже лимита его только поднимают
+            limit = self.payout_limit()
+            batch = self.process_auto_cashouts(multiplier if limit is None else min(multiplier, limit))
+            if not batch:
+                break
+            cashouts += batch
+        if limit is not None and multiplier >= limit:
+            cashouts += self.cash_out_at_limit(limit)
+        if cashouts:
+            await self.ws_manager.send_auto_cashouts({
+                "game_id": self.game_id,
+                "multiplier": round(multiplier, 2),
+                "cashouts": cashouts
+            })
+
     def generate_multiplier_rtp_92(self) -> float:
         """
         Генерация множителя с RTP 92%
@@ -251,137 +540,127 @@ class CrashGame:
         return round(random.uniform(1.1, 10.0), 2)
 
 
-    async def save_game_results(self, final_multiplier: float):
-        """Сохраняем результаты игры в базу данных"""
-        db = SessionLocal()
-        try:
-            total_players = len(self.bets)
-            total_bet = sum(bet['amount'] for bet in self.bets.values())
-            total_payout = 0.0
-            
-            # Сохраняем результат игры
-            game_result = crud.create_crash_game_result(
-                db=db,
-                game_id=self.game_id,
-                multiplier=final_multiplier,
-                crashed_at=final_multiplier,
-                total_players=total_players,
-                total_bet=total_bet,
-                total_payout=total_payout
-            )
-            
-            db.commit()
-            db.refresh(game_result)
-            
-            # Обрабатываем каждую ставку
-            for user_id, bet_data in self.bets.items():
-                # ✅ Используем get_user_by_id которую сейчас добавим в crud.py
-                user = crud.get_user_by_id(db, user_id)
-                if not user:
-                    print(f"❌ User {user_id} not found in DB")
-                    continue
-                
-                # ✅ Используем bet_id который сохранили при размещении ставки
-                if 'bet_id' in bet_data:
-                    # Определяем результат ставки
-                    if bet_data.get('cashed_out', False):
-                        cashout_multiplier = bet_data.get('cashout_multiplier', 1.0)
-                        win_amount = bet_data['amount'] * cashout_multiplier
-                        status = 'won'
-                    elif final_multiplier >= (bet_data.get('auto_cashout', 0) or 0):
-                        win_amount = bet_data['amount'] * bet_data['auto_cashout']
-                        status = 'won'
-                    else:
-                        win_amount = 0
-                        status = 'lost'
-                    
-                    # Обновляем ставку в БД
-                    crud.update_crash_bet_result(
-                        db=db,
-                        bet_id=bet_data['bet_id'],
-                        crash_coefficient=final_multiplier,
-                        win_amount=win_amount,
-                        status=status
-                    )
-                    
-                    # Обновляем баланс пользователя если выигрыш
-                    if win_amount > 0:
-                        crud.update_user_balance(
-                            db=db,
-                            telegram_id=user.telegram_id,
-                            currency='stars',
-                            amount=win_amount
-                        )
-                    
-                    total_payout += win_amount
-            
-            # Обновляем общий выигрыш в результате игры
-            game_result.total_payout = total_payout
-            db.commit()
-            
-            print(f"✅ Результаты игры сохранены: Game ID {self.game_id}")
-            
-        except Exception as e:
-            print(f"❌ Ошибка сохранения результатов игры: {e}")
-            db.rollback()
-        finally:
-            db.close()
+    def submit_settlement(self, final_multiplier: float, crashed_at: float):
+        """Отдаем замороженную книгу ставок раунда воркеру расчета, следующий раунд пишет в новую"""
+        bets = self.bets
+        self.bets = BetBook()
+        self.settlement.submit(RoundSettlement(
+            game_id=self.game_id,
+            multiplier=final_multiplier,
+            crashed_at=crashed_at,
+            bets=bets,
+            round_hash=self.round_hash,
+            chain_index=self.round_chain_index,
+            sampler=self.round_sampler,
+            room_id=self.room_id,
+            currency=self.currency,
+            payout_limit=self.limit_multiplier
+        ))
+        return bets
 
     def generate_multiplier(self) -> float:
         """Генерация случайного множителя"""
         return round(random.uniform(1.1, 10.0), 2)
 
-    async def place_bet(self, user_id: int, amount: float, auto_cashout: float = None):
-        """Размещение ставки с сохранением в БД"""
+    async def place_bet(self, user_id: int, amount: float, auto_cashout: float = None, prepaid: bool = False):
+        """Размещение ставки: проверка по снимку баланса, запись в БД - пачкой; True - ставка записана
+
+        prepaid - ставка уже списана с баланса в БД (WebSocket), снимок для проверки не нужен.
+        """
         print(f"🎯 [CrashGame] place_bet called: user_id={user_id}, amount={amount}")
 
-        db = SessionLocal()
+        if not self.accepting_bets:
+            print(f"❌ [CrashGame] Betting is closed for game {self.game_id}")
+            return False
+        # Раунд и книга, в которые принимается ставка: пока ждем баланс, прием может закрыться
+        game_id = self.game_id
+        book = self.bets
+        if amount <= 0:
+            print(f"❌ [CrashGame] Invalid bet amount: {amount}")
+            return False
+        if (self.min_bet and amount < self.min_bet) or (self.max_bet and amount > self.max_bet):
+            print(f"❌ [CrashGame] Bet {amount} outside room '{self.room_id}' limits")
+            return False
+
         try:
             # ✅ Важно: user_id должен быть ID из БД, а не telegram_id!
-            user = db.query(User).filter(User.id == user_id).first()
-            if not user:
+            account = await self.get_balance(user_id)
+            if account is None:
                 print(f"❌ [CrashGame] User {user_id} not found by ID")
                 return False
 
-            print(f"✅ [CrashGame] User found: ID {user.id}, Telegram ID {user.telegram_id}")
-
-            # Создаем запись о ставке в БД
-            bet = crud.add_crash_bet(
-                db=db,
-                user_id=user.id,  # ✅ ID из БД
-                telegram_id=user.telegram_id,  # ✅ Telegram ID
-                bet_amount=amount,
-                status='pending'
-            )
-
-            # Сохраняем в активные ставки
-            self.bets[user.id] = {
-                "amount": amount,
-                "auto_cashout": auto_cashout,
-                "placed_at": datetime.now(),
-                "cashed_out": False,
-                "profit": 0,
-                "bet_id": bet.id  # ✅ Сохраняем ID ставки
-            }
-
-            print(f"✅ [CrashGame] Bet added to active bets: {bet.id}")
+            telegram_id, balance = account
+            if not prepaid and amount > balance:
+                print(f"❌ [CrashGame] Insufficient balance: user {user_id}, {balance} < {amount}")
+                return False
+            if not self.fits_round_payout(user_id, amount):
+                print(f"❌ [CrashGame] Bet {amount} exceeds round payout limit {self.max_round_payout} "
+                      f"in room '{self.room_id}'")
+                return False
+
+            if not self.accepting_bets or self.game_id != game_id or self.bets is not book:
+                print(f"❌ [CrashGame] Betting closed for game {game_id} while bet of user {user_id} was checked")
+                return False
+
+            # Сохраняем в активные ставки; bet_id проставит BetWriter
+            auto_cashout = float(auto_cashout) if auto_cashout else None
+            bet = book.place(user_id, amount, auto_cashout)
+            if auto_cashout:
+                heapq.heappush(self.auto_cashouts, (auto_cashout, user_id))
+
+            written = self.bet_writer.submit(bet, telegram_id)
+            self.pending_writes.add(written)
+            written.add_done_callback(self.pending_writes.discard)
+            try:
+                await written
+            except Exception as e:
+                # Незаписанная ставка не должна влиять на экспозицию и авто-выводы
+                book.remove(bet)
+                print(f"❌ [CrashGame] Bet of user {user_id} not saved, removed from round: {e}")
+                return False
+            print(f"✅ [CrashGame] Bet added to active bets: user {user_id}")
             return True
 
         except Exception as e:
             print(f"❌ [CrashGame] Error in place_bet: {e}")
             import traceback
             traceback.print_exc()
-            db.rollback()
             return False
-        finally:
-            db.close()
+
+    async def abort_round(self):
+        """Раунд прерван (остановка, потеря лидерства): записанные ставки закрываются через расчет"""
+        self.accepting_bets = False
+        self.is_playing = False
+        # Ставки, которые еще пишутся, попадут в книгу прерванного раунда
+        if self.pending_writes:
+            await asyncio.gather(*self.pending_writes, return_exceptions=True)
+        bets = self.bets
+        if not len(bets) and not bets.cancelled:
+            return
+        self.bets = BetBook()
+        self.settlement.submit(RoundSettlement(
+            game_id=self.game_id,
+            multiplier=self.current_multiplier,
+            crashed_at=self.current_multiplier,
+            bets=bets,
+            round_hash=self.round_hash,
+            chain_index=self.round_chain_index,
+            sampler=self.round_sampler,
+            room_id=self.room_id,
+            currency=self.currency,
+            interrupted=True
+        ))
+        print(f"⏹️ Раунд {self.game_id} в комнате '{self.room_id}' прерван: "
+              f"{len(bets)} ставок закрываются с возвратом невыведенных")
+
+    def cancel_bet(self, bet) -> bool:
+        """Снимаем ставку, пока идет прием; после начала полета ставка остается в раунде"""
+        if not self.accepting_bets or self.bets.get(bet.user_id) is not bet:
+            return False
+        self.bets.remove(bet)
+        print(f"↩️ [CrashGame] Bet of user {bet.user_id} cancelled in game {self.game_id}")
+        return True
 
     async def cash_out(self, user_id: int, cashout_multiplier: float):
         """Вывод средств с обновлением в БД"""
-        if user_id not in self.bets:
-            raise Exception("No active bet found")
-        
-        bet_data = self.bets[user_id]
-        bet_data['cashed_out'] = True
-        bet_data['cashout_multiplier'] = cashout_multiplier
-        bet_data['profit'] = bet_data['amount'] * cashout_multiplier
\ No newline at end of file
+        self.bets.cash_out(user_id, cashout_multiplier)
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""
+Бинарный протокол тиков /ws/crash.
+
+Клиент, передавший подпротокол BINARY_SUBPROTOCOL (Sec-WebSocket-Protocol),
+получает тики crash_update (прием ставок и полет) бинарными кадрами
+фиксированной длины вместо JSON. Редкие сообщения (crash_snapshot,
+crash_result, auto_cashout, bets_batch) остаются JSON-текстом. Клиенты без
+подпротокола получают прежний JSON.
+
+Кадр тика, little-endian, TICK_FRAME.size = 16 байт:
+    u8  тип сообщения (MESSAGE_TICK)
+    u32 game_id
+    u8  фаза (PHASES)
+    u32 множитель * 100
+    u32 время полета, мс
+    u8  ступень скорости (индекс в crash_curve.SPEED_TIERS)
+    u8  секунд до конца приема ставок
+
+Сравнение размера и стоимости кодирования:
+    python -m app.services.crash_protocol --frames 100000
+"""
+import argparse
+import json
+import struct
+import time
+
+from app.services.crash_curve import CrashCurve, crash_curve
+
+BINARY_SUBPROTOCOL = "crash.bin.v1"
+
+MESSAGE_TICK = 1
+PHASES = {"waiting": 0, "betting": 1, "flying": 2, "crashed": 3}
+
+TICK_FRAME = struct.Struct("<BIBIIBB")
+
+
+def encode_tick(game_id: int, phase: str, multiplier: float, elapsed: float, tier: int,
+                time_remaining: int = 0) -> bytes:
+    return TICK_FRAME.pack(
+        MESSAGE_TICK,
+        game_id,
+        PHASES[phase],
+        int(round(multiplier * 100)),
+        int(round(elapsed * 1000)),
+        tier,
+        time_remaining
+    )
+
+
+def benchmark(frames: int = 10_000, curve: CrashCurve = crash_curve) -> dict:
+    """Байт на кадр и время кодирования тика полета: JSON (как send_crash_update) против struct"""
+    samples = []
+    for index in range(frames):
+        elapsed = index / 10.0 % 120
+        multiplier = curve.multiplier_at(elapsed)
+        samples.append((index, round(multiplier, 2), curve.speed_at(multiplier), round(elapsed, 3),
+                        curve.rate_at(multiplier), curve.tier_at(multiplier)))
+
+    started = time.perf_counter()
+    json_bytes = 0
+    for game_id, multiplier, speed, elapsed, rate, _ in samples:
+        json_bytes += len(json.dumps({
+            "type": "crash_update",
+            "data": {
+                "game_id": game_id,
+                "phase": "flying",
+                "multiplier": multiplier,
+                "time_remaining": 0,
+                "speed": speed,
+                "elapsed": elapsed,
+                "rate": rate
+            }
+        }))
+    json_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    binary_bytes = 0
+    for game_id, multiplier, _, elapsed, _, tier in samples:
+        binary_bytes += len(encode_tick(game_id, "flying", multiplier, elapsed, tier))
+    binary_seconds = time.perf_counter() - started
+
+    return {
+        "frames": frames,
+        "json": {
+            "bytes_per_frame": round(json_bytes / frames, 1),
+            "encode_us_per_frame": round(json_seconds / frames * 1e6, 3)
+        },
+        "binary": {
+            "subprotocol": BINARY_SUBPROTOCOL,
+            "bytes_per_frame": binary_bytes / frames,
+            "encode_us_per_frame": round(binary_seconds / frames * 1e6, 3)
+        },
+        "size_ratio": round(binary_bytes / json_bytes, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crash tick frame size and encode cost: JSON vs binary")
+    parser.add_argument("--frames", type=int, default=100_000)
+    args = parser.parse_args()
+
+    report = benchmark(args.frames)
+    print(f"📦 {report['frames']:,} кадров полета")
+    for name in ("json", "binary"):
+        row = report[name]
+        print(f"   {name:>6}: {row['bytes_per_frame']:>6} байт/кадр, {row['encode_us_per_frame']:>7} мкс/кадр")
+    print(f"   binary / json = {report['size_ratio']}")
+
+
+if __name__ == "__main__":
+    main()
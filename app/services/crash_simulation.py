@@ -0,0 +1,366 @@
+"""
+Симуляция краш-игры в виртуальном времени.
+
+Настоящий CrashGame (прием ставок, полет, авто-выводы, лимит выплат,
+пакетная запись ставок и фоновый расчет) работает на VirtualClock, а БД
+заменена хранилищем в памяти. Раунд, который в проде длится 20+ секунд,
+проходит за миллисекунды, поэтому длинные прогоны и замер пропускной
+способности движка укладываются в секунды.
+
+Запуск:
+    python -m app.services.crash_simulation --rounds 10000 --rooms 4 --bets 50
+"""
+import argparse
+import asyncio
+import contextlib
+import heapq
+import itertools
+import math
+import os
+import random
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from app.database import async_crud
+from app.services.bet_writer import BetWriter
+from app.services.clock import VirtualClock
+from app.services.crash_game import CrashGame, ChainCursor, BETTING_SECONDS, CRASH_TICK_RATE
+from app.services.multiplier_sampler import DEFAULT_DISTRIBUTION
+from app.services.provably_fair import CRASH_RTP, MAX_MULTIPLIER
+from app.services.settings_cache import settings_cache
+from app.services.settlement_worker import SettlementWorker, RoundSettlement
+
+BET_AMOUNTS = (1.0, 5.0, 10.0, 25.0, 100.0)
+
+
+class MemoryStore:
+    """Балансы, ставки и раунды в памяти вместо users / crash_bet_history / crash_game_results"""
+
+    def __init__(self, players: int, balance: float):
+        self.balances: Dict[int, float] = {user_id: balance for user_id in range(1, players + 1)}
+        self.initial_total = balance * players
+        self.bet_ids = itertools.count(1)
+        self.open_bets: Dict[int, float] = {}  # bet_id -> amount
+        self.rounds: List[tuple] = []  # (game_id, room, multiplier, crashed_at)
+        self.wagered = 0.0
+        self.paid = 0.0
+        self.settled_bets = 0
+
+    def debit(self, user_id: int, amount: float) -> bool:
+        """Списание ставки (в проде - /api/crash/bet до place_bet)"""
+        if self.balances.get(user_id, 0.0) < amount:
+            return False
+        self.balances[user_id] -= amount
+        self.wagered += amount
+        return True
+
+    def refund(self, user_id: int, amount: float):
+        self.balances[user_id] += amount
+        self.wagered -= amount
+
+    def get_balances(self, user_ids: list) -> dict:
+        # telegram_id совпадает с user_id
+        return {user_id: (user_id, self.balances[user_id]) for user_id in user_ids if user_id in self.balances}
+
+    def insert_bets(self, rows: list) -> list:
+        ids = []
+        for user_id, _, amount in rows:
+            if user_id not in self.balances:
+                ids.append(None)
+                continue
+            bet_id = next(self.bet_ids)
+            self.open_bets[bet_id] = amount
+            ids.append(bet_id)
+        return ids
+
+    def settle(self, settlement: RoundSettlement, bet_results: list, credits: dict, total_payout: float):
+        for bet_id, _, _ in bet_results:
+            del self.open_bets[bet_id]
+        for user_id, amount in credits.items():
+            self.balances[user_id] += amount
+        self.paid += total_payout
+        self.settled_bets += len(bet_results)
+        # Та же модель, что пишет settle_crash_round: ошибка в маппинге колонок видна и без БД
+        row = async_crud.crash_game_result(
+            settlement.game_id, settlement.multiplier, settlement.crashed_at, len(settlement.bets),
+            settlement.bets.total_bet, total_payout, round_hash=settlement.round_hash,
+            chain_index=settlement.chain_index, sampler=settlement.sampler, room_id=settlement.room_id,
+            payout_limit=settlement.payout_limit
+        )
+        self.rounds.append((row.game_id, row.room, row.multiplier, row.crashed_at))
+
+
+class MemoryBetWriter(BetWriter):
+    def __init__(self, store: MemoryStore, clock):
+        super().__init__(clock=clock)
+        self.store = store
+
+    async def insert(self, rows: list) -> list:
+        return self.store.insert_bets(rows)
+
+
+class MemorySettlementWorker(SettlementWorker):
+    def __init__(self, store: MemoryStore):
+        super().__init__()
+        self.store = store
+
+    async def save(self, settlement: RoundSettlement, bet_results: list, credits: dict, total_payout: float):
+        self.store.settle(settlement, bet_results, credits, total_payout)
+
+
+class SimulatedCrashGame(CrashGame):
+    """CrashGame, читающий балансы из MemoryStore и сохраняющий раунды в него"""
+
+    def __init__(self, channel, store: MemoryStore, **kwargs):
+        super().__init__(channel, **kwargs)
+        self.store = store
+        self.settlement = MemorySettlementWorker(store)
+
+    async def fetch_balances(self, user_ids: list) -> dict:
+        return self.store.get_balances(user_ids)
+
+    async def fetch_recent_crashes(self, limit: int) -> list:
+        rounds = [r for r in self.store.rounds if r[1] == self.room_id][-limit:]
+        return [(game_id, crashed_at) for game_id, _, _, crashed_at in reversed(rounds)]
+
+
+class SimulatedPlayers:
+    """Игроки комнаты: ставят в случайные моменты приема ставок и выводят вручную по кадрам полета"""
+
+    def __init__(self, store: MemoryStore, clock: VirtualClock, rng: random.Random,
+                 bets_per_round: int, auto_share: float):
+        self.store = store
+        self.clock = clock
+        self.rng = rng
+        self.bets_per_round = bets_per_round
+        self.auto_share = auto_share
+        self.game: Optional[CrashGame] = None
+        self.betting_game_id = None
+        self.manual_targets = []  # min-heap (target, user_id) текущего раунда
+        self.placed = 0
+        self.rejected = 0
+        self.manual_cashouts = 0
+
+    def target(self) -> float:
+        # Цели вывода игроков: в основном 1.2x-3x, изредка десятки
+        return round(1.01 + self.rng.expovariate(0.8), 2)
+
+    async def place_round_bets(self):
+        game = self.game
+        users = self.rng.sample(list(self.store.balances), min(self.bets_per_round, len(self.store.balances)))
+        started = self.clock.now()
+        offsets = sorted(self.rng.uniform(0, BETTING_SECONDS - 1) for _ in users)
+
+        for user_id, offset in zip(users, offsets):
+            await self.clock.sleep_until(started + offset)
+            amount = self.rng.choice(BET_AMOUNTS)
+            if not self.store.debit(user_id, amount):
+                self.rejected += 1
+                continue
+
+            auto_cashout = self.target() if self.rng.random() < self.auto_share else None
+            if not await game.place_bet(user_id, amount, auto_cashout):
+                self.store.refund(user_id, amount)
+                self.rejected += 1
+                continue
+
+            self.placed += 1
+            if auto_cashout is None:
+                heapq.heappush(self.manual_targets, (self.target(), user_id))
+
+    async def on_update(self, data: dict):
+        if data["phase"] == "betting" and data["game_id"] != self.betting_game_id:
+            self.betting_game_id = data["game_id"]
+            self.manual_targets = []
+            asyncio.ensure_future(self.place_round_bets())
+        elif data["phase"] == "flying":
+            multiplier = data["multiplier"]
+            while self.manual_targets and self.manual_targets[0][0] <= multiplier:
+                _, user_id = heapq.heappop(self.manual_targets)
+                bet = self.game.bets.get(user_id)
+                if bet is not None and not bet.cashed_out:
+                    await self.game.cash_out(user_id, multiplier)
+                    self.manual_cashouts += 1
+
+
+class SimulatedChannel:
+    """Канал комнаты без WebSocket: считает кадры и отдает их игрокам"""
+
+    def __init__(self, players: SimulatedPlayers):
+        self.players = players
+        self.frames = Counter()
+
+    async def send_crash_update(self, data: dict):
+        self.frames[data["phase"]] += 1
+        await self.players.on_update(data)
+
+    async def send_flight_frame(self, frames, index: int):
+        self.frames["flying"] += 1
+        await self.players.on_update({
+            "game_id": frames.game_id,
+            "phase": "flying",
+            "multiplier": round(frames.multipliers[index], 2)
+        })
+
+    async def send_crash_result(self, data: dict):
+        self.frames["crashed"] += 1
+
+    async def send_auto_cashouts(self, data: dict):
+        self.frames["auto_cashouts"] += 1
+
+    async def send_exposure(self, data: dict):
+        self.frames["exposure"] += 1
+
+    async def send_bet_update(self, bet_data: dict):
+        self.frames["bet_update"] += 1
+
+
+def configure_sampler(distribution: str, rtp: float, min_multiplier: float, max_multiplier: float):
+    """Сэмплер симуляции через кэш настроек, без БД и без истечения TTL"""
+    settings_cache.ttl = math.inf
+    settings_cache.store(SimpleNamespace(
+        crash_distribution=distribution,
+        crash_rtp=rtp,
+        crash_min_multiplier=min_multiplier,
+        crash_max_multiplier=max_multiplier
+    ))
+
+
+async def simulate(
+    rounds: int = 1000,
+    rooms: int = 1,
+    players: int = 1000,
+    bets_per_round: int = 50,
+    balance: float = 1_000_000.0,
+    auto_share: float = 0.5,
+    max_round_payout: float = 0.0,
+    tick_rate: float = CRASH_TICK_RATE,
+    seed: Optional[int] = None
+) -> dict:
+    """Прогоняем rounds раундов в каждой из rooms комнат и сверяем деньги в хранилище"""
+    rng = random.Random(seed)
+    random.seed(seed)  # множитель без цепочки хешей берется из random.random()
+    clock = VirtualClock()
+    store = MemoryStore(players, balance)
+    bet_writer = MemoryBetWriter(store, clock)
+    chain = ChainCursor(None)
+    game_ids = itertools.count(1)
+
+    games = []
+    channels = []
+    player_groups = []
+    for index in range(rooms):
+        room_players = SimulatedPlayers(store, clock, rng, bets_per_round, auto_share)
+        channel = SimulatedChannel(room_players)
+        game = SimulatedCrashGame(
+            channel, store,
+            room_id=f"sim{index}",
+            clock=clock,
+            chain=chain,
+            bet_writer=bet_writer,
+            game_ids=game_ids
+        )
+        game.max_round_payout = max_round_payout
+        game.tick_rate = tick_rate
+        room_players.game = game
+        games.append(game)
+        channels.append(channel)
+        player_groups.append(room_players)
+
+    async def run_room(game: CrashGame):
+        for _ in range(rounds):
+            await game.run_game_cycle()
+        await game.settlement.drain()
+
+    started = time.perf_counter()
+    await clock.run(asyncio.gather(*(run_room(game) for game in games)))
+    elapsed = time.perf_counter() - started
+
+    total_rounds = len(store.rounds)
+    balance_total = sum(store.balances.values())
+    expected_total = store.initial_total - store.wagered + store.paid
+    frames = sum((channel.frames for channel in channels), Counter())
+    return {
+        "rooms": rooms,
+        "rounds": total_rounds,
+        "bets": sum(group.placed for group in player_groups),
+        "rejected_bets": sum(group.rejected for group in player_groups),
+        "manual_cashouts": sum(group.manual_cashouts for group in player_groups),
+        "wagered": round(store.wagered, 2),
+        "paid": round(store.paid, 2),
+        "rtp": store.paid / store.wagered if store.wagered else 0.0,
+        "house_profit": round(store.wagered - store.paid, 2),
+        "mean_crash_point": sum(r[3] for r in store.rounds) / total_rounds if total_rounds else 0.0,
+        "capped_rounds": sum(game.limit_rounds for game in games),
+        "frames": dict(frames),
+        # Все ставки рассчитаны и деньги сходятся
+        "unsettled_bets": len(store.open_bets),
+        "balance_mismatch": round(balance_total - expected_total, 6),
+        "virtual_seconds": round(clock.now(), 1),
+        "elapsed_seconds": round(elapsed, 3),
+        "rounds_per_second": round(total_rounds / elapsed, 1) if elapsed else None,
+        "speedup": round(clock.now() / elapsed, 1) if elapsed else None,
+        "clock": clock.get_stats(),
+        "bet_writer": bet_writer.get_stats()
+    }
+
+
+def print_report(report: dict):
+    print(f"\n🧪 {report['rounds']:,} раундов в {report['rooms']} комн. за {report['elapsed_seconds']} с "
+          f"({report['rounds_per_second']} раундов/с, виртуально {report['virtual_seconds']:,} с, "
+          f"x{report['speedup']:,})")
+    print(f"   Ставок: {report['bets']:,} (отклонено {report['rejected_bets']:,}), "
+          f"ручных выводов: {report['manual_cashouts']:,}")
+    print(f"   Поставлено {report['wagered']:,}, выплачено {report['paid']:,}, "
+          f"RTP {report['rtp']:.2%}, прибыль {report['house_profit']:,}")
+    print(f"   Средняя точка краха {report['mean_crash_point']:.3f}, выплата по лимиту: {report['capped_rounds']} раундов")
+    print(f"   Кадры: {report['frames']}")
+    status = "✅" if report["unsettled_bets"] == 0 and abs(report["balance_mismatch"]) < 0.01 else "❌"
+    print(f"   {status} Нерассчитанных ставок: {report['unsettled_bets']}, "
+          f"расхождение балансов: {report['balance_mismatch']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Virtual-time crash game simulation with an in-memory store")
+    parser.add_argument("--rounds", type=int, default=1000, help="rounds per room")
+    parser.add_argument("--rooms", type=int, default=1)
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--bets", type=int, default=50, help="bets per round per room")
+    parser.add_argument("--balance", type=float, default=1_000_000.0)
+    parser.add_argument("--auto-share", type=float, default=0.5, help="share of bets with auto cashout")
+    parser.add_argument("--max-round-payout", type=float, default=0.0)
+    # Почти все время раунда - кадры полета; реже кадры - больше раундов в секунду, грубее ручные выводы
+    parser.add_argument("--tick-rate", type=float, default=CRASH_TICK_RATE, help="flight frames per virtual second")
+    parser.add_argument("--distribution", default=DEFAULT_DISTRIBUTION)
+    parser.add_argument("--rtp", type=float, default=CRASH_RTP)
+    parser.add_argument("--min-multiplier", type=float, default=1.0)
+    parser.add_argument("--max-multiplier", type=float, default=MAX_MULTIPLIER)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--verbose", action="store_true", help="keep per-bet game logs")
+    args = parser.parse_args()
+
+    configure_sampler(args.distribution, args.rtp, args.min_multiplier, args.max_multiplier)
+    run = simulate(
+        rounds=args.rounds,
+        rooms=args.rooms,
+        players=args.players,
+        bets_per_round=args.bets,
+        balance=args.balance,
+        auto_share=args.auto_share,
+        max_round_payout=args.max_round_payout,
+        tick_rate=args.tick_rate,
+        seed=args.seed
+    )
+    if args.verbose:
+        report = asyncio.run(run)
+    else:
+        # Логи CrashGame на каждую ставку замедляют прогон в разы
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            report = asyncio.run(run)
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
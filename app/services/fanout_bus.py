@@ -0,0 +1,203 @@
+"""
+Шина рассылки WebSocket между воркерами.
+
+С несколькими воркерами uvicorn (--workers / WEB_CONCURRENCY) у каждого
+процесса свои сокеты, а игра должна идти в одном. Процесс игры (ведущий)
+кладет уже закодированные кадры комнат в шину, а WebSocketManager каждого
+ретранслятора раздает их своим клиентам, ничего не кодируя заново. В
+обратную сторону ретрансляторы пересылают ведущему команды своих клиентов
+(ставка, снимок раунда при подключении) и получают ответ адресно.
+
+Транспорт задается WS_FANOUT_BUS:
+  - off   - один процесс, шины нет (по умолчанию);
+  - local - Unix datagram сокеты (LocalPubSub), без внешних сервисов,
+            воркеры на одной машине;
+  - redis - Redis pub/sub (WS_FANOUT_REDIS_URL), если установлен пакет redis.
+
+Какой процесс ведет игру, решают выборы лидера (leadership).
+"""
+import asyncio
+import os
+import socket
+import struct
+from typing import Callable, Dict, Tuple
+
+from app.services.local_pubsub import LocalPubSub, MAX_MESSAGE_SIZE
+
+WS_FANOUT_BUS = os.getenv("WS_FANOUT_BUS", "off")
+WS_FANOUT_REDIS_URL = os.getenv("WS_FANOUT_REDIS_URL", "redis://localhost:6379/0")
+WS_FANOUT_CHANNEL = os.getenv("WS_FANOUT_CHANNEL", "ws-fanout")
+
+# Конверт сообщения шины: тип, флаги, длина адреса (комната, канал или воркер), длина текста;
+# дальше адрес, текстовый кадр и бинарный кадр до конца сообщения
+ENVELOPE = struct.Struct("<BBBI")
+
+KIND_ROOM_FRAME = 1      # кадр комнаты краш-игры: текст + бинарный тик
+KIND_CHANNEL_FRAME = 2   # кадр канала broadcast (general, user_<id>)
+KIND_ADMIN_FRAME = 3     # экспозиция для админов
+KIND_COMMAND = 4         # команда ретранслятора ведущему, адрес - воркер для ответа
+KIND_REPLY = 5           # ответ ведущего на команду
+
+FLAG_COALESCE = 1
+
+
+def pack(kind: int, address: str, text: str = "", binary: bytes = b"", coalesce: bool = False) -> bytes:
+    address_bytes = address.encode()
+    text_bytes = text.encode()
+    return b"".join((
+        ENVELOPE.pack(kind, FLAG_COALESCE if coalesce else 0, len(address_bytes), len(text_bytes)),
+        address_bytes,
+        text_bytes,
+        binary
+    ))
+
+
+def unpack(message: bytes) -> Tuple[int, bool, str, str, bytes]:
+    """(тип, coalesce, адрес, текст, бинарный кадр)"""
+    kind, flags, address_size, text_size = ENVELOPE.unpack_from(message)
+    position = ENVELOPE.size
+    address = message[position:position + address_size].decode()
+    position += address_size
+    text = message[position:position + text_size].decode()
+    position += text_size
+    return kind, bool(flags & FLAG_COALESCE), address, text, message[position:]
+
+
+class BusStats:
+    def __init__(self):
+        self.published = 0
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "published": self.published,
+            "sent": self.sent,
+            "received": self.received,
+            "dropped": self.dropped
+        }
+
+
+class LocalBus:
+    """Шина через Unix datagram сокеты: воркеры одной машины, без внешних сервисов"""
+
+    name = "local"
+
+    def __init__(self, channel: str = WS_FANOUT_CHANNEL):
+        self.pubsub = LocalPubSub(channel)
+        self.worker_id = str(os.getpid())
+        self.stats = BusStats()
+
+    async def start(self, handler: Callable[[bytes], None]):
+        self.pubsub.subscribe(self._counting(handler))
+        self.pubsub.start()
+
+    def _counting(self, handler):
+        def on_message(message: bytes):
+            self.stats.received += 1
+            handler(message)
+        return on_message
+
+    def publish(self, message: bytes):
+        """Всем остальным воркерам"""
+        if len(message) > MAX_MESSAGE_SIZE:
+            self.stats.dropped += 1
+            print(f"⚠️ Сообщение шины больше {MAX_MESSAGE_SIZE} байт не отправлено")
+            return
+        # Получатели с полным буфером теряют кадр - LocalPubSub считает такие отправки
+        dropped = self.pubsub.dropped
+        self.pubsub.publish(message)
+        self.stats.published += 1
+        self.stats.dropped += self.pubsub.dropped - dropped
+
+    def send(self, worker_id: str, message: bytes):
+        """Одному воркеру"""
+        if len(message) <= MAX_MESSAGE_SIZE and self.pubsub.send(int(worker_id), message):
+            self.stats.sent += 1
+        else:
+            self.stats.dropped += 1
+
+    async def close(self):
+        self.pubsub.close()
+
+
+class RedisBus:
+    """Шина через Redis pub/sub: воркеры на разных машинах"""
+
+    name = "redis"
+
+    def __init__(self, url: str = WS_FANOUT_REDIS_URL, channel: str = WS_FANOUT_CHANNEL):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.channel = channel
+        self.worker_id = f"{socket.gethostname()}.{os.getpid()}"
+        # Redis возвращает подписчику и его собственные публикации - отмечаем отправителя
+        self.origin = self.worker_id.encode() + b"|"
+        self.stats = BusStats()
+        # Публикация не ждет Redis: порядок сохраняет одна задача-писатель
+        self.outgoing: asyncio.Queue = asyncio.Queue()
+        self.tasks = []
+
+    async def start(self, handler: Callable[[bytes], None]):
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(self.channel, f"{self.channel}:{self.worker_id}")
+        self.tasks = [
+            asyncio.create_task(self._reader(pubsub, handler)),
+            asyncio.create_task(self._writer())
+        ]
+
+    async def _reader(self, pubsub, handler):
+        async for item in pubsub.listen():
+            if item["type"] != "message":
+                continue
+            origin, _, message = item["data"].partition(b"|")
+            if origin + b"|" == self.origin:
+                continue
+            self.stats.received += 1
+            try:
+                handler(message)
+            except Exception as e:
+                print(f"❌ Ошибка обработчика шины Redis: {e}")
+
+    async def _writer(self):
+        while True:
+            channel, message = await self.outgoing.get()
+            try:
+                await self.client.publish(channel, message)
+            except Exception as e:
+                self.stats.dropped += 1
+                print(f"❌ Ошибка публикации в Redis: {e}")
+
+    def publish(self, message: bytes):
+        self.outgoing.put_nowait((self.channel, self.origin + message))
+        self.stats.published += 1
+
+    def send(self, worker_id: str, message: bytes):
+        self.outgoing.put_nowait((f"{self.channel}:{worker_id}", self.origin + message))
+        self.stats.sent += 1
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.client.aclose()
+
+
+BUSES: Dict[str, Callable] = {
+    "local": LocalBus,
+    "redis": RedisBus,
+}
+
+
+def make_bus(name: str = WS_FANOUT_BUS):
+    """Шина по имени; None - рассылка только внутри процесса"""
+    if name == "off":
+        return None
+    if name not in BUSES:
+        raise ValueError(f"Unknown WebSocket fan-out bus: {name}")
+    try:
+        return BUSES[name]()
+    except ImportError:
+        print(f"⚠️ Шина рассылки '{name}' недоступна (пакет не установлен), используем local")
+        return LocalBus()
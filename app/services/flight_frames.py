@@ -0,0 +1,70 @@
+"""
+Заранее закодированные кадры полета раунда краш-игры.
+
+Когда точка краха раунда выбрана, вся последовательность кадров полета
+известна: кадр i - это момент i / tick_rate на кривой. Таблица кадров
+строится до начала полета: все сообщения crash_update лежат подряд в одном
+буфере bytes, а offsets хранит начало каждого кадра. В цикле полета кадр
+берется по индексу, без сборки словаря и json.dumps на каждом тике; те же
+байты можно отдать опоздавшему клиенту или клиенту повтора раунда.
+Для клиентов бинарного подпротокола (crash_protocol) рядом лежат кадры
+фиксированной длины TICK_FRAME.size, поэтому смещения им не нужны.
+"""
+from array import array
+
+from app.services.crash_curve import CrashCurve
+from app.services.crash_protocol import TICK_FRAME, encode_tick
+
+# Тот же JSON, что json.dumps дает для словаря из CrashRoomChannel.send_crash_update
+FRAME_TEMPLATE = (
+    '{"type": "crash_update", "data": {"game_id": %d, "phase": "flying", "multiplier": %r, '
+    '"time_remaining": 0, "speed": %r, "elapsed": %r, "rate": %r}}'
+)
+
+
+class FlightFrames:
+    """Кадры полета раунда: буфер, смещения кадров и состояние игры на каждом кадре"""
+
+    __slots__ = ("game_id", "tick_rate", "buffer", "offsets", "binary", "multipliers", "speeds")
+
+    def __init__(self, game_id: int, curve: CrashCurve, tick_rate: float, crash_time: float):
+        self.game_id = game_id
+        self.tick_rate = tick_rate
+        self.offsets = array("I", [0])
+        self.multipliers = array("d")
+        self.speeds = array("d")
+
+        frame_interval = 1.0 / tick_rate
+        parts = []
+        binary_parts = []
+        position = 0
+        index = 0
+        # Те же кадры, что проходит цикл полета: elapsed = index * frame_interval < crash_time
+        while index * frame_interval < crash_time:
+            elapsed = index * frame_interval
+            multiplier = curve.multiplier_at(elapsed)
+            speed = curve.speed_at(multiplier)
+            frame = (FRAME_TEMPLATE % (
+                game_id, round(multiplier, 2), speed, round(elapsed, 3), curve.rate_at(multiplier)
+            )).encode("ascii")
+            parts.append(frame)
+            binary_parts.append(encode_tick(game_id, "flying", multiplier, elapsed, curve.tier_at(multiplier)))
+            position += len(frame)
+            self.offsets.append(position)
+            self.multipliers.append(multiplier)
+            self.speeds.append(speed)
+            index += 1
+        self.buffer = b"".join(parts)
+        self.binary = b"".join(binary_parts)
+
+    def __len__(self) -> int:
+        return len(self.multipliers)
+
+    def frame(self, index: int) -> str:
+        """Кадр index как текст для WebSocket.send_text"""
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]].decode("ascii")
+
+    def binary_frame(self, index: int) -> bytes:
+        """Кадр index в бинарном протоколе"""
+        start = index * TICK_FRAME.size
+        return self.binary[start:start + TICK_FRAME.size]
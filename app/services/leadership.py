@@ -0,0 +1,211 @@
+"""
+Единственный процесс игры среди воркеров и реплик.
+
+Игру ведет только процесс, держащий блокировку лидера; остальные работают
+ретрансляторами (fanout_bus) и каждые CRASH_LEADER_RETRY секунд пробуют ее
+взять. Блокировка освобождается сама, когда процесс-лидер умирает, поэтому
+следующий воркер подхватывает игру в пределах интервала повтора. Номера
+раундов и звенья цепочки хешей резервируются в БД при открытии приема ставок,
+поэтому новый лидер не повторит номер еще не сохраненного раунда; потерявший
+блокировку процесс дописывает сыгранные раунды, прежде чем снова участвовать
+в выборах.
+
+Блокировка - CRASH_LEADER_LOCK:
+  - postgres - сессионная advisory lock (pg_try_advisory_lock) на отдельном
+               соединении: одна на все машины, работающие с этой БД;
+  - file     - flock на файле в LOCAL_PUBSUB_DIR: воркеры одной машины;
+  - auto     - postgres, если DATABASE_URL указывает на PostgreSQL, иначе file.
+
+Роль можно задать и явно - CRASH_ENGINE_ROLE: leader (всегда ведет игру),
+relay (никогда) или auto (по блокировке, по умолчанию).
+"""
+import asyncio
+import os
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import text
+
+from app.services.local_pubsub import PUBSUB_DIR
+
+CRASH_ENGINE_ROLE = os.getenv("CRASH_ENGINE_ROLE", "auto")
+CRASH_LEADER_LOCK = os.getenv("CRASH_LEADER_LOCK", "auto")
+# Ключ advisory lock: общий для всех процессов одной инсталляции
+CRASH_LEADER_LOCK_KEY = int(os.getenv("CRASH_LEADER_LOCK_KEY", "7423101"))
+# Как часто ретранслятор пробует стать лидером, а лидер проверяет, что блокировка еще его, секунд
+CRASH_LEADER_RETRY = float(os.getenv("CRASH_LEADER_RETRY", "1"))
+
+
+class FileLock:
+    """flock на файле: держится, пока жив захвативший его процесс"""
+
+    name = "file"
+
+    def __init__(self, path: str = os.path.join(PUBSUB_DIR, "crash-engine.lock")):
+        self.path = path
+        self.fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        import fcntl
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self.fd = fd
+        return True
+
+    def is_held(self) -> bool:
+        return self.fd is not None
+
+    def release(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class PostgresLock:
+    """Сессионная advisory lock PostgreSQL на выделенном соединении"""
+
+    name = "postgres"
+
+    def __init__(self, engine, key: int = CRASH_LEADER_LOCK_KEY):
+        self.engine = engine
+        self.key = key
+        self.connection = None
+
+    def try_acquire(self) -> bool:
+        # AUTOCOMMIT: соединение не висит в открытой транзакции, пока держит блокировку
+        connection = self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            acquired = connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}).scalar()
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        self.connection = connection
+        return True
+
+    def is_held(self) -> bool:
+        """Блокировка живет, пока живо соединение"""
+        if self.connection is None:
+            return False
+        try:
+            self.connection.execute(text("SELECT 1"))
+            return True
+        except Exception as e:
+            print(f"⚠️ Соединение с блокировкой лидера потеряно: {e}")
+            self._drop_connection()
+            return False
+
+    def release(self):
+        if self.connection is None:
+            return
+        try:
+            self.connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+        except Exception:
+            pass
+        self._drop_connection()
+
+    def _drop_connection(self):
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+        self.connection = None
+
+
+def make_lock(name: str = CRASH_LEADER_LOCK, engine=None):
+    if name == "auto":
+        name = "postgres" if engine is not None and engine.dialect.name == "postgresql" else "file"
+    if name == "postgres":
+        return PostgresLock(engine)
+    if name == "file":
+        return FileLock()
+    raise ValueError(f"Unknown crash leader lock: {name}")
+
+
+class Leadership:
+    """Выборы процесса игры: захват блокировки, удержание и передача роли при ее потере"""
+
+    def __init__(self, lock, role: str = CRASH_ENGINE_ROLE, retry: float = CRASH_LEADER_RETRY):
+        if role not in ("auto", "leader", "relay"):
+            raise ValueError(f"Unknown crash engine role: {role}")
+        self.lock = lock
+        self.role = role
+        self.retry = retry
+        self.is_leader = False
+        self.elections = 0
+        self.losses = 0
+        self.attempts = 0
+        self.task: Optional[asyncio.Task] = None
+
+    async def _try_acquire(self) -> bool:
+        if self.role == "leader":
+            return True
+        if self.role == "relay":
+            return False
+        try:
+            return await asyncio.to_thread(self.lock.try_acquire)
+        except Exception as e:
+            print(f"⚠️ Не удалось проверить блокировку лидера ({self.lock.name}): {e}")
+            return False
+
+    async def _still_held(self) -> bool:
+        if self.role == "leader":
+            return True
+        return await asyncio.to_thread(self.lock.is_held)
+
+    async def run(self, on_elected: Callable[[], Awaitable], on_lost: Callable[[], Awaitable]):
+        """Цикл выборов; on_elected запускает игру в этом процессе, on_lost - останавливает"""
+        while True:
+            if not self.is_leader:
+                if await self._try_acquire():
+                    self.is_leader = True
+                    print(f"👑 Процесс {os.getpid()} ведет краш-игру (блокировка: {self.lock.name})")
+                    try:
+                        await on_elected()
+                        self.elections += 1
+                    except Exception as e:
+                        # Не держим блокировку без игры: ее возьмет другой процесс или мы на следующем проходе
+                        print(f"❌ Не удалось запустить игру: {e}")
+                        await asyncio.to_thread(self.lock.release)
+                        self.is_leader = False
+                elif self.elections == 0 and self.attempts == 0:
+                    print(f"⏳ Процесс {os.getpid()} ждет блокировку лидера, игра идет в другом процессе")
+                self.attempts += 1
+            elif not await self._still_held():
+                self.is_leader = False
+                self.losses += 1
+                print(f"⚠️ Процесс {os.getpid()} потерял блокировку лидера, игра остановлена")
+                await on_lost()
+            # При явной роли выборов нет: роль назначена с первого прохода
+            if self.role != "auto" and self.is_leader == (self.role == "leader"):
+                return
+            await asyncio.sleep(self.retry)
+
+    def start(self, on_elected: Callable[[], Awaitable], on_lost: Callable[[], Awaitable]):
+        self.task = asyncio.create_task(self.run(on_elected, on_lost))
+        return self.task
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.is_leader:
+            await asyncio.to_thread(self.lock.release)
+            self.is_leader = False
+
+    def get_stats(self) -> dict:
+        return {
+            "role": self.role,
+            "lock": self.lock.name,
+            "is_leader": self.is_leader,
+            "pid": os.getpid(),
+            "elections": self.elections,
+            "losses": self.losses
+        }
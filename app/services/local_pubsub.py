@@ -0,0 +1,147 @@
+"""
+Широковещательные сообщения между процессами-воркерами на одной машине.
+
+Каждый процесс привязывает Unix datagram сокет <channel>.<pid>.sock в общей
+папке; publish отправляет датаграмму во все чужие сокеты канала, send - в
+сокет одного процесса. Список сокетов канала кэшируется и перечитывается
+раз в LOCAL_PUBSUB_PEER_REFRESH секунд или после отправки мертвому процессу;
+сокеты упавших процессов удаляются при первой неудачной отправке.
+Датаграммы, не поместившиеся в буфер получателя, теряются и считаются в dropped.
+"""
+import asyncio
+import os
+import socket
+import tempfile
+import time
+from typing import Callable, List, Optional
+
+PUBSUB_DIR = os.getenv("LOCAL_PUBSUB_DIR", os.path.join(tempfile.gettempdir(), "playonstars-pubsub"))
+MAX_MESSAGE_SIZE = 65536
+# Как часто перечитывать список процессов канала, секунд (новый воркер начнет получать сообщения не позже)
+LOCAL_PUBSUB_PEER_REFRESH = float(os.getenv("LOCAL_PUBSUB_PEER_REFRESH", "1"))
+
+
+class LocalPubSub:
+    """Канал pub/sub между воркерами через Unix datagram сокеты"""
+
+    def __init__(self, channel: str, directory: str = PUBSUB_DIR, peer_refresh: float = LOCAL_PUBSUB_PEER_REFRESH):
+        self.channel = channel
+        self.directory = directory
+        self.path = os.path.join(directory, f"{channel}.{os.getpid()}.sock")
+        self.handlers: List[Callable[[bytes], None]] = []
+        self.sock: Optional[socket.socket] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # Один сокет для всех отправок и кэш адресов остальных процессов канала
+        self.sender: Optional[socket.socket] = None
+        self.peer_refresh = peer_refresh
+        self.peers: List[str] = []
+        self.peers_loaded_at: Optional[float] = None
+        self.dropped = 0
+
+    def subscribe(self, handler: Callable[[bytes], None]):
+        self.handlers.append(handler)
+
+    def start(self):
+        """Начинаем слушать канал в текущем event loop"""
+        if self.sock is not None:
+            return
+        if not hasattr(socket, "AF_UNIX"):
+            print(f"⚠️ Pub/sub '{self.channel}' недоступен на этой платформе")
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        # Файл мог остаться от прошлого процесса с тем же pid
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        sock.bind(self.path)
+        self.sock = sock
+        self.loop = asyncio.get_running_loop()
+        self.loop.add_reader(sock.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        while True:
+            try:
+                message = self.sock.recv(MAX_MESSAGE_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            for handler in self.handlers:
+                try:
+                    handler(message)
+                except Exception as e:
+                    print(f"❌ Ошибка обработчика pub/sub '{self.channel}': {e}")
+
+    def _get_sender(self) -> socket.socket:
+        if self.sender is None:
+            self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sender.setblocking(False)
+        return self.sender
+
+    def _get_peers(self) -> List[str]:
+        now = time.monotonic()
+        if self.peers_loaded_at is None or now - self.peers_loaded_at >= self.peer_refresh:
+            prefix = f"{self.channel}."
+            self.peers = [
+                entry.path for entry in os.scandir(self.directory)
+                if entry.name.startswith(prefix) and entry.path != self.path
+            ]
+            self.peers_loaded_at = now
+        return self.peers
+
+    def _remove_peer(self, path: str):
+        """Процесс-получатель завершился: удаляем его сокет и перечитаем список при следующей отправке"""
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        self.peers_loaded_at = None
+
+    def publish(self, message: bytes) -> int:
+        """Отправляем сообщение всем остальным процессам канала, возвращаем число получателей"""
+        if not hasattr(socket, "AF_UNIX") or not os.path.isdir(self.directory):
+            return 0
+
+        delivered = 0
+        sender = self._get_sender()
+        for path in self._get_peers():
+            try:
+                sender.sendto(message, path)
+                delivered += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                self._remove_peer(path)
+            except BlockingIOError:
+                # Буфер получателя полон - датаграмма потеряна
+                self.dropped += 1
+        return delivered
+
+    def send(self, pid: int, message: bytes) -> bool:
+        """Отправляем сообщение одному процессу канала"""
+        if self.sock is None:
+            return False
+        path = os.path.join(self.directory, f"{self.channel}.{pid}.sock")
+        try:
+            self._get_sender().sendto(message, path)
+            return True
+        except (ConnectionRefusedError, FileNotFoundError):
+            self._remove_peer(path)
+            return False
+        except BlockingIOError:
+            self.dropped += 1
+            return False
+
+    def close(self):
+        if self.sender is not None:
+            self.sender.close()
+            self.sender = None
+        if self.sock is None:
+            return
+        if self.loop is not None:
+            self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+        self.sock = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,218 @@
+"""
+Сэмплеры точки краха, построенные по GameSettings (RTP, мин/макс множитель).
+
+Распределения регистрируются в sampler_registry. При изменении настроек
+строится новый сэмплер (alias-таблица для ступенчатых распределений,
+обратная функция распределения для непрерывных) и атомарно подменяет
+активный. Каждая точка краха - O(1) из одного равномерного u в [0, 1),
+поэтому сэмплер одинаково работает со случайным u и с u из цепочки хешей.
+"""
+import math
+from typing import Callable, Dict, List, Optional, Sequence
+
+from app.services.provably_fair import CRASH_RTP, MAX_MULTIPLIER
+
+DEFAULT_DISTRIBUTION = "inverse"
+# Распределение до загрузки настроек и для раундов, сохраненных без поля sampler
+DEFAULT_SPEC = f"{DEFAULT_DISTRIBUTION}:{CRASH_RTP}:1.0:{MAX_MULTIPLIER}"
+
+
+def _floor2(value: float) -> float:
+    return math.floor(value * 100) / 100
+
+
+class InverseCdfSampler:
+    """Непрерывное распределение P(X >= x) = rtp / x на [min, max], ниже min - мгновенный крах 1.00x"""
+
+    def __init__(self, name: str, rtp: float, min_multiplier: float, max_multiplier: float):
+        self.name = name
+        self.rtp = rtp
+        self.min_multiplier = min_multiplier
+        self.max_multiplier = max_multiplier
+
+    def sample(self, u: float) -> float:
+        raw = self.rtp / (1.0 - u)
+        if raw < self.min_multiplier:
+            return 1.0
+        return min(_floor2(raw), self.max_multiplier)
+
+    def sample_array(self, u):
+        import numpy as np
+        raw = self.rtp / (1.0 - u)
+        multiplier = np.minimum(np.floor(raw * 100) / 100, self.max_multiplier)
+        return np.where(raw < self.min_multiplier, 1.0, multiplier)
+
+
+class AliasSampler:
+    """Ступенчатое распределение (корзины [low, high] с весами) через alias-таблицу Уокера (алгоритм Vose)
+
+    Внутри корзины P(X >= x) убывает как 1/x (как у непрерывного распределения), поэтому
+    x * P(X >= x) линейна на корзине и максимум RTP достигается на ее краях.
+    """
+
+    def __init__(self, name: str, rtp: float, min_multiplier: float, max_multiplier: float,
+                 buckets: Sequence[tuple]):
+        self.name = name
+        self.rtp = rtp
+        self.min_multiplier = min_multiplier
+        self.max_multiplier = max_multiplier
+
+        # Прижимаем корзины к границам настроек
+        shaped = []
+        for weight, low, high in buckets:
+            low = min(max(low, min_multiplier), max_multiplier)
+            high = min(max(high, min_multiplier), max_multiplier)
+            shaped.append((weight, low, high))
+        total = sum(weight for weight, _, _ in shaped)
+        shaped = [(weight / total, low, high) for weight, low, high in shaped]
+
+        # Доля мгновенного краха подбирается так, чтобы лучшая стратегия вывода давала ровно rtp
+        best = max(x * self._survival(shaped, x) for x in self._candidates(shaped))
+        payout_share = rtp / best
+        if payout_share > 1.0:
+            raise ValueError(f"Distribution '{name}' cannot reach RTP {rtp} within [{min_multiplier}, {max_multiplier}]")
+        self.instant_crash_probability = 1.0 - payout_share
+
+        self.buckets = [(self.instant_crash_probability, 1.0, 1.0)] + [
+            (weight * payout_share, low, high) for weight, low, high in shaped
+        ]
+        self.lows = [low for _, low, _ in self.buckets]
+        self.highs = [high for _, _, high in self.buckets]
+        self.prob, self.alias = self._build_alias([weight for weight, _, _ in self.buckets])
+
+    @staticmethod
+    def _survival(buckets, x: float) -> float:
+        """P(X >= x) для ненулевой части распределения"""
+        probability = 0.0
+        for weight, low, high in buckets:
+            if x <= low:
+                probability += weight
+            elif x < high:
+                probability += weight * (1 / x - 1 / high) / (1 / low - 1 / high)
+        return probability
+
+    @staticmethod
+    def _candidates(buckets) -> List[float]:
+        """Точки, где x * P(X >= x) может достигать максимума: края корзин"""
+        return [edge for _, low, high in buckets for edge in (low, high)]
+
+    @staticmethod
+    def _inner(low: float, high: float, inner: float) -> float:
+        """Позиция inner в [0, 1) внутри корзины -> множитель с P(X >= x) ~ 1/x"""
+        return low * high / (high - inner * (high - low))
+
+    @staticmethod
+    def _build_alias(weights: List[float]):
+        """Алгоритм Vose: таблицы prob/alias для выбора корзины за O(1)"""
+        n = len(weights)
+        scaled = [weight * n for weight in weights]
+        prob = [0.0] * n
+        alias = list(range(n))
+        small = [i for i, value in enumerate(scaled) if value < 1.0]
+        large = [i for i, value in enumerate(scaled) if value >= 1.0]
+
+        while small and large:
+            less, more = small.pop(), large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        for i in small + large:
+            prob[i] = 1.0
+        return prob, alias
+
+    def sample(self, u: float) -> float:
+        # Одно u дает и колонку таблицы, и монетку alias, и позицию внутри корзины
+        position = u * len(self.prob)
+        column = int(position)
+        coin = position - column
+        if coin < self.prob[column]:
+            bucket, inner = column, coin / self.prob[column]
+        else:
+            bucket, inner = self.alias[column], (coin - self.prob[column]) / (1.0 - self.prob[column])
+        return round(self._inner(self.lows[bucket], self.highs[bucket], inner), 2)
+
+    def sample_array(self, u):
+        import numpy as np
+        prob = np.asarray(self.prob)
+        position = u * len(prob)
+        column = position.astype(np.int64)
+        coin = position - column
+        column_prob = prob[column]
+        use_column = coin < column_prob
+        bucket = np.where(use_column, column, np.asarray(self.alias)[column])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inner = np.where(use_column, coin / column_prob, (coin - column_prob) / (1.0 - column_prob))
+        return np.round(self._inner(np.asarray(self.lows)[bucket], np.asarray(self.highs)[bucket], inner), 2)
+
+
+class SamplerRegistry:
+    """Реестр распределений и активный сэмплер игры"""
+
+    def __init__(self):
+        self.factories: Dict[str, Callable] = {}
+        self.active = None
+
+    def register(self, name: str):
+        def decorator(factory: Callable):
+            self.factories[name] = factory
+            return factory
+        return decorator
+
+    def build(self, distribution: Optional[str], rtp: float, min_multiplier: float, max_multiplier: float):
+        """Строим сэмплер; ValueError если параметры недопустимы"""
+        distribution = distribution or DEFAULT_DISTRIBUTION
+        if distribution not in self.factories:
+            raise ValueError(f"Unknown distribution: {distribution}")
+        if not 0 < rtp < 1:
+            raise ValueError("RTP must be between 0 and 1")
+        if not 1.0 <= min_multiplier < max_multiplier:
+            raise ValueError("Multiplier bounds must satisfy 1.0 <= min < max")
+        return self.factories[distribution](distribution, rtp, min_multiplier, max_multiplier)
+
+    def build_from_settings(self, settings):
+        return self.build(
+            getattr(settings, "crash_distribution", None),
+            settings.crash_rtp,
+            settings.crash_min_multiplier,
+            settings.crash_max_multiplier
+        )
+
+    def apply_settings(self, settings):
+        """Строим сэмплер по настройкам и подменяем активный одной операцией присваивания"""
+        self.active = self.build_from_settings(settings)
+        return self.active
+
+    @staticmethod
+    def spec(sampler) -> str:
+        """Строка, по которой сэмплер можно восстановить для проверки раунда"""
+        return f"{sampler.name}:{sampler.rtp}:{sampler.min_multiplier}:{sampler.max_multiplier}"
+
+    def build_from_spec(self, spec: str):
+        name, rtp, min_multiplier, max_multiplier = spec.split(":")
+        return self.build(name, float(rtp), float(min_multiplier), float(max_multiplier))
+
+
+sampler_registry = SamplerRegistry()
+
+
+@sampler_registry.register("inverse")
+def build_inverse(name, rtp, min_multiplier, max_multiplier):
+    return InverseCdfSampler(name, rtp, min_multiplier, max_multiplier)
+
+
+# Формы ступенчатых распределений из CrashGame (без корзины мгновенного краха): (вес, от, до)
+BUCKET_SHAPES = {
+    "buckets_v2": ((0.25, 1.01, 1.5), (0.30, 1.5, 3.0), (0.20, 3.0, 8.0), (0.15, 8.0, 30.0), (0.02, 30.0, 1000.0)),
+    "buckets_v4": ((0.40, 1.01, 1.3), (0.25, 1.3, 2.0), (0.15, 2.0, 5.0), (0.08, 5.0, 20.0), (0.04, 20.0, 1000.0)),
+    "buckets_v5": ((0.35, 1.1, 1.1), (0.20, 1.5, 1.5), (0.15, 2.0, 2.0), (0.10, 3.0, 3.0),
+                   (0.05, 5.0, 5.0), (0.03, 10.0, 10.0), (0.02, 20.0, 1000.0)),
+}
+
+for _shape_name, _buckets in BUCKET_SHAPES.items():
+    sampler_registry.register(_shape_name)(
+        lambda name, rtp, low, high, buckets=_buckets: AliasSampler(name, rtp, low, high, buckets)
+    )
+
+# До загрузки настроек из БД - то же распределение, что и у цепочки хешей
+sampler_registry.active = sampler_registry.build_from_spec(DEFAULT_SPEC)
@@ -0,0 +1,131 @@
+"""
+Provably fair: заранее сгенерированная цепочка SHA-256 для точек краха.
+
+Цепочка строится один раз офлайн: link_0 = sha256(seed), link_i = sha256(link_{i-1}).
+Раунды расходуют звенья с конца, поэтому каждый раскрытый хеш проверяется
+по предыдущему раунду: sha256(hash раунда N) == hash раунда N-1.
+Перед запуском публикуется терминальный хеш sha256(последнее звено).
+
+Генерация:
+    python -m app.services.provably_fair generate --length 1000000 --out crash_chain.bin
+"""
+import argparse
+import hashlib
+import hmac
+import math
+import mmap
+import os
+import secrets
+import time
+from typing import Optional
+
+LINK_SIZE = 32
+
+CHAIN_PATH = os.getenv("CRASH_HASH_CHAIN_PATH", "crash_chain.bin")
+# Публичная соль, которую нельзя было знать при генерации цепочки (например, хеш будущего блока)
+CHAIN_SALT = os.getenv("CRASH_HASH_CHAIN_SALT", "")
+CRASH_RTP = float(os.getenv("CRASH_RTP", "0.92"))
+MAX_MULTIPLIER = 1000.0
+
+# Сколько звеньев держим в памяти перед записью на диск
+GENERATE_CHUNK = 1_000_000
+
+
+def generate_chain(path: str, length: int, seed: Optional[bytes] = None) -> str:
+    """Генерируем цепочку длиной length в файл path, возвращаем терминальный хеш (hex)"""
+    link = hashlib.sha256(seed or secrets.token_bytes(32)).digest()
+    sha256 = hashlib.sha256
+
+    with open(path, "wb") as f:
+        remaining = length
+        while remaining > 0:
+            count = min(remaining, GENERATE_CHUNK)
+            buffer = bytearray()
+            extend = buffer.extend
+            for _ in range(count):
+                extend(link)
+                link = sha256(link).digest()
+            f.write(buffer)
+            remaining -= count
+
+    # link сейчас равен sha256(последнего записанного звена)
+    return link.hex()
+
+
+def link_to_uniform(round_hash: str, salt: str = CHAIN_SALT) -> float:
+    """Равномерное число в [0, 1) из хеша раунда: первые 52 бита HMAC-SHA256"""
+    digest = hmac.new(bytes.fromhex(round_hash), salt.encode(), hashlib.sha256).hexdigest()
+    return int(digest[:13], 16) / float(1 << 52)
+
+
+def uniform_to_multiplier(u: float, rtp: float = CRASH_RTP, max_multiplier: float = MAX_MULTIPLIER) -> float:
+    """Точка краха с P(X >= x) = rtp / x: при любом выводе RTP равен rtp"""
+    multiplier = math.floor(rtp / (1.0 - u) * 100) / 100
+    return min(max(multiplier, 1.0), max_multiplier)
+
+
+def link_to_multiplier(round_hash: str, rtp: float = CRASH_RTP, salt: str = CHAIN_SALT) -> float:
+    """Детерминированная точка краха для хеша раунда"""
+    return uniform_to_multiplier(link_to_uniform(round_hash, salt), rtp)
+
+
+def verify_link(round_hash: str, previous_hash: str) -> bool:
+    """Проверяем, что хеш раунда продолжает цепочку предыдущего раунда"""
+    return hmac.compare_digest(hashlib.sha256(bytes.fromhex(round_hash)).hexdigest(), previous_hash)
+
+
+class CrashHashChain:
+    """Чтение готовой цепочки с диска; звено для раунда - одно чтение из mmap"""
+
+    def __init__(self, path: str = CHAIN_PATH):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.length = len(self._map) // LINK_SIZE
+
+    @classmethod
+    def load(cls, path: str = CHAIN_PATH) -> Optional["CrashHashChain"]:
+        """Открываем цепочку, если файл есть; иначе игра работает без нее"""
+        if not os.path.exists(path) or os.path.getsize(path) < LINK_SIZE:
+            return None
+        return cls(path)
+
+    def link(self, index: int) -> str:
+        """Хеш для раунда с порядковым номером index (0 - первый раунд)"""
+        if not 0 <= index < self.length:
+            raise IndexError(f"Hash chain exhausted: {index} of {self.length}")
+        offset = (self.length - 1 - index) * LINK_SIZE
+        return self._map[offset:offset + LINK_SIZE].hex()
+
+    def terminating_hash(self) -> str:
+        """Публикуемый заранее хеш: sha256 от звена первого раунда"""
+        return hashlib.sha256(bytes.fromhex(self.link(0))).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crash provably fair hash chain")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate = subparsers.add_parser("generate", help="Сгенерировать цепочку хешей")
+    generate.add_argument("--length", type=int, default=GENERATE_CHUNK)
+    generate.add_argument("--out", default=CHAIN_PATH)
+    generate.add_argument("--seed", help="Секретный seed в hex (по умолчанию случайный)")
+
+    verify = subparsers.add_parser("verify", help="Посчитать множитель для хеша раунда")
+    verify.add_argument("hash")
+    verify.add_argument("--rtp", type=float, default=CRASH_RTP)
+
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        started = time.perf_counter()
+        seed = bytes.fromhex(args.seed) if args.seed else None
+        terminating = generate_chain(args.out, args.length, seed)
+        print(f"✅ {args.length} звеньев записано в {args.out} за {time.perf_counter() - started:.1f} с")
+        print(f"🔐 Терминальный хеш (опубликуйте до запуска): {terminating}")
+    else:
+        print(link_to_multiplier(args.hash, args.rtp))
+
+
+if __name__ == "__main__":
+    main()
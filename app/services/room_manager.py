@@ -0,0 +1,143 @@
+"""
+Менеджер комнат краш-игры.
+
+Каждая комната - отдельный CrashGame со своей книгой ставок, подписчиками
+(WebSocketManager.room) и очередью расчета. Общие для процесса: колесо
+таймеров (одна задача-драйвер на все тики), цепочка хешей и пакетная
+запись ставок. Номера раундов и звенья цепочки выдают последовательности
+БД, общие для всех комнат и процессов.
+
+Комнаты задаются переменной CRASH_ROOMS: "main:stars,vip:stars:100:10000,ton:ton:0.1"
+(id:валюта[:мин. ставка[:макс. ставка]]).
+"""
+import asyncio
+import os
+from typing import Dict, Optional
+
+from app.database import async_crud
+from app.database.session import AsyncSessionLocal
+from app.services.crash_game import CrashGame, ChainCursor
+from app.services.bet_writer import BetWriter
+from app.services.provably_fair import CrashHashChain
+from app.services.timer_wheel import TimerWheel
+from app.services.websocket_manager import DEFAULT_ROOM
+
+CRASH_ROOMS = os.getenv("CRASH_ROOMS", f"{DEFAULT_ROOM}:stars")
+# Пауза перед перезапуском цикла комнаты после ошибки, секунд
+ROOM_ERROR_DELAY = 5
+
+
+class RoomManager:
+    """Комнаты краш-игры на общем планировщике тиков"""
+
+    def __init__(self, ws_manager, clock=None):
+        self.ws_manager = ws_manager
+        self.clock = clock or TimerWheel()
+        self.chain = ChainCursor(CrashHashChain.load())
+        self.bet_writer = BetWriter(clock=self.clock)
+        self.rooms: Dict[str, CrashGame] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    def create_room(self, room_id: str, currency: str = "stars",
+                    min_bet: Optional[float] = None, max_bet: Optional[float] = None) -> CrashGame:
+        if room_id in self.rooms:
+            raise ValueError(f"Room '{room_id}' already exists")
+
+        game = CrashGame(
+            self.ws_manager.room(room_id),
+            room_id=room_id,
+            currency=currency,
+            min_bet=min_bet,
+            max_bet=max_bet,
+            clock=self.clock,
+            chain=self.chain,
+            bet_writer=self.bet_writer
+        )
+        self.rooms[room_id] = game
+        self.ws_manager.set_crash_game(game, room_id)
+        return game
+
+    def load_rooms(self, config: str = CRASH_ROOMS):
+        """Создаем комнаты по строке конфигурации CRASH_ROOMS"""
+        for item in config.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            parts = item.split(":")
+            room_id = parts[0]
+            currency = parts[1] if len(parts) > 1 and parts[1] else "stars"
+            min_bet = float(parts[2]) if len(parts) > 2 and parts[2] else None
+            max_bet = float(parts[3]) if len(parts) > 3 and parts[3] else None
+            self.create_room(room_id, currency, min_bet, max_bet)
+        return self
+
+    def get(self, room_id: str = DEFAULT_ROOM) -> Optional[CrashGame]:
+        return self.rooms.get(room_id)
+
+    async def resume(self):
+        """Старт или смена лидера: последовательности раундов не ниже сохраненных раундов"""
+        async with AsyncSessionLocal() as db:
+            await async_crud.sync_crash_round_sequences(db)
+        print("🔢 Номера раундов и звенья цепочки выдает БД")
+
+    def start(self):
+        """Запускаем цикл каждой комнаты (запуск повторно - только для новых комнат)"""
+        for room_id, game in self.rooms.items():
+            task = self.tasks.get(room_id)
+            if task is None or task.done():
+                self.tasks[room_id] = asyncio.create_task(self._run_room(game))
+        print(f"🎮 Запущено комнат краш-игры: {len(self.rooms)}")
+
+    async def _run_room(self, game: CrashGame):
+        while True:
+            try:
+                await game.run_game_cycle()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Ошибка в комнате '{game.room_id}': {e}")
+                await self.clock.sleep(ROOM_ERROR_DELAY)
+
+    async def stop_rooms(self):
+        """Останавливаем циклы комнат; ставки прерванного раунда уходят в расчет (drain_settlement)"""
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        self.tasks.clear()
+        for game in self.rooms.values():
+            await game.abort_round()
+
+    async def stop(self, timeout: float = 10):
+        """Останавливаем циклы комнат и ждем расчета завершенных раундов"""
+        await self.stop_rooms()
+        await self.drain_settlement(timeout)
+
+        if isinstance(self.clock, TimerWheel):
+            await self.clock.stop()
+
+    async def drain_settlement(self, timeout: float = 10):
+        """Ждем сохранения уже сыгранных раундов (остановка или потеря лидерства)"""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(game.settlement.drain() for game in self.rooms.values())),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            backlog = sum(game.settlement.backlog for game in self.rooms.values())
+            print(f"⚠️ Не сохранено раундов при остановке: {backlog}")
+
+    def get_stats(self) -> dict:
+        return {
+            "rooms": {
+                room_id: {
+                    "currency": game.currency,
+                    "game_id": game.game_id,
+                    "playing": game.is_playing,
+                    "bets": len(game.bets),
+                    "settlement_backlog": game.settlement.backlog
+                }
+                for room_id, game in self.rooms.items()
+            },
+            "clock": self.clock.get_stats() if hasattr(self.clock, "get_stats") else None,
+            "bet_writer": self.bet_writer.get_stats()
+        }
@@ -0,0 +1,105 @@
+"""
+Состояние раунда краш-игры для снимка при подключении к /ws/crash.
+
+Движок обновляет RoundState на переходах фаз (прием ставок, полет, крах),
+а суммы ставок берутся из итогов BetBook, которые и так ведутся при каждой
+ставке. Поэтому снимок для опоздавшего клиента собирается за O(1) из памяти,
+без запросов в БД: фаза, множитель и время полета на момент подключения,
+число и суммы ставок, последние точки краха и ставка самого игрока.
+"""
+import math
+import os
+from collections import deque
+from typing import Optional
+
+from app.services.bet_book import BetBook
+from app.services.crash_curve import CrashCurve
+
+# Сколько последних точек краха отдается в снимке
+CRASH_SNAPSHOT_HISTORY = int(os.getenv("CRASH_SNAPSHOT_HISTORY", "20"))
+
+
+class RoundState:
+    """Фаза текущего раунда, ее моменты по часам комнаты и последние результаты"""
+
+    __slots__ = ("game_id", "phase", "betting_ends_at", "flight_started_at", "crash_point",
+                 "round_hash", "recent_crashes", "history_loaded")
+
+    def __init__(self, history: int = CRASH_SNAPSHOT_HISTORY):
+        self.game_id = 0
+        self.phase = "waiting"
+        self.betting_ends_at = 0.0
+        self.flight_started_at = 0.0
+        self.crash_point = 1.0
+        self.round_hash: Optional[str] = None
+        # Новые точки краха - в начале
+        self.recent_crashes = deque(maxlen=history)
+        self.history_loaded = False
+
+    def load_history(self, crashes: list):
+        """Последние раунды из БД при старте: [(game_id, crashed_at), ...] от новых к старым"""
+        self.recent_crashes.clear()
+        self.recent_crashes.extend(
+            {"game_id": game_id, "multiplier": crashed_at} for game_id, crashed_at in crashes
+        )
+        self.history_loaded = True
+
+    def start_betting(self, game_id: int, ends_at: float):
+        self.game_id = game_id
+        self.phase = "betting"
+        self.betting_ends_at = ends_at
+        self.crash_point = 1.0
+        self.round_hash = None
+
+    def start_flight(self, started_at: float):
+        self.phase = "flying"
+        self.flight_started_at = started_at
+
+    def crash(self, crash_point: float, round_hash: Optional[str]):
+        self.phase = "crashed"
+        self.crash_point = crash_point
+        self.round_hash = round_hash
+        self.recent_crashes.appendleft({"game_id": self.game_id, "multiplier": crash_point})
+
+    def snapshot(self, now: float, curve: CrashCurve, bets: BetBook, crash_point: float,
+                 user_id: Optional[int] = None) -> dict:
+        """Данные сообщения crash_snapshot на момент now"""
+        time_remaining = 0
+        elapsed = 0.0
+        multiplier = 1.0
+        if self.phase == "betting":
+            time_remaining = max(math.ceil(self.betting_ends_at - now), 0)
+        elif self.phase == "flying":
+            elapsed = max(now - self.flight_started_at, 0.0)
+            # Между кадрами не показываем множитель выше точки краха
+            multiplier = min(curve.multiplier_at(elapsed), crash_point)
+        elif self.phase == "crashed":
+            multiplier = self.crash_point
+
+        my_bet = None
+        bet = bets.get(user_id) if user_id is not None else None
+        if bet is not None:
+            my_bet = {
+                "amount": bet.amount,
+                "auto_cashout": bet.auto_cashout,
+                "cashed_out": bet.cashed_out,
+                "cashout_multiplier": bet.cashout_multiplier if bet.cashed_out else None,
+                "win_amount": bet.profit
+            }
+
+        return {
+            "game_id": self.game_id,
+            "phase": self.phase,
+            "multiplier": round(multiplier, 2),
+            "time_remaining": time_remaining,
+            "elapsed": round(elapsed, 3),
+            "speed": curve.speed_at(multiplier),
+            "rate": curve.rate_at(multiplier) if self.phase == "flying" else 0,
+            "players": len(bets),
+            "total_bet": bets.total_bet,
+            "pending_amount": bets.pending_amount,
+            "total_payout": bets.total_payout,
+            "round_hash": self.round_hash,
+            "history": list(self.recent_crashes),
+            "my_bet": my_bet
+        }
@@ -0,0 +1,193 @@
+"""
+Монте-Карло симулятор RTP для генераторов множителя краш-игры.
+
+Каждый генератор из CrashGame повторен в векторном виде на NumPy, точки краха
+генерируются пачками, и для набора целей вывода считается фактический RTP
+с 95% доверительным интервалом.
+
+Запуск:
+    python -m app.services.rtp_simulator --generator all --rounds 10000000
+"""
+import argparse
+import time
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+
+from app.services.provably_fair import CRASH_RTP, MAX_MULTIPLIER
+
+DEFAULT_TARGETS = (1.01, 1.1, 1.2, 1.5, 2.0, 3.0, 5.0, 10.0, 20.0, 50.0, 100.0, 500.0, 1000.0)
+DEFAULT_BATCH = 1_000_000
+# z для двустороннего 95% интервала
+Z_95 = 1.959964
+# Логарифмические корзины гистограммы от 1x до 1000x
+HISTOGRAM_EDGES = np.concatenate(([1.0], np.logspace(np.log10(1.01), 3, 40), [np.inf]))
+
+
+def _bucket_sampler(edges: Sequence[float], ranges: Sequence[tuple]) -> Callable:
+    """Ступенчатое распределение: корзина по u, внутри корзины равномерно (как random.uniform)"""
+    edges = np.asarray(edges)
+    lows = np.array([low for low, _ in ranges])
+    spans = np.array([high - low for low, high in ranges])
+
+    def sample(rng: np.random.Generator, n: int) -> np.ndarray:
+        bucket = np.searchsorted(edges, rng.random(n), side="right")
+        return np.round(lows[bucket] + spans[bucket] * rng.random(n), 2)
+
+    return sample
+
+
+def sample_rtp_92(rng: np.random.Generator, n: int) -> np.ndarray:
+    """CrashGame.generate_multiplier_rtp_92"""
+    u = rng.random(n)
+    multiplier = 1.0 / (1.0 - (u - 0.08) / 0.92)
+    multiplier = np.round(np.clip(multiplier, 1.01, 1000.0), 2)
+    return np.where(u < 0.08, 1.0, multiplier)
+
+
+# CrashGame.generate_multiplier_rtp_92_v2
+sample_rtp_92_v2 = _bucket_sampler(
+    (0.08, 0.33, 0.63, 0.83, 0.98),
+    ((1.0, 1.0), (1.01, 1.5), (1.5, 3.0), (3.0, 8.0), (8.0, 30.0), (30.0, 1000.0))
+)
+
+
+def sample_rtp_92_v3(rng: np.random.Generator, n: int) -> np.ndarray:
+    """CrashGame.generate_multiplier_rtp_92_v3"""
+    multiplier = -np.log(1.0 - rng.random(n)) / 0.08
+    return np.round(np.clip(multiplier, 1.0, 1000.0), 2)
+
+
+# CrashGame.generate_multiplier_rtp_92_v4
+sample_rtp_92_v4 = _bucket_sampler(
+    (0.08, 0.48, 0.73, 0.88, 0.96),
+    ((1.0, 1.0), (1.01, 1.3), (1.3, 2.0), (2.0, 5.0), (5.0, 20.0), (20.0, 1000.0))
+)
+
+# CrashGame.generate_multiplier_rtp_92_v5
+sample_rtp_92_v5 = _bucket_sampler(
+    (0.08, 0.43, 0.63, 0.78, 0.88, 0.93, 0.96),
+    ((1.0, 1.0), (1.1, 1.1), (1.5, 1.5), (2.0, 2.0), (3.0, 3.0), (5.0, 5.0), (10.0, 10.0), (20.0, 1000.0))
+)
+
+
+def sample_legacy(rng: np.random.Generator, n: int) -> np.ndarray:
+    """CrashGame.generate_multiplier"""
+    return np.round(rng.uniform(1.1, 10.0, n), 2)
+
+
+def sample_hash_chain(rng: np.random.Generator, n: int) -> np.ndarray:
+    """provably_fair.uniform_to_multiplier с CRASH_RTP"""
+    multiplier = np.floor(CRASH_RTP / (1.0 - rng.random(n)) * 100) / 100
+    return np.clip(multiplier, 1.0, MAX_MULTIPLIER)
+
+
+GENERATORS: Dict[str, Callable] = {
+    "rtp_92": sample_rtp_92,
+    "rtp_92_v2": sample_rtp_92_v2,
+    "rtp_92_v3": sample_rtp_92_v3,
+    "rtp_92_v4": sample_rtp_92_v4,
+    "rtp_92_v5": sample_rtp_92_v5,
+    "legacy": sample_legacy,
+    "hash_chain": sample_hash_chain,
+}
+
+
+def simulate(
+    generator: str,
+    rounds: int = 10_000_000,
+    targets: Sequence[float] = DEFAULT_TARGETS,
+    batch_size: int = DEFAULT_BATCH,
+    seed: Optional[int] = None,
+    sampler=None
+) -> dict:
+    """Фактический RTP генератора для каждой цели вывода, гистограмма и house edge
+
+    sampler - сэмплер из multiplier_sampler (тогда generator - только подпись в отчете).
+    """
+    if sampler is not None:
+        generator = f"{generator} ({sampler.name}:{sampler.rtp}:{sampler.min_multiplier}:{sampler.max_multiplier})"
+
+        def sample(rng, n):
+            return sampler.sample_array(rng.random(n))
+    elif generator in GENERATORS:
+        sample = GENERATORS[generator]
+    else:
+        raise ValueError(f"Unknown generator: {generator}")
+    rng = np.random.default_rng(seed)
+    targets = np.asarray(sorted(targets), dtype=float)
+
+    hits = np.zeros(len(targets), dtype=np.int64)
+    histogram = np.zeros(len(HISTOGRAM_EDGES) - 1, dtype=np.int64)
+    total_multiplier = 0.0
+    instant_crashes = 0
+
+    started = time.perf_counter()
+    done = 0
+    while done < rounds:
+        n = min(batch_size, rounds - done)
+        crash_points = sample(rng, n)
+
+        for i, target in enumerate(targets):
+            hits[i] += np.count_nonzero(crash_points >= target)
+        histogram += np.histogram(crash_points, bins=HISTOGRAM_EDGES)[0]
+        total_multiplier += float(crash_points.sum())
+        instant_crashes += int(np.count_nonzero(crash_points < 1.01))
+        done += n
+
+    # Выплата при выводе на x: x с вероятностью p = P(crash >= x), RTP = x * p
+    p = hits / rounds
+    rtp = targets * p
+    margin = Z_95 * targets * np.sqrt(p * (1 - p) / rounds)
+
+    return {
+        "generator": generator,
+        "rounds": rounds,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+        "mean_crash_point": total_multiplier / rounds,
+        "instant_crash_probability": instant_crashes / rounds,
+        "targets": [
+            {
+                "target": float(targets[i]),
+                "win_probability": float(p[i]),
+                "rtp": float(rtp[i]),
+                "rtp_ci_low": float(rtp[i] - margin[i]),
+                "rtp_ci_high": float(rtp[i] + margin[i]),
+                "house_edge": float(1 - rtp[i])
+            }
+            for i in range(len(targets))
+        ],
+        "max_rtp": float(rtp.max()),
+        "histogram": {
+            "edges": [float(edge) for edge in HISTOGRAM_EDGES[:-1]],
+            "counts": histogram.tolist()
+        }
+    }
+
+
+def print_report(report: dict):
+    print(f"\n🎲 {report['generator']}: {report['rounds']:,} раундов за {report['elapsed_seconds']} с")
+    print(f"   Средняя точка краха: {report['mean_crash_point']:.3f}, "
+          f"мгновенный крах: {report['instant_crash_probability']:.2%}")
+    print(f"   {'вывод':>8} {'P(win)':>9} {'RTP':>8} {'95% ДИ':>19} {'edge':>8}")
+    for row in report["targets"]:
+        print(f"   {row['target']:>7.2f}x {row['win_probability']:>9.5f} {row['rtp']:>8.2%} "
+              f"[{row['rtp_ci_low']:>7.2%}, {row['rtp_ci_high']:>7.2%}] {row['house_edge']:>8.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo RTP simulator for crash multiplier generators")
+    parser.add_argument("--generator", default="all", choices=["all"] + list(GENERATORS))
+    parser.add_argument("--rounds", type=int, default=10_000_000)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH)
+    parser.add_argument("--targets", type=float, nargs="+", default=list(DEFAULT_TARGETS))
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    generators = list(GENERATORS) if args.generator == "all" else [args.generator]
+    for generator in generators:
+        print_report(simulate(generator, args.rounds, args.targets, args.batch_size, args.seed))
+
+
+if __name__ == "__main__":
+    main()
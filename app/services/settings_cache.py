@@ -0,0 +1,134 @@
+"""
+Кэш GameSettings в памяти процесса.
+
+Настройки читаются из БД не чаще раза в SETTINGS_CACHE_TTL секунд.
+Админка (save_game_settings) сразу кладет новые настройки в кэш и рассылает
+инвалидацию остальным воркерам через LocalPubSub, поэтому изменения из
+админки применяются к следующему раунду без запроса в БД на каждый раунд.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.database import crud
+from app.database.session import SessionLocal
+from app.services.local_pubsub import LocalPubSub
+from app.services.multiplier_sampler import sampler_registry
+
+SETTINGS_CACHE_TTL = float(os.getenv("SETTINGS_CACHE_TTL", "30"))
+
+INVALIDATE_MESSAGE = b"invalidate"
+
+
+class SettingsSnapshot:
+    """Копия строки GameSettings, не привязанная к сессии"""
+
+    __slots__ = ("admin_password", "crash_rtp", "crash_min_multiplier", "crash_max_multiplier",
+                 "crash_distribution", "updated_at")
+
+    def __init__(self, settings):
+        for field in self.__slots__:
+            setattr(self, field, getattr(settings, field, None))
+
+    def sampler_key(self) -> tuple:
+        return self.crash_distribution, self.crash_rtp, self.crash_min_multiplier, self.crash_max_multiplier
+
+
+class SettingsCache:
+    """Настройки игры из памяти с TTL и инвалидацией между процессами"""
+
+    def __init__(self, ttl: float = SETTINGS_CACHE_TTL):
+        self.ttl = ttl
+        self.snapshot: Optional[SettingsSnapshot] = None
+        self.expires_at = 0.0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.pubsub = LocalPubSub("settings")
+        self.pubsub.subscribe(self._on_remote_invalidate)
+
+    def is_fresh(self) -> bool:
+        return self.snapshot is not None and time.monotonic() < self.expires_at
+
+    def get(self, db: Optional[Session] = None) -> SettingsSnapshot:
+        """Настройки из кэша; из БД - только если кэш устарел"""
+        if self.is_fresh():
+            self.hits += 1
+            return self.snapshot
+        return self.refresh(db)
+
+    async def aget(self) -> SettingsSnapshot:
+        """То же для event loop: запрос в БД, если нужен, уходит в поток"""
+        if self.is_fresh():
+            self.hits += 1
+            return self.snapshot
+        return await asyncio.to_thread(self.refresh)
+
+    def refresh(self, db: Optional[Session] = None) -> SettingsSnapshot:
+        with self.lock:
+            # Пока ждали блокировку, кэш мог обновить другой поток
+            if self.is_fresh():
+                return self.snapshot
+
+            self.misses += 1
+            owns_session = db is None
+            if owns_session:
+                db = SessionLocal()
+            try:
+                settings = crud.get_game_settings(db)
+            finally:
+                if owns_session:
+                    db.close()
+            return self.store(settings)
+
+    def store(self, settings) -> SettingsSnapshot:
+        """Кладем настройки в кэш; при смене параметров распределения пересобираем сэмплер"""
+        snapshot = SettingsSnapshot(settings)
+        if self.snapshot is None or snapshot.sampler_key() != self.snapshot.sampler_key():
+            try:
+                sampler = sampler_registry.apply_settings(snapshot)
+                print(f"🎲 Сэмплер множителя: {sampler_registry.spec(sampler)}")
+            except ValueError as e:
+                print(f"❌ Недопустимые настройки распределения, сэмплер не изменен: {e}")
+        self.snapshot = snapshot
+        self.expires_at = time.monotonic() + self.ttl
+        return snapshot
+
+    def invalidate(self, settings=None):
+        """Вызывается после записи настроек: обновляем свой кэш и сбрасываем кэш других воркеров"""
+        if settings is not None:
+            self.store(settings)
+        else:
+            self.expires_at = 0.0
+        self.pubsub.publish(INVALIDATE_MESSAGE)
+
+    def _on_remote_invalidate(self, message: bytes):
+        if message == INVALIDATE_MESSAGE:
+            self.expires_at = 0.0
+
+    def start(self):
+        """Подписываемся на инвалидации других воркеров"""
+        try:
+            self.pubsub.start()
+        except OSError as e:
+            print(f"⚠️ Инвалидация настроек между воркерами недоступна: {e}")
+
+    def stop(self):
+        self.pubsub.close()
+
+    def get_stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "ttl": self.ttl,
+            "fresh": self.is_fresh(),
+            # Потерянные инвалидации: такие воркеры обновятся по TTL
+            "invalidations_dropped": self.pubsub.dropped
+        }
+
+
+settings_cache = SettingsCache()
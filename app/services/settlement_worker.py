@@ -0,0 +1,257 @@
+"""
+Фоновый расчет раундов краш-игры.
+
+После краха игровой цикл сразу рассылает результат, отдает замороженную
+книгу ставок раунда в очередь и открывает прием ставок следующего раунда.
+Воркер по очереди считает исходы ставок и сохраняет раунд одной
+транзакцией (async_crud.settle_crash_round), повторяя попытку при ошибке.
+Выигрыши еще не сохраненных раундов видны в unsettled_credits - снимок
+балансов следующего раунда учитывает их до того, как они попадут в БД.
+"""
+import asyncio
+import os
+import time
+from typing import Dict, Optional
+
+from app.database.session import AsyncSessionLocal
+from app.database import async_crud
+from app.services.bet_book import BetBook
+
+# Сколько нерассчитанных раундов допускается, прежде чем новый раунд будет ждать воркер
+SETTLEMENT_MAX_BACKLOG = int(os.getenv("SETTLEMENT_MAX_BACKLOG", "3"))
+SETTLEMENT_RETRIES = int(os.getenv("SETTLEMENT_RETRIES", "3"))
+SETTLEMENT_RETRY_DELAY = 1.0
+
+
+def bet_results_from_book(bets: BetBook):
+    """Исход каждой ставки в памяти, без обращений к БД
+
+    Возвращает (bet_results, credits, total_payout), где bet_results -
+    список (bet_id, win_amount, status), credits - user_id -> сумма выигрыша
+    и возвратов снятых с раунда ставок.
+    """
+    bet_results = []
+    credits = {}
+    total_payout = 0.0
+
+    for bet in bets.values():
+        if bet.bet_id is None:
+            continue
+
+        # Авто-выводы уже отмечены в полете (process_auto_cashouts)
+        if bet.cashed_out:
+            win_amount = bet.profit
+            status = 'won'
+        else:
+            win_amount = 0.0
+            status = 'lost'
+
+        bet_results.append((bet.bet_id, win_amount, status))
+        if win_amount > 0:
+            credits[bet.user_id] = credits.get(bet.user_id, 0.0) + win_amount
+        total_payout += win_amount
+
+    _cancelled_bet_results(bets, bet_results, credits)
+
+    return bet_results, credits, total_payout
+
+
+def _cancelled_bet_results(bets: BetBook, bet_results: list, credits: dict):
+    """Замененные или отмененные ставки закрываются без выигрыша, ставка возвращается"""
+    for bet in bets.cancelled:
+        # Незаписанную ставку вернул обработчик ставки (place_bet вернул False)
+        if bet.bet_id is None:
+            continue
+        bet_results.append((bet.bet_id, 0.0, 'cancelled'))
+        credits[bet.user_id] = credits.get(bet.user_id, 0.0) + bet.amount
+
+
+def interrupted_bet_results(bets: BetBook):
+    """Исход ставок прерванного раунда: выведенные выигрывают, остальные отменяются с возвратом ставки
+
+    Возвращает то же, что bet_results_from_book; total_payout - только выигрыши.
+    """
+    bet_results = []
+    credits = {}
+    total_payout = 0.0
+
+    for bet in bets.values():
+        if bet.bet_id is None:
+            continue
+        if bet.cashed_out:
+            bet_results.append((bet.bet_id, bet.profit, 'won'))
+            credits[bet.user_id] = credits.get(bet.user_id, 0.0) + bet.profit
+            total_payout += bet.profit
+        else:
+            bet_results.append((bet.bet_id, 0.0, 'cancelled'))
+            credits[bet.user_id] = credits.get(bet.user_id, 0.0) + bet.amount
+
+    _cancelled_bet_results(bets, bet_results, credits)
+    return bet_results, credits, total_payout
+
+
+class RoundSettlement:
+    """Завершенный раунд, ожидающий сохранения"""
+
+    __slots__ = ("game_id", "multiplier", "crashed_at", "bets", "round_hash", "chain_index",
+                 "sampler", "room_id", "currency", "payout_limit", "interrupted", "crashed_monotonic", "results")
+
+    def __init__(self, game_id: int, multiplier: float, crashed_at: float, bets: BetBook,
+                 round_hash: Optional[str], chain_index: Optional[int], sampler: Optional[str],
+                 room_id: Optional[str] = None, currency: str = "stars", payout_limit: Optional[float] = None,
+                 interrupted: bool = False):
+        self.game_id = game_id
+        self.multiplier = multiplier
+        self.crashed_at = crashed_at
+        self.bets = bets
+        self.round_hash = round_hash
+        self.chain_index = chain_index
+        self.sampler = sampler
+        self.room_id = room_id
+        self.currency = currency
+        self.payout_limit = payout_limit
+        self.interrupted = interrupted  # раунд не доигран: строки раунда нет, ставки закрываются
+        self.crashed_monotonic = time.monotonic()
+        self.results = None  # (bet_results, credits, total_payout), считается при постановке в очередь
+
+
+class SettlementWorker:
+    """Очередь расчета раундов и метрики отставания"""
+
+    def __init__(self, max_backlog: int = SETTLEMENT_MAX_BACKLOG, retries: int = SETTLEMENT_RETRIES):
+        self.max_backlog = max_backlog
+        self.retries = retries
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.current: Optional[RoundSettlement] = None
+        # user_id -> выигрыши раундов в очереди, еще не записанные в БД
+        self.unsettled_credits: Dict[int, float] = {}
+        self.caught_up = asyncio.Event()
+        self.caught_up.set()
+        self.settled = 0
+        self.failed = 0
+        self.last_settlement_ms = 0.0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.guard_waits = 0
+
+    @property
+    def backlog(self) -> int:
+        """Раунды в очереди плюс рассчитываемый сейчас"""
+        return self.queue.qsize() + (1 if self.current is not None else 0)
+
+    def submit(self, settlement: RoundSettlement):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        results = interrupted_bet_results if settlement.interrupted else bet_results_from_book
+        settlement.results = results(settlement.bets)
+        self._track_credits(settlement.results[1], 1)
+        self.queue.put_nowait(settlement)
+        if self.backlog >= self.max_backlog:
+            self.caught_up.clear()
+
+    def _track_credits(self, credits: dict, sign: int):
+        for user_id, amount in credits.items():
+            left = self.unsettled_credits.get(user_id, 0.0) + sign * amount
+            if sign < 0 and left <= 1e-9:
+                self.unsettled_credits.pop(user_id, None)
+            else:
+                self.unsettled_credits[user_id] = left
+
+    def with_unsettled_credits(self, accounts: dict) -> dict:
+        """Снимок балансов из БД плюс выигрыши еще не сохраненных раундов"""
+        for user_id, credit in self.unsettled_credits.items():
+            account = accounts.get(user_id)
+            if account is not None:
+                accounts[user_id] = (account[0], account[1] + credit)
+        return accounts
+
+    async def wait_for_capacity(self):
+        """Защита от отставания: новый раунд не начинается, пока очередь расчета переполнена"""
+        if self.backlog < self.max_backlog:
+            return
+        self.guard_waits += 1
+        print(f"⚠️ Расчет раундов отстает ({self.backlog} в очереди), ждем перед новым раундом")
+        await self.caught_up.wait()
+
+    async def drain(self):
+        """Ждем расчета всех раундов (при остановке приложения)"""
+        await self.queue.join()
+
+    async def _run(self):
+        while True:
+            self.current = await self.queue.get()
+            try:
+                await self._settle(self.current)
+            finally:
+                self.current = None
+                self.queue.task_done()
+                if self.backlog < self.max_backlog:
+                    self.caught_up.set()
+
+    async def _settle(self, settlement: RoundSettlement):
+        started = time.perf_counter()
+        bet_results, credits, total_payout = settlement.results
+
+        for attempt in range(1, self.retries + 1):
+            try:
+                await self.save(settlement, bet_results, credits, total_payout)
+                break
+            except Exception as e:
+                print(f"❌ Ошибка сохранения результатов игры {settlement.game_id} "
+                      f"(попытка {attempt}/{self.retries}): {e}")
+                if attempt == self.retries:
+                    self.failed += 1
+                    self._track_credits(credits, -1)
+                    return
+                await asyncio.sleep(SETTLEMENT_RETRY_DELAY * attempt)
+
+        # Выигрыши записаны в БД - снимок балансов берет их оттуда
+        self._track_credits(credits, -1)
+
+        self.settled += 1
+        self.last_settlement_ms = (time.perf_counter() - started) * 1000
+        self.last_lag_ms = (time.monotonic() - settlement.crashed_monotonic) * 1000
+        self.max_lag_ms = max(self.max_lag_ms, self.last_lag_ms)
+        print(f"✅ Результаты игры сохранены: Game ID {settlement.game_id}, "
+              f"ставок: {len(bet_results)}, расчет занял {self.last_settlement_ms:.1f} мс, "
+              f"отставание {self.last_lag_ms:.1f} мс")
+
+    async def save(self, settlement: RoundSettlement, bet_results: list, credits: dict, total_payout: float):
+        """Раунд, исходы ставок и выигрыши - одной транзакцией"""
+        async with AsyncSessionLocal() as db:
+            if settlement.interrupted:
+                await async_crud.close_interrupted_crash_bets(db, bet_results, credits, settlement.currency)
+                return
+            await async_crud.settle_crash_round(
+                db=db,
+                game_id=settlement.game_id,
+                multiplier=settlement.multiplier,
+                total_players=len(settlement.bets),
+                total_bet=settlement.bets.total_bet,
+                total_payout=total_payout,
+                bet_results=bet_results,
+                credits=credits,
+                round_hash=settlement.round_hash,
+                chain_index=settlement.chain_index,
+                sampler=settlement.sampler,
+                crashed_at=settlement.crashed_at,
+                room_id=settlement.room_id,
+                currency=settlement.currency,
+                payout_limit=settlement.payout_limit
+            )
+
+    def get_stats(self) -> dict:
+        oldest = self.current
+        lag_ms = (time.monotonic() - oldest.crashed_monotonic) * 1000 if oldest else 0.0
+        return {
+            "backlog": self.backlog,
+            "max_backlog": self.max_backlog,
+            "current_lag_ms": round(lag_ms, 1),
+            "last_lag_ms": round(self.last_lag_ms, 1),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "last_settlement_ms": round(self.last_settlement_ms, 1),
+            "settled": self.settled,
+            "failed": self.failed,
+            "guard_waits": self.guard_waits
+        }
@@ -0,0 +1,115 @@
+"""
+Общий планировщик тиков для комнат краш-игры (хешированное колесо таймеров).
+
+Вместо отдельного asyncio.sleep на каждую комнату все ожидания кладутся
+в слоты колеса по дедлайну, а одна задача-драйвер просыпается раз в
+resolution и будит ожидающих из текущего слота. Постановка и срабатывание
+таймера - O(1), в event loop висит один системный таймер на процесс.
+"""
+import asyncio
+import os
+import time
+from typing import List, Optional
+
+WHEEL_RESOLUTION = float(os.getenv("CRASH_WHEEL_RESOLUTION_MS", "10")) / 1000
+WHEEL_SLOTS = 512
+
+
+class TimerWheel:
+    """Часы комнат: now() по time.monotonic и sleep_until через колесо таймеров"""
+
+    def __init__(self, resolution: float = WHEEL_RESOLUTION, slots: int = WHEEL_SLOTS):
+        self.resolution = resolution
+        self.slots: List[list] = [[] for _ in range(slots)]
+        self.origin = time.monotonic()
+        self.current_tick = 0
+        self.pending = 0
+        self.fired = 0
+        self.max_lateness = 0.0
+        self.task: Optional[asyncio.Task] = None
+        self.wakeup = asyncio.Event()
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    def _tick_of(self, deadline: float) -> int:
+        # Округляем вверх: таймер не срабатывает раньше дедлайна
+        return max(int(-(-(deadline - self.origin) // self.resolution)), self.current_tick + 1)
+
+    async def sleep_until(self, deadline: float):
+        """Ждем момента deadline по now()"""
+        if deadline <= self.now():
+            return
+        if self.task is None or self.task.done():
+            self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        tick = self._tick_of(deadline)
+        self.slots[tick % len(self.slots)].append((tick, deadline, future))
+        self.pending += 1
+        self.wakeup.set()
+        await future
+
+    async def sleep(self, delay: float):
+        await self.sleep_until(self.now() + delay)
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _run(self):
+        while True:
+            if not self.pending:
+                # Нет таймеров - спим до первой постановки
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                self.current_tick = max(self.current_tick, int((self.now() - self.origin) // self.resolution))
+
+            next_tick_at = self.origin + (self.current_tick + 1) * self.resolution
+            delay = next_tick_at - self.now()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            # Если цикл событий задержал драйвер, проходим все пропущенные слоты
+            target_tick = int((self.now() - self.origin) // self.resolution)
+            while self.current_tick < target_tick:
+                self.current_tick += 1
+                self._fire(self.current_tick)
+
+    def _fire(self, tick: int):
+        index = tick % len(self.slots)
+        slot = self.slots[index]
+        if not slot:
+            return
+
+        now = self.now()
+        remaining = []
+        for entry in slot:
+            entry_tick, deadline, future = entry
+            if entry_tick > tick:
+                # Дедлайн на следующих оборотах колеса
+                remaining.append(entry)
+                continue
+            self.pending -= 1
+            if not future.done():
+                future.set_result(None)
+                self.fired += 1
+                self.max_lateness = max(self.max_lateness, now - deadline)
+        self.slots[index] = remaining
+
+    def get_stats(self) -> dict:
+        return {
+            "resolution_ms": self.resolution * 1000,
+            "pending_timers": self.pending,
+            "fired": self.fired,
+            "max_lateness_ms": round(self.max_lateness * 1000, 2)
+        }
@@ -1,23 +1,387 @@
 import asyncio
+import itertools
 import json
 import logging
+import os
 import time
-from typing import Dict, Set
+from typing import Dict, Optional, Set
 from fastapi import WebSocket
 from datetime import datetime 
+from app.database import async_crud
+from app.database.session import AsyncSessionLocal
+from app.services.crash_curve import crash_curve
+from app.services.crash_protocol import BINARY_SUBPROTOCOL, encode_tick
+from app.services import fanout_bus
+from app.services.ws_codec import make_codec
 
 logger = logging.getLogger(__name__)
 
+# Сколько кадров может ждать отправки одним клиентом, прежде чем он считается медленным
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+
+# Комната по умолчанию: клиенты без параметра room и прежний единственный CrashGame
+DEFAULT_ROOM = "main"
+
+# Лента новых ставок: одна рассылка bets_batch за интервал; больше BET_FEED_MAX_ITEMS ставок
+# за интервал - только итоги без списка
+BET_FEED_INTERVAL = float(os.getenv("WS_BET_FEED_INTERVAL_MS", "150")) / 1000
+BET_FEED_MAX_ITEMS = int(os.getenv("WS_BET_FEED_MAX_ITEMS", "50"))
+
+# Сколько ретранслятор ждет ответа процесса игры на пересланную команду, секунд
+BUS_REQUEST_TIMEOUT = float(os.getenv("WS_FANOUT_REQUEST_TIMEOUT", "2"))
+# Сколько последних ставок ретрансляторов процесс игры помнит для отмены по таймауту
+BUS_RELAYED_BETS_KEPT = 10_000
+
+
+class BroadcastMetrics:
+    """Счетчики рассылки краш-игры: очереди, задержка отправки, отключенные клиенты"""
+
+    def __init__(self):
+        self.frames_enqueued = 0
+        self.frames_coalesced = 0
+        self.frames_sent = 0
+        self.frames_sent_binary = 0
+        self.bytes_sent_text = 0
+        self.bytes_sent_binary = 0
+        self.send_errors = 0
+        self.slow_consumers_dropped = 0
+        self.send_latency_total = 0.0
+        self.send_latency_max = 0.0
+        self.last_broadcast_ms = 0.0
+        self.bet_batches = 0
+        self.bet_batches_aggregated = 0
+        self.bets_announced = 0
+        self.encodes = 0
+        self.encode_seconds_total = 0.0
+        self.encode_seconds_max = 0.0
+        self.last_encode_ms = 0.0
+
+    def record_encode(self, seconds: float):
+        self.encodes += 1
+        self.encode_seconds_total += seconds
+        if seconds > self.encode_seconds_max:
+            self.encode_seconds_max = seconds
+        self.last_encode_ms = seconds * 1000
+
+    def record_send(self, latency: float, frame):
+        self.frames_sent += 1
+        # Для текста считаем символы: с кодеком json (ensure_ascii) это ровно байты
+        if isinstance(frame, bytes):
+            self.frames_sent_binary += 1
+            self.bytes_sent_binary += len(frame)
+        else:
+            self.bytes_sent_text += len(frame)
+        self.send_latency_total += latency
+        if latency > self.send_latency_max:
+            self.send_latency_max = latency
+
+    def snapshot(self, connections) -> dict:
+        depths = [connection.queue.qsize() for connection in connections]
+        return {
+            "connections": len(depths),
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            "queue_size_limit": SEND_QUEUE_SIZE,
+            "frames_enqueued": self.frames_enqueued,
+            "frames_coalesced": self.frames_coalesced,
+            "frames_sent": self.frames_sent,
+            "frames_sent_binary": self.frames_sent_binary,
+            "bytes_sent_text": self.bytes_sent_text,
+            "bytes_sent_binary": self.bytes_sent_binary,
+            "send_errors": self.send_errors,
+            "slow_consumers_dropped": self.slow_consumers_dropped,
+            "send_latency_avg_ms": round(self.send_latency_total / self.frames_sent * 1000, 3) if self.frames_sent else 0.0,
+            "send_latency_max_ms": round(self.send_latency_max * 1000, 3),
+            "last_broadcast_ms": round(self.last_broadcast_ms, 3),
+            "bet_batches": self.bet_batches,
+            "bet_batches_aggregated": self.bet_batches_aggregated,
+            "bets_announced": self.bets_announced,
+            "encodes": self.encodes,
+            "encode_avg_us": round(self.encode_seconds_total / self.encodes * 1e6, 2) if self.encodes else 0.0,
+            "encode_max_us": round(self.encode_seconds_max * 1e6, 2),
+            "last_encode_ms": round(self.last_encode_ms, 4)
+        }
+
+
+class TickSlot:
+    """Место в очереди под тик crash_update, которое можно перезаписать более свежим кадром"""
+    __slots__ = ("frame", "enqueued_at")
+
+    def __init__(self, frame: str, enqueued_at: float):
+        self.frame = frame
+        self.enqueued_at = enqueued_at
+
+
+class CrashConnection:
+    """Клиент краш-игры: ограниченная очередь исходящих кадров и отдельная задача-писатель"""
+
+    def __init__(self, websocket: WebSocket, manager: "WebSocketManager", on_error=None, binary: bool = False):
+        self.websocket = websocket
+        self.manager = manager
+        # Клиент договорился о BINARY_SUBPROTOCOL: тики ему уходят бинарными кадрами
+        self.binary = binary
+        self.on_error = on_error or manager.disconnect_crash_game
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        # Последний еще не отправленный тик; новые тики заменяют его кадр
+        self.open_slot = None
+        self.writer_task = asyncio.create_task(self._writer())
+
+    def enqueue(self, frame: str) -> bool:
+        """Кладем готовый кадр в очередь; False - клиент не успевает читать"""
+        try:
+            self.queue.put_nowait((frame, time.monotonic()))
+        except asyncio.QueueFull:
+            return False
+        # Следующий тик должен встать после этого кадра, а не перед ним
+        self.open_slot = None
+        return True
+
+    def enqueue_tick(self, frame: str) -> bool:
+        """Кладем тик с заменой: если прошлый тик еще не ушел, отправится только новый"""
+        now = time.monotonic()
+        if self.open_slot is not None:
+            self.open_slot.frame = frame
+            self.open_slot.enqueued_at = now
+            self.manager.metrics.frames_coalesced += 1
+            return True
+        slot = TickSlot(frame, now)
+        try:
+            self.queue.put_nowait((slot, now))
+        except asyncio.QueueFull:
+            return False
+        self.open_slot = slot
+        return True
+
+    async def _writer(self):
+        while True:
+            frame, enqueued_at = await self.queue.get()
+            if isinstance(frame, TickSlot):
+                if frame is self.open_slot:
+                    self.open_slot = None
+                frame, enqueued_at = frame.frame, frame.enqueued_at
+            try:
+                if isinstance(frame, bytes):
+                    await self.websocket.send_bytes(frame)
+                else:
+                    await self.websocket.send_text(frame)
+            except Exception as e:
+                logger.error(f"Error sending to crash game client: {e}")
+                self.manager.metrics.send_errors += 1
+                self.on_error(self.websocket)
+                return
+            self.manager.metrics.record_send(time.monotonic() - enqueued_at, frame)
+
+    def close(self):
+        if self.writer_task is not asyncio.current_task():
+            self.writer_task.cancel()
+
+
+class CrashRoomChannel:
+    """Подписчики одной комнаты краш-игры и рассылка ее событий"""
+
+    def __init__(self, room_id: str, manager: "WebSocketManager"):
+        self.room_id = room_id
+        self.manager = manager
+        self.connections: Dict[WebSocket, CrashConnection] = {}
+        self.binary_connections = 0
+        self.crash_game = None
+        # Последняя разосланная фаза: смена фазы доставляется без склейки
+        self.last_crash_phase = None
+        # Ставки, ожидающие рассылки в ленту bets_batch
+        self.pending_bets = []
+        self.pending_count = 0
+        self.pending_stake = 0.0
+        self.pending_game_id = None
+        self.bet_feed_task: Optional[asyncio.Task] = None
+
+    async def broadcast_crash_game(self, message: str, coalesce: bool = False, binary_message: Optional[bytes] = None):
+        """Трансляция сообщений для краш-игры: кадр только кладется в очередь каждого клиента
+
+        coalesce=True - тик, который отстающему клиенту можно заменить более свежим.
+        binary_message - тот же тик для клиентов бинарного подпротокола (иначе им уходит message).
+        """
+        self.fan_out(message, coalesce, binary_message)
+        bus = self.manager.bus
+        if bus is not None and not self.manager.is_relay:
+            bus.publish(fanout_bus.pack(fanout_bus.KIND_ROOM_FRAME, self.room_id, message,
+                                        binary_message or b"", coalesce))
+
+    def fan_out(self, message: str, coalesce: bool = False, binary_message: Optional[bytes] = None):
+        """Кадр в очереди клиентов этого процесса"""
+        started = time.perf_counter()
+        slow = []
+        for websocket, connection in self.connections.items():
+            frame = binary_message if connection.binary and binary_message is not None else message
+            accepted = connection.enqueue_tick(frame) if coalesce else connection.enqueue(frame)
+            if accepted:
+                self.manager.metrics.frames_enqueued += 1
+            else:
+                slow.append(websocket)
+        
+        for websocket in slow:
+            self.manager.drop_slow_consumer(websocket)
+        self.manager.metrics.last_broadcast_ms = (time.perf_counter() - started) * 1000
+
+    async def send_crash_update(self, data: dict):
+        """Отправляем обновление состояния краш-игры"""
+        message = {
+            "type": "crash_update",
+            "data": {
+                "game_id": data["game_id"],
+                "phase": data["phase"],
+                "multiplier": data["multiplier"],
+                "time_remaining": data.get("time_remaining", 0),
+                "speed": data.get("speed", 1.0),  # ← ДОБАВЛЯЕМ СКОРОСТЬ
+                "elapsed": data.get("elapsed", 0),
+                "rate": data.get("rate", 0)
+            }
+        }
+        
+        binary_message = None
+        # Бинарный тик нужен и клиентам других воркеров, если кадр уходит в шину
+        if self.binary_connections or self.manager.bus is not None:
+            multiplier = message["data"]["multiplier"]
+            binary_message = encode_tick(
+                data["game_id"], data["phase"], multiplier, message["data"]["elapsed"],
+                crash_curve.tier_at(multiplier), message["data"]["time_remaining"]
+            )
+        
+        is_transition = self._phase_changed(data["game_id"], data["phase"])
+        await self.broadcast_crash_game(self.manager.encode(message), coalesce=not is_transition, binary_message=binary_message)
+
+    async def send_flight_frame(self, frames, index: int):
+        """Кадр полета из заранее закодированной таблицы раунда (flight_frames.FlightFrames)"""
+        is_transition = self._phase_changed(frames.game_id, "flying")
+        binary_message = frames.binary_frame(index) if self.binary_connections or self.manager.bus is not None else None
+        await self.broadcast_crash_game(frames.frame(index), coalesce=not is_transition, binary_message=binary_message)
+
+    def _phase_changed(self, game_id: int, phase: str) -> bool:
+        """Первый кадр новой фазы (betting → flying) не склеиваем, остальные тики - можно"""
+        current = (game_id, phase)
+        changed = current != self.last_crash_phase
+        self.last_crash_phase = current
+        return changed
+
+    async def send_crash_result(self, data: dict):
+        """Отправляем результат краш-игры"""
+        message = {
+            "type": "crash_result", 
+            "data": {
+                "game_id": data["game_id"],
+                "final_multiplier": data["final_multiplier"],
+                "crashed_at": data["crashed_at"],
+                "timestamp": data["timestamp"],
+                "max_speed": data.get("max_speed", 1.0),  # ← ДОБАВЛЯЕМ МАКС. СКОРОСТЬ
+                "round_hash": data.get("round_hash")
+            }
+        }
+        
+        await self.broadcast_crash_game(self.manager.encode(message))
+
+    async def send_auto_cashouts(self, data: dict):
+        """Отправляем пакет сработавших за тик авто-выводов"""
+        message = {
+            "type": "auto_cashout",
+            "data": {
+                "game_id": data["game_id"],
+                "multiplier": data["multiplier"],
+                "cashouts": data["cashouts"]
+            }
+        }
+        
+        await self.broadcast_crash_game(self.manager.encode(message))
+
+    async def send_bet_update(self, bet_data: dict):
+        """Ставка попадает в ленту: рассылка bets_batch раз в BET_FEED_INTERVAL, а не на каждую ставку"""
+        if self.pending_count == 0 and self.crash_game is not None:
+            self.pending_game_id = self.crash_game.game_id
+        self.pending_count += 1
+        self.pending_stake += float(bet_data.get("amount") or 0)
+        # Сверх порога список не копим - он все равно не будет разослан
+        if self.pending_count <= BET_FEED_MAX_ITEMS:
+            self.pending_bets.append(bet_data)
+
+        if self.bet_feed_task is None or self.bet_feed_task.done():
+            self.bet_feed_task = asyncio.create_task(self._flush_bets_later())
+
+    async def _flush_bets_later(self):
+        await asyncio.sleep(BET_FEED_INTERVAL)
+        await self.flush_bets()
+
+    async def flush_bets(self):
+        """Одна рассылка на все ставки интервала; стоимость зависит от времени, а не от числа ставок"""
+        if not self.pending_count:
+            return
+        aggregated = self.pending_count > BET_FEED_MAX_ITEMS
+        bets = self.crash_game.bets if self.crash_game is not None else None
+        data = {
+            "game_id": self.pending_game_id,
+            "count": self.pending_count,
+            "stake": round(self.pending_stake, 2),
+            # Итоги раунда нарастающим итогом - из книги ставок, без пересчета
+            "players": len(bets) if bets is not None else None,
+            "total_bet": round(bets.total_bet, 2) if bets is not None else None,
+            "aggregated": aggregated
+        }
+        if not aggregated:
+            data["bets"] = self.pending_bets
+
+        metrics = self.manager.metrics
+        metrics.bet_batches += 1
+        metrics.bets_announced += self.pending_count
+        if aggregated:
+            metrics.bet_batches_aggregated += 1
+
+        self.pending_bets = []
+        self.pending_count = 0
+        self.pending_stake = 0.0
+        self.pending_game_id = None
+        await self.broadcast_crash_game(self.manager.encode({"type": "bets_batch", "data": data}))
+
+    async def send_exposure(self, data: dict):
+        """Экспозиция раунда комнаты в общий поток админов"""
+        data["room"] = self.room_id
+        await self.manager.send_exposure(data)
+
+
 class WebSocketManager:
     def __init__(self):
         self.active_connections: Dict[str, Set[WebSocket]] = {}
-        self.crash_game_connections: Set[WebSocket] = set()
+        # Комнаты краш-игры: у каждой свой набор подписчиков
+        self.rooms: Dict[str, CrashRoomChannel] = {}
+        self.connection_rooms: Dict[WebSocket, CrashRoomChannel] = {}
+        # Админы, следящие за экспозицией раунда
+        self.admin_connections: Dict[WebSocket, CrashConnection] = {}
         self.connection_timestamps: Dict[WebSocket, float] = {}
-        self.crash_game = None
+        self.metrics = BroadcastMetrics()
+        self.codec = make_codec()
+        # Шина между воркерами (fanout_bus); ретранслятор не ведет игру, а раздает кадры ведущего
+        self.bus = None
+        self.is_relay = False
+        self.request_ids = itertools.count(1)
+        self.pending_requests: Dict[int, asyncio.Future] = {}
+        # У процесса игры: "<воркер>:<request_id>" -> задача ставки ретранслятора (результат - Bet или None)
+        self.relayed_bets: Dict[str, asyncio.Future] = {}
+
+    def room(self, room_id: str = DEFAULT_ROOM) -> CrashRoomChannel:
+        """Канал комнаты (создается при первом обращении)"""
+        channel = self.rooms.get(room_id)
+        if channel is None:
+            channel = self.rooms[room_id] = CrashRoomChannel(room_id, self)
+        return channel
 
-    def set_crash_game(self, crash_game):
-        """Устанавливаем ссылку на crash game"""
-        self.crash_game = crash_game
+    @property
+    def crash_game_connections(self) -> Dict[WebSocket, CrashRoomChannel]:
+        """Все клиенты краш-игры во всех комнатах"""
+        return self.connection_rooms
+
+    @property
+    def crash_game(self):
+        return self.room().crash_game
+
+    def set_crash_game(self, crash_game, room_id: str = DEFAULT_ROOM):
+        """Устанавливаем ссылку на crash game комнаты"""
+        self.room(room_id).crash_game = crash_game
 
     async def connect(self, websocket: WebSocket, channel: str = "general"):
         await websocket.accept()
@@ -40,18 +404,39 @@ class WebSocketManager:
         
         logger.info(f"Client disconnected from channel '{channel}'")
 
+    def encode(self, message: dict) -> str:
+        """Единственный шаг кодирования: кадр строится один раз и переиспользуется для всех получателей"""
+        started = time.perf_counter()
+        frame = self.codec.encode(message)
+        self.metrics.record_encode(time.perf_counter() - started)
+        return frame
+
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         try:
-            await websocket.send_json(message)
+            await websocket.send_text(self.encode(message))
         except Exception as e:
             logger.error(f"Error sending personal message: {e}")
 
+    async def send_to_user(self, channel: str, message: dict):
+        """Сообщение всем подключениям пользователя (канал user_<id>)"""
+        await self.broadcast(message, channel)
+
     async def broadcast(self, message: dict, channel: str = "general"):
+        frame = None
+        if self.bus is not None:
+            # Подключения канала могут быть у любого воркера
+            frame = self.encode(message)
+            self.bus.publish(fanout_bus.pack(fanout_bus.KIND_CHANNEL_FRAME, channel, frame))
+        if channel in self.active_connections:
+            await self._broadcast_frame(frame or self.encode(message), channel)
+
+    async def _broadcast_frame(self, frame: str, channel: str):
         if channel in self.active_connections:
             disconnected = set()
-            for websocket in self.active_connections[channel]:
+            # Копия: отключение во время await меняет множество
+            for websocket in list(self.active_connections[channel]):
                 try:
-                    await websocket.send_json(message)
+                    await websocket.send_text(frame)
                 except Exception as e:
                     logger.error(f"Error broadcasting to client: {e}")
                     disconnected.add(websocket)
@@ -60,107 +445,278 @@ class WebSocketManager:
                 self.disconnect(websocket, channel)
 
     # Специальные методы для краш-игры
-    async def connect_crash_game(self, websocket: WebSocket):
-        await websocket.accept()
+    async def connect_crash_game(self, websocket: WebSocket, room_id: str = DEFAULT_ROOM, user_id: Optional[int] = None):
+        # Бинарные тики - только если клиент сам предложил подпротокол; иначе прежний JSON
+        binary = BINARY_SUBPROTOCOL in websocket.scope.get("subprotocols", [])
+        await websocket.accept(subprotocol=BINARY_SUBPROTOCOL if binary else None)
         await self.clean_dead_connections()
         
-        self.crash_game_connections.add(websocket)
+        channel = self.room(room_id)
+        connection = CrashConnection(websocket, self, binary=binary)
+        channel.connections[websocket] = connection
+        if binary:
+            channel.binary_connections += 1
+        self.connection_rooms[websocket] = channel
         self.connection_timestamps[websocket] = time.time()
         
-        logger.info(f"✅ Client connected to crash game. Total: {len(self.crash_game_connections)}")
+        # Опоздавший клиент сразу получает состояние раунда, не дожидаясь следующего тика
+        if self.is_relay:
+            asyncio.create_task(self._forward_snapshot(connection, room_id, user_id))
+        elif channel.crash_game is not None:
+            connection.enqueue(self.encode({
+                "type": "crash_snapshot",
+                "data": channel.crash_game.snapshot(user_id)
+            }))
+        
+        logger.info(f"✅ Client connected to crash room '{room_id}'. "
+                    f"Room: {len(channel.connections)}, total: {len(self.connection_rooms)}")
 
     def disconnect_crash_game(self, websocket: WebSocket):
-        if websocket in self.crash_game_connections:
-            self.crash_game_connections.discard(websocket)
+        channel = self.connection_rooms.pop(websocket, None)
+        connection = channel.connections.pop(websocket, None) if channel else None
+        if connection:
+            if connection.binary:
+                channel.binary_connections -= 1
+            connection.close()
         if websocket in self.connection_timestamps:
             del self.connection_timestamps[websocket]
         
         logger.info(f"🔌 Client disconnected from crash game. Total: {len(self.crash_game_connections)}")
 
-    async def broadcast_crash_game(self, message: str):
-        """Трансляция сообщений для краш-игры"""
-        disconnected = set()
-        for websocket in self.crash_game_connections:
-            try:
-                await websocket.send_text(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to crash game client: {e}")
-                disconnected.add(websocket)
-        
-        for websocket in disconnected:
-            self.disconnect_crash_game(websocket)
+    def drop_slow_consumer(self, websocket: WebSocket):
+        """Отключаем клиента, у которого переполнилась очередь отправки"""
+        logger.warning("🐢 Crash game client is too slow, dropping connection")
+        self.metrics.slow_consumers_dropped += 1
+        self.disconnect_crash_game(websocket)
+        asyncio.create_task(self._close_quietly(websocket))
 
-    async def send_crash_update(self, data: dict):
-        """Отправляем обновление состояния краш-игры"""
-        message = {
-            "type": "crash_update",
-            "data": {
-                "game_id": data["game_id"],
-                "phase": data["phase"],
-                "multiplier": data["multiplier"],
-                "time_remaining": data.get("time_remaining", 0),
-                "speed": data.get("speed", 1.0)  # ← ДОБАВЛЯЕМ СКОРОСТЬ
-            }
-        }
-        
-        await self.broadcast_crash_game(json.dumps(message))
+    async def _close_quietly(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
 
-    async def send_crash_result(self, data: dict):
-        """Отправляем результат краш-игры"""
-        message = {
-            "type": "crash_result", 
-            "data": {
-                "game_id": data["game_id"],
-                "final_multiplier": data["final_multiplier"],
-                "crashed_at": data["crashed_at"],
-                "timestamp": data["timestamp"],
-                "max_speed": data.get("max_speed", 1.0)  # ← ДОБАВЛЯЕМ МАКС. СКОРОСТЬ
+    async def connect_admin(self, websocket: WebSocket):
+        await websocket.accept()
+        self.admin_connections[websocket] = CrashConnection(websocket, self, on_error=self.disconnect_admin)
+        logger.info(f"✅ Admin connected to exposure stream. Total: {len(self.admin_connections)}")
+
+    def disconnect_admin(self, websocket: WebSocket):
+        connection = self.admin_connections.pop(websocket, None)
+        if connection:
+            connection.close()
+
+    async def send_exposure(self, data: dict):
+        """Экспозиция раунда для админов: тик с заменой, отстающий админ получит последний"""
+        if not self.admin_connections and self.bus is None:
+            return
+        frame = self.encode({"type": "exposure", "data": data})
+        if self.bus is not None:
+            self.bus.publish(fanout_bus.pack(fanout_bus.KIND_ADMIN_FRAME, "", frame, coalesce=True))
+        self._enqueue_exposure(frame)
+
+    def _enqueue_exposure(self, frame: str):
+        slow = [websocket for websocket, connection in self.admin_connections.items()
+                if not connection.enqueue_tick(frame)]
+        for websocket in slow:
+            self.disconnect_admin(websocket)
+            asyncio.create_task(self._close_quietly(websocket))
+
+    def get_metrics(self) -> dict:
+        """Метрики рассылки краш-игры"""
+        metrics = self.metrics.snapshot(
+            [connection for channel in self.rooms.values() for connection in channel.connections.values()]
+        )
+        metrics["rooms"] = {room_id: len(channel.connections) for room_id, channel in self.rooms.items()}
+        metrics["binary_connections"] = sum(channel.binary_connections for channel in self.rooms.values())
+        metrics["codec"] = self.codec.name
+        metrics["fanout"] = {
+            "bus": self.bus.name,
+            "worker_id": self.bus.worker_id,
+            "role": "relay" if self.is_relay else "leader",
+            "pending_requests": len(self.pending_requests),
+            **self.bus.stats.as_dict()
+        } if self.bus is not None else None
+        return metrics
+
+    # Шина между воркерами
+    async def attach_bus(self, bus, relay: bool):
+        """Подключаем шину: ведущий публикует в нее кадры, ретранслятор раздает их своим клиентам"""
+        self.bus = bus
+        self.is_relay = relay
+        await bus.start(self._on_bus_message)
+        print(f"📡 Шина рассылки '{bus.name}': воркер {bus.worker_id} - {'ретранслятор' if relay else 'процесс игры'}")
+
+    async def detach_bus(self):
+        if self.bus is not None:
+            await self.bus.close()
+            self.bus = None
+
+    def _on_bus_message(self, message: bytes):
+        kind, coalesce, address, text, binary = fanout_bus.unpack(message)
+        if kind == fanout_bus.KIND_ROOM_FRAME:
+            # Кадры игры раздает только ретранслятор: у ведущего они уже в очередях
+            if self.is_relay:
+                channel = self.rooms.get(address)
+                if channel is not None:
+                    channel.fan_out(text, coalesce, binary or None)
+        elif kind == fanout_bus.KIND_CHANNEL_FRAME:
+            if address in self.active_connections:
+                asyncio.create_task(self._broadcast_frame(text, address))
+        elif kind == fanout_bus.KIND_ADMIN_FRAME:
+            if self.is_relay:
+                self._enqueue_exposure(text)
+        elif kind == fanout_bus.KIND_COMMAND:
+            if not self.is_relay:
+                asyncio.create_task(self._run_command(address, json.loads(text)))
+        elif kind == fanout_bus.KIND_REPLY:
+            reply = json.loads(text)
+            future = self.pending_requests.get(reply.get("request_id"))
+            if future is not None and not future.done():
+                future.set_result(reply)
+
+    async def request(self, command: dict) -> Optional[dict]:
+        """Команда процессу игры и его ответ; None - ответа нет за BUS_REQUEST_TIMEOUT"""
+        request_id = next(self.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending_requests[request_id] = future
+        command["request_id"] = request_id
+        self.bus.publish(fanout_bus.pack(fanout_bus.KIND_COMMAND, self.bus.worker_id, self.encode(command)))
+        try:
+            return await asyncio.wait_for(future, BUS_REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"No reply from crash game process to '{command.get('type')}'")
+            return None
+        finally:
+            self.pending_requests.pop(request_id, None)
+
+    async def _run_command(self, worker_id: str, command: dict):
+        """Команда клиента другого воркера в игре этого процесса"""
+        reply = {"request_id": command.get("request_id")}
+        channel = self.rooms.get(command.get("room"))
+        try:
+            if channel is None or channel.crash_game is None:
+                reply["error"] = "Game not ready"
+            elif command.get("type") == "place_bet":
+                placing = asyncio.ensure_future(self._place_relayed_bet(
+                    channel, command["user_id"], command["amount"], command.get("auto_cashout")
+                ))
+                self.relayed_bets[f"{worker_id}:{command.get('request_id')}"] = placing
+                if len(self.relayed_bets) > BUS_RELAYED_BETS_KEPT:
+                    self.relayed_bets.pop(next(iter(self.relayed_bets)))
+                reply["success"] = await placing is not None
+            elif command.get("type") == "cancel_bet":
+                # Ретранслятор не дождался ответа на place_bet: снимаем ставку, если прием еще идет
+                placing = self.relayed_bets.pop(f"{worker_id}:{command.get('bet_request_id')}", None)
+                bet = await placing if placing is not None else None
+                # Снятую записанную ставку вернет расчет раунда - ретранслятор ее не возвращает
+                reply["cancelled"] = bet is not None and channel.crash_game.cancel_bet(bet)
+                reply["placed"] = bet is not None and not reply["cancelled"]
+            elif command.get("type") == "snapshot":
+                reply["snapshot"] = channel.crash_game.snapshot(command.get("user_id"))
+            else:
+                reply["error"] = f"Unknown command: {command.get('type')}"
+        except Exception as e:
+            reply["error"] = str(e)
+        self.bus.send(worker_id, fanout_bus.pack(fanout_bus.KIND_REPLY, "", self.encode(reply)))
+
+    async def _place_relayed_bet(self, channel: CrashRoomChannel, user_id: int, amount: float, auto_cashout):
+        """Ставка клиента ретранслятора; возвращаем ее объект в книге раунда, чтобы ее можно было отменить"""
+        if not await self.place_crash_bet(channel, user_id, amount, auto_cashout):
+            return None
+        return channel.crash_game.bets.get(user_id)
+
+    async def _forward_snapshot(self, connection: CrashConnection, room_id: str, user_id: Optional[int]):
+        reply = await self.request({"type": "snapshot", "room": room_id, "user_id": user_id})
+        if reply and reply.get("snapshot") is not None:
+            connection.enqueue(self.encode({"type": "crash_snapshot", "data": reply["snapshot"]}))
+
+    async def place_crash_bet(self, channel: CrashRoomChannel, user_id: int, amount: float, auto_cashout) -> Optional[bool]:
+        """Уже списанная ставка в игру комнаты; на ретрансляторе - через шину в процесс игры
+
+        None - ставку здесь не возвращаем: процесс игры не ответил (неизвестно, стоит ли
+        ставка в раунде) или снял уже записанную ставку (ее вернет расчет раунда).
+        """
+        if self.is_relay:
+            command = {
+                "type": "place_bet",
+                "room": channel.room_id,
+                "user_id": user_id,
+                "amount": amount,
+                "auto_cashout": auto_cashout
             }
-        }
-        
-        await self.broadcast_crash_game(json.dumps(message))
+            reply = await self.request(command)
+            if reply is not None:
+                return bool(reply.get("success"))
+            # Ставка могла встать в раунд уже после таймаута: отменяем ее или узнаем, что она осталась
+            outcome = await self.request({
+                "type": "cancel_bet",
+                "room": channel.room_id,
+                "bet_request_id": command["request_id"]
+            })
+            if outcome is None:
+                logger.warning(f"Bet of user {user_id} in room '{channel.room_id}' is in an unknown state")
+                return None
+            if outcome.get("placed"):
+                return True
+            return None if outcome.get("cancelled") else False
+
+        success = await channel.crash_game.place_bet(user_id, amount, auto_cashout, prepaid=True)
+        if success:
+            await channel.send_bet_update({
+                "user_id": user_id,
+                "amount": amount,
+                "timestamp": datetime.now().isoformat()
+            })
+        return success
 
-    async def send_bet_update(self, bet_data: dict):
-        """Отправляем обновление о новой ставке"""
-        message = {
-            "type": "new_bet",
-            "data": bet_data
-        }
-        
-        await self.broadcast_crash_game(json.dumps(message))
 
     async def handle_crash_bet(self, websocket: WebSocket, data: dict):
-        """Обработка ставок в краш-игре"""
+        """Ставка клиента краш-игры: игрок - из сессии, ставка списывается до подтверждения"""
         try:
             print(f"🎯 [WebSocket] Received bet data: {data}")
-            
-            user_id = data.get("user_id")
-            amount = data.get("amount")
-            auto_cashout = data.get("auto_cashout")
-            
             self.connection_timestamps[websocket] = time.time()
-            
-            if not all([user_id, amount]):
-                print("❌ [WebSocket] Missing required fields")
-                await self.send_personal_message({
-                    "type": "bet_placed",
-                    "status": "error",
-                    "message": "Missing required fields"
-                }, websocket)
+
+            # user_id из сообщения не принимаем: ставить можно только за себя
+            user_id = websocket.session.get("user_id")
+            telegram_id = websocket.session.get("telegram_id")
+            if not user_id or not telegram_id:
+                await self._bet_error(websocket, "Not authenticated")
                 return
-            
-            if not self.crash_game:
+
+            try:
+                amount = float(data.get("amount") or 0)
+            except (TypeError, ValueError):
+                amount = 0.0
+            if amount <= 0:
+                await self._bet_error(websocket, "Invalid bet amount")
+                return
+
+            channel = self.connection_rooms.get(websocket) or self.room()
+            if not channel.crash_game:
                 print("❌ [WebSocket] Crash game not initialized")
-                await self.send_personal_message({
-                    "type": "bet_placed",
-                    "status": "error", 
-                    "message": "Game not ready"
-                }, websocket)
+                await self._bet_error(websocket, "Game not ready")
                 return
-            
+            currency = channel.crash_game.currency
+
+            # Проверка средств и списание одним UPDATE: выигрыш раунда начисляется с учетом ставки
+            async with AsyncSessionLocal() as db:
+                debited = await async_crud.update_user_balance(db, telegram_id, currency, -amount, non_negative=True)
+            if not debited:
+                await self._bet_error(websocket, f"Insufficient {currency} balance")
+                return
+
             print(f"🎯 [WebSocket] Calling place_bet for user {user_id}, amount {amount}")
-            success = await self.crash_game.place_bet(int(user_id), float(amount), auto_cashout)
-            
+            success = False
+            try:
+                success = await self.place_crash_bet(channel, int(user_id), amount, data.get("auto_cashout"))
+            finally:
+                # Ставка не встала в раунд - возвращаем списанное; при None ставку
+                # рассчитает раунд (см. place_crash_bet)
+                if success is False:
+                    async with AsyncSessionLocal() as db:
+                        await async_crud.update_user_balance(db, telegram_id, currency, amount)
+
             if success:
                 print(f"✅ [WebSocket] Bet successfully processed for user {user_id}")
                 await self.send_personal_message({
@@ -168,27 +724,20 @@ class WebSocketManager:
                     "status": "success",
                     "amount": amount
                 }, websocket)
-                
-                await self.send_bet_update({
-                    "user_id": user_id,
-                    "amount": amount,
-                    "timestamp": datetime.now().isoformat()
-                })
             else:
                 print(f"❌ [WebSocket] Failed to process bet for user {user_id}")
-                await self.send_personal_message({
-                    "type": "bet_placed", 
-                    "status": "error",
-                    "message": "Failed to place bet"
-                }, websocket)
-                
+                await self._bet_error(websocket, "Failed to place bet" if success is False else "Bet not confirmed")
+
         except Exception as e:
             print(f"❌ [WebSocket] Error handling bet: {e}")
-            await self.send_personal_message({
-                "type": "bet_placed",
-                "status": "error", 
-                "message": str(e)
-            }, websocket)
+            await self._bet_error(websocket, str(e))
+
+    async def _bet_error(self, websocket: WebSocket, message: str):
+        await self.send_personal_message({
+            "type": "bet_placed",
+            "status": "error",
+            "message": message
+        }, websocket)
 
     async def clean_dead_connections(self):
         """Очищаем неактивные соединения"""
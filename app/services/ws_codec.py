@@ -0,0 +1,49 @@
+"""
+Кодеки JSON для рассылок WebSocketManager.
+
+Каждое сообщение кодируется один раз в неизменяемую строку-кадр, которая
+уходит всем получателям. Кодек выбирается переменной WS_JSON_CODEC:
+  - json   - стандартная библиотека (по умолчанию, вывод как у send_json);
+  - orjson - быстрее в несколько раз, если пакет orjson установлен.
+"""
+import json
+import os
+from typing import Callable, Dict
+
+WS_JSON_CODEC = os.getenv("WS_JSON_CODEC", "json")
+
+
+class JsonCodec:
+    name = "json"
+
+    def encode(self, message) -> str:
+        return json.dumps(message)
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self.dumps = orjson.dumps
+
+    def encode(self, message) -> str:
+        # Текстовый кадр WebSocket - str; orjson отдает UTF-8 bytes
+        return self.dumps(message).decode()
+
+
+CODECS: Dict[str, Callable] = {
+    "json": JsonCodec,
+    "orjson": OrjsonCodec,
+}
+
+
+def make_codec(name: str = WS_JSON_CODEC):
+    """Кодек по имени; если его зависимость не установлена - стандартный json"""
+    if name not in CODECS:
+        raise ValueError(f"Unknown WebSocket codec: {name}")
+    try:
+        return CODECS[name]()
+    except ImportError:
+        print(f"⚠️ Кодек WebSocket '{name}' недоступен (пакет не установлен), используем json")
+        return JsonCodec()